@@ -30,6 +30,7 @@ from typing import (
     Optional,
     List,
     Dict,
+    Set,
     Any,
     Tuple,
     Union,
@@ -38,12 +39,14 @@ from typing import (
 )
 
 import json
+import time
 import uuid
-from datetime import datetime
+import hashlib
+from datetime import date, datetime
 from collections import defaultdict
 
 from sqlalchemy.orm.query import Query as SqlQuery
-from sqlalchemy.sql.expression import func
+from sqlalchemy.sql.expression import func, exists, and_, or_
 
 from tokenizer.version import __version__ as tokenizer_version
 from tokenizer import correct_spaces
@@ -55,10 +58,18 @@ from reynir.incparser import IncrementalParser
 from reynir.simpletree import SimpleTree
 
 from db import Session, SessionContext, DataError, desc
-from db.models import Article as ArticleRow, Word, Root
+from db.models import (
+    Article as ArticleRow,
+    ArticleText,
+    Word,
+    WordFrequency,
+    Root,
+    TreeLabel,
+)
 
 from fetcher import Fetcher
 from tree import Tree
+from treeindex import ANY_SENTENCE, pattern_labels, delete_labels
 from treeutil import TreeUtility, WordTuple, PgsList
 from settings import Settings, NoIndexWords
 
@@ -67,6 +78,9 @@ if TYPE_CHECKING:
     from queries.builtin import RegisterType
 
 
+# Daily word counts, keyed by (stem, cat, day)
+WordCountDict = Dict[Tuple[str, str, date], int]
+
 # We don't bother parsing sentences that have more than 90 tokens,
 # since they may require lots of memory (>16 GB) and take
 # minutes to parse
@@ -141,6 +155,11 @@ class Article:
         # (which are lists of TokenDicts)
         self._raw_tokens: Optional[List[List[List[TokenDict]]]] = None
         self._text: Optional[str] = None  # The article text
+        # Newly extracted text, to be stored in the text cache:
+        # (version, HTML digest, text, extraction time)
+        self._extracted: Optional[Tuple[str, str, Optional[str], float]] = None
+        # Extraction time saved by the text cache in the last parse
+        self._text_time_saved: Optional[float] = None
         # The individual word stems, in a dictionary
         self._words: Optional[Dict[WordTuple, int]] = None
 
@@ -316,12 +335,32 @@ class Article:
             add_entity_to_register(name, register, session, all_names=all_names)
         return register
 
-    def _store_words(self, session: Session) -> None:
-        """Store word stems"""
+    @staticmethod
+    def _stored_word_counts(session: Session, condition: Any) -> WordCountDict:
+        """Return the daily word counts contributed by the words currently
+        stored for the article(s) matching the given condition"""
+        counts: WordCountDict = defaultdict(int)
+        q = (
+            session.query(Word.stem, Word.cat, Word.cnt, ArticleRow.timestamp)
+            .join(ArticleRow, ArticleRow.id == Word.article_id)
+            .filter(condition)
+        )
+        for stem, cat, cnt, timestamp in q:
+            if timestamp is not None:
+                counts[(stem, cat, timestamp.date())] += cnt
+        return counts
+
+    def _store_words(self, session: Session, previous: WordCountDict) -> None:
+        """Store word stems, and update the daily word frequencies
+        by the difference from the previously stored words"""
         assert session is not None
         # Delete previously stored words for this article
         w = cast(Any, Word).table()
         session.execute(w.delete().where(Word.article_id == self._uuid))
+        counts: WordCountDict = defaultdict(int)
+        for key, cnt in previous.items():
+            counts[key] -= cnt
+        day = self._timestamp.date() if self._timestamp is not None else None
         # Index the words by storing them in the words table
         if self._words:
             for word, cnt in self._words.items():
@@ -337,6 +376,54 @@ class Article:
                 # Interesting word: let's index it
                 w = Word(article_id=self._uuid, stem=word.stem, cat=word.cat, cnt=cnt)
                 session.add(w)
+                if day is not None:
+                    counts[(word.stem, word.cat, day)] += cnt
+        # Apply the changes, if any, to the daily word frequencies
+        WordFrequency.add(session, {k: v for k, v in counts.items() if v})
+
+    def _article_text(self, session: Session) -> Optional[str]:
+        """Return the text content of the article's HTML, as extracted
+        by Fetcher.html_to_text(). The text is cached in the articletext
+        table, so that reparsing the article doesn't require its HTML to
+        be parsed again, as long as neither the HTML nor the way in
+        which it is extracted have changed."""
+        assert self._url and self._html
+        helper = Fetcher.helper_for(session, self._url)
+        version = Fetcher.text_version(helper)
+        html_md5 = hashlib.md5(self._html.encode("utf-8")).hexdigest()
+        self._extracted = None
+        self._text_time_saved = None
+        if self._uuid is not None:
+            t0 = time.perf_counter()
+            cached = session.get(ArticleText, self._uuid)
+            if (
+                cached is not None
+                and cached.version == version
+                and cached.html_md5 == html_md5
+            ):
+                self._text_time_saved = cached.extract_time - (time.perf_counter() - t0)
+                return cached.text
+        t0 = time.perf_counter()
+        text = Fetcher.html_to_text(self._html, helper)
+        self._extracted = (version, html_md5, text, time.perf_counter() - t0)
+        return text
+
+    def _store_text(self, session: Session) -> None:
+        """Store newly extracted text in the text cache"""
+        if self._extracted is None:
+            return
+        version, html_md5, text, extract_time = self._extracted
+        session.merge(
+            ArticleText(
+                article_id=self._uuid,
+                version=version,
+                html_md5=html_md5,
+                text=text,
+                extract_time=extract_time,
+                timestamp=datetime.utcnow(),
+            )
+        )
+        self._extracted = None
 
     def _parse(
         self, enclosing_session: Optional[Session] = None, verbose: bool = False
@@ -344,16 +431,16 @@ class Article:
         """Parse the article content to yield parse trees and annotated token list"""
         with SessionContext(enclosing_session) as session:
 
-            # Convert the content soup to a token iterable (generator)
+            # Convert the article text to a token list
             toklist: Union[List[Tok], Iterator[Tok], None]
             if not self._url or not self._html:
                 toklist = []
             else:
-                toklist = Fetcher.tokenize_html(self._url, self._html, session)
-                if toklist is None:
+                text = self._article_text(session)
+                if text is None:
                     toklist = []
                 else:
-                    toklist = list(toklist)
+                    toklist = list(Fetcher.text_to_tokens(text, session))
 
             bp = self.get_parser()
             ip = IncrementalParser(bp, toklist, verbose=verbose)
@@ -468,15 +555,22 @@ class Article:
                     tree=self._tree,
                     tokens=self._tokens,
                 )
+                # Words of any existing rows with the same URL are deleted
+                # along with them, and subtracted from the word frequencies
+                previous = self._stored_word_counts(
+                    session, ArticleRow.url == self._url
+                )
                 # Delete any existing rows with the same URL
                 ar_table = cast(Any, ArticleRow).table()
                 session.execute(ar_table.delete().where(ArticleRow.url == self._url))
                 # Add the new row with a fresh UUID
                 session.add(ar)
                 # Store the word stems occurring in the article
-                self._store_words(session)
+                self._store_words(session, previous)
                 # Offload the new data from Python to PostgreSQL
                 session.flush()
+                # Cache the article text, if newly extracted
+                self._store_text(session)
                 return True
 
             # Update an already existing row by UUID
@@ -488,6 +582,8 @@ class Article:
             if ar is None:
                 # UUID not found: something is wrong here...
                 return False
+            # Note the words as stored before any changes are made
+            previous = self._stored_word_counts(session, ArticleRow.id == self._uuid)
 
             # Update the columns
             # UUID is immutable
@@ -510,14 +606,20 @@ class Article:
             ar.num_parsed = self._num_parsed
             ar.ambiguity = self._ambiguity
             ar.html = self._html
+            if ar.tree != self._tree:
+                # The sentence trees have changed: drop the tree label index
+                # for the article, which is rebuilt when it is next processed
+                delete_labels(session, self._uuid)
             ar.tree = self._tree
             ar.tokens = self._tokens
             # If the article has been parsed, update the index of word stems
             # (This may cause all stems for the article to be deleted, if
             # there are no successfully parsed sentences in the article)
-            self._store_words(session)
+            self._store_words(session, previous)
             # Offload the new data from Python to PostgreSQL
             session.flush()
+            # Cache the article text, if newly extracted
+            self._store_text(session)
 
         return True
 
@@ -583,6 +685,12 @@ class Article:
     def num_sentences(self) -> int:
         return self._num_sentences
 
+    @property
+    def text_time_saved(self) -> Optional[float]:
+        """Time, in seconds, saved in the last parse by using the
+        cached text of the article, or None if the text was extracted"""
+        return self._text_time_saved
+
     @property
     def num_parsed(self) -> int:
         return self._num_parsed
@@ -707,62 +815,121 @@ class Article:
                         if limit is not None and count >= limit:
                             return
 
+    @staticmethod
+    def _articles_query(
+        session: Session, criteria: Mapping[str, Any]
+    ) -> "SqlQuery[ArticleRow]":
+        """Return a query for the parsed articles that meet the given criteria"""
+        # The criteria are currently "timestamp", "author" and "domain",
+        # as well as "order_by_parse" which if True indicates that the result
+        # should be ordered with the most recently parsed articles first.
+
+        # Only fetch articles that have a parse tree
+        q: SqlQuery[ArticleRow] = session.query(ArticleRow).filter(
+            ArticleRow.tree != None
+        )
+
+        # timestamp is assumed to contain a tuple: (from, to)
+        if criteria and "timestamp" in criteria:
+            ts = criteria["timestamp"]
+            q = q.filter(ArticleRow.timestamp >= ts[0]).filter(
+                ArticleRow.timestamp < ts[1]
+            )
+
+        if criteria and "author" in criteria:
+            author = criteria["author"]
+            q = q.filter(ArticleRow.author == author)
+
+        if criteria and ("visible" in criteria or "domain" in criteria):
+            # Need a join with Root for these criteria
+            q = q.join(Root)
+            if "visible" in criteria:
+                # Return only articles from roots with the specified visibility
+                visible = criteria["visible"]
+                assert isinstance(visible, bool)
+                q = q.filter(Root.visible == visible)
+            if "domain" in criteria:
+                # Return only articles from the specified domain
+                domain = criteria["domain"]
+                assert isinstance(domain, str)
+                q = q.filter(Root.domain == domain)
+
+        if criteria and criteria.get("order_by_parse"):
+            # Order with newest parses first
+            q = q.order_by(desc(ArticleRow.parsed))
+        elif criteria and criteria.get("random"):
+            q = q.order_by(func.random())
+
+        parsed_after = criteria.get("parse_date_gt")
+        if parsed_after is not None:
+            q = q.filter(cast(datetime, ArticleRow.parsed) >= parsed_after)
+
+        # id_range is assumed to contain a tuple: (from, to), where
+        # to may be None; this allows partitioning of the article set
+        id_range = criteria.get("id_range")
+        if id_range is not None:
+            q = q.filter(ArticleRow.id >= id_range[0])
+            if id_range[1] is not None:
+                q = q.filter(ArticleRow.id < id_range[1])
+
+        return q
+
     @classmethod
     def articles(
         cls, criteria: Mapping[str, Any], enclosing_session: Optional[Session] = None
     ) -> Iterator["Article"]:
         """Generator of Article objects from the database that
         meet the given criteria"""
-        # The criteria are currently "timestamp", "author" and "domain",
-        # as well as "order_by_parse" which if True indicates that the result
-        # should be ordered with the most recently parsed articles first.
         with SessionContext(
             commit=True, read_only=True, session=enclosing_session
         ) as session:
-
-            # Only fetch articles that have a parse tree
-            q: SqlQuery[ArticleRow] = session.query(ArticleRow).filter(
-                ArticleRow.tree != None
-            )
-
-            # timestamp is assumed to contain a tuple: (from, to)
-            if criteria and "timestamp" in criteria:
-                ts = criteria["timestamp"]
-                q = q.filter(ArticleRow.timestamp >= ts[0]).filter(
-                    ArticleRow.timestamp < ts[1]
-                )
-
-            if criteria and "author" in criteria:
-                author = criteria["author"]
-                q = q.filter(ArticleRow.author == author)
-
-            if criteria and ("visible" in criteria or "domain" in criteria):
-                # Need a join with Root for these criteria
-                q = q.join(Root)
-                if "visible" in criteria:
-                    # Return only articles from roots with the specified visibility
-                    visible = criteria["visible"]
-                    assert isinstance(visible, bool)
-                    q = q.filter(Root.visible == visible)
-                if "domain" in criteria:
-                    # Return only articles from the specified domain
-                    domain = criteria["domain"]
-                    assert isinstance(domain, str)
-                    q = q.filter(Root.domain == domain)
-
-            if criteria and criteria.get("order_by_parse"):
-                # Order with newest parses first
-                q = q.order_by(desc(ArticleRow.parsed))
-            elif criteria and criteria.get("random"):
-                q = q.order_by(func.random())
-
-            parsed_after = criteria.get("parse_date_gt")
-            if parsed_after is not None:
-                q = q.filter(cast(datetime, ArticleRow.parsed) >= parsed_after)
-
+            q = cls._articles_query(session, criteria)
             for arow in q.yield_per(500):
                 yield cls._init_from_row(arow)
 
+    @classmethod
+    def _candidate_sentences(
+        cls, session: Session, criteria: Mapping[str, Any], labels: Set[str]
+    ) -> Tuple["SqlQuery[ArticleRow]", Dict[str, Set[int]]]:
+        """Use the tree label index to find the articles meeting the criteria
+        that may contain matches for a pattern requiring the given labels.
+        Returns a query for those articles, as well as a dictionary of the
+        candidate sentence indices of each indexed article. Articles that
+        haven't been indexed are included in the query but not in the
+        dictionary, and need to be scanned in full."""
+        q = cls._articles_query(session, criteria)
+        # Articles meeting the criteria that have all the required labels
+        candidates = (
+            session.query(TreeLabel.article_id)
+            .filter(TreeLabel.label.in_(labels))
+            .filter(
+                TreeLabel.article_id.in_(
+                    q.with_entities(ArticleRow.id).order_by(None).scalar_subquery()
+                )
+            )
+            .group_by(TreeLabel.article_id)
+            .having(func.count() == len(labels))
+            .scalar_subquery()
+        )
+        # Intersect the sentence postings of the labels, per article
+        sentences: Dict[str, Set[int]] = dict()
+        postings = session.query(TreeLabel.article_id, TreeLabel.sentences).filter(
+            TreeLabel.label.in_(labels), TreeLabel.article_id.in_(candidates)
+        )
+        for article_id, ixs in postings.yield_per(2000):
+            if article_id in sentences:
+                sentences[article_id].intersection_update(ixs)
+            else:
+                sentences[article_id] = set(ixs)
+        indexed = exists().where(
+            and_(
+                TreeLabel.article_id == ArticleRow.id,
+                TreeLabel.label == ANY_SENTENCE,
+            )
+        )
+        q = q.filter(or_(ArticleRow.id.in_(candidates), ~indexed))
+        return q, sentences
+
     @classmethod
     def all_matches(
         cls,
@@ -771,26 +938,36 @@ class Article:
         enclosing_session: Optional[Session] = None,
     ) -> Iterator[Tuple["Article", int, SimpleTree]]:
         """Generator of SimpleTree objects (see matcher.py) from
-        articles matching the given criteria and the pattern"""
+        articles matching the given criteria and the pattern.
+        The tree label index (see treeindex.py) is used to limit
+        the search to candidate sentences, if the pattern allows."""
 
         with SessionContext(
             commit=True, read_only=True, session=enclosing_session
         ) as session:
 
-            # t0 = time.time()
-            mcnt = acnt = tcnt = 0
-            # print("Starting article loop")
-            for a in cls.articles(criteria, enclosing_session=session):
+            # Candidate sentences of indexed articles, or None
+            # if the index can't be used for this pattern
+            sentences: Optional[Dict[str, Set[int]]] = None
+            labels = pattern_labels(pattern)
+            if labels:
+                q, sentences = cls._candidate_sentences(session, criteria, labels)
+            else:
+                q = cls._articles_query(session, criteria)
+
+            def indices(a: "Article") -> Optional[Set[int]]:
+                """Return the candidate sentence indices of an article,
+                or None if all its sentences need to be examined"""
+                if sentences is None or a.uuid is None:
+                    return None
+                return sentences.get(a.uuid)
+
+            for arow in q.yield_per(500):
+                a = cls._init_from_row(arow)
                 if a.tree is None:
                     continue
-                acnt += 1
                 tree = Tree(url=a.url or "", authority=a.authority)
                 tree.load(a.tree)
-                for ix, simple_tree in tree.simple_trees():
-                    tcnt += 1
+                for ix, simple_tree in tree.simple_trees(indices=indices(a)):
                     for match in simple_tree.all_matches(pattern):
                         yield (a, ix, match)
-                        mcnt += 1
-            # t1 = time.time()
-            # print("{0} articles with {1} trees examined, {2} matches in {3:.2f} seconds"
-            #     .format(acnt, tcnt, mcnt, t1-t0))
@@ -1,5 +1,13 @@
 # Gunicorn configuration file for greynir.is
 
+# With preload_app (see below), the application is imported in the master
+# process, before the eventlet workers are forked. Monkey-patch the
+# standard library first, so that the sockets, locks and threads created
+# on import (by requests, ssl, threading etc.) are green ones.
+import eventlet
+
+eventlet.monkey_patch()
+
 DIR = "/usr/share/nginx/greynir.is/"
 
 bind = "unix:" + DIR + "gunicorn.sock"
@@ -15,13 +23,42 @@ with open(DIR + "gunicorn_user.txt") as f:
 
 pidfile = DIR + "gunicorn.pid"
 
-# Remove the Greynir.grammar.bin file to ensure that
-# the grammar will be reparsed and a fresh copy generated
+# The query grammar binary is keyed by a hash of the grammar text
+# (see queries/__init__.py), so a stale copy is never loaded and
+# it need not be removed before the workers start
+
+# Load the application, including the parser, BÍN and the query modules
+# (see warmup.py), in the master process before forking the workers,
+# so that the workers share the loaded data copy-on-write
+preload_app = True
+
+
+def when_ready(server):
+    """Log the memory usage of the master process after warm-up"""
+    from warmup import memory_usage
+
+    server.log.info("Master memory usage (kB): %s", memory_usage())
+
+
+def post_fork(server, worker):
+    """Log the memory usage of each worker right after it is forked;
+    compare with the usage reported by /ready.api after some requests"""
+    from warmup import memory_usage
+
+    server.log.info("Worker %s memory usage (kB): %s", worker.pid, memory_usage())
+
+
+def post_worker_init(worker):
+    """Start looking up images for the most mentioned persons in the
+    background (see images.py); the thread is started after the worker
+    has initialized, so that it uses the worker's (green) threads"""
+    from routes.people import image_prefetcher
+
+    image_prefetcher.start()
+
 
-import os
+def worker_exit(server, worker):
+    """Write any buffered query log entries before the worker exits"""
+    from querylog import query_log
 
-try:
-    os.remove(DIR + "Greynir.grammar.bin")
-except OSError:
-    # File probably didn't exist
-    pass
+    query_log.close()
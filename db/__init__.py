@@ -23,12 +23,19 @@
 
 """
 
-from typing import Any, Callable, Generic, Optional, Type, TypeVar, cast
+from typing import Any, Callable, Dict, Generic, Optional, Type, TypeVar, cast
 from typing_extensions import Literal
 
+import os
+import re
+import time
+import weakref
+
 from sqlalchemy import create_engine, desc, func as dbfunc
 from sqlalchemy.orm import sessionmaker, Session
+from sqlalchemy.engine import Connection
 from sqlalchemy.engine.cursor import CursorResult
+from sqlalchemy.pool import QueuePool
 
 from sqlalchemy.exc import SQLAlchemyError as DatabaseError
 from sqlalchemy.exc import IntegrityError
@@ -52,12 +59,66 @@ __all__ = (
     "Settings",
     "GreynirDB",
     "SessionContext",
+    "PreparedStatement",
 )
 
 
+# Connection pool settings for each process role. The web server runs
+# many concurrent requests per worker process (greenlets), while each
+# scraper and processor worker process handles one article at a time.
+# Connections are checked with a ping before use, since a pooled
+# connection may have been closed by the server in the meantime.
+_POOL_CONFIG: Dict[Optional[str], Dict[str, Any]] = {
+    None: dict(pool_size=5, max_overflow=10, pool_timeout=30),
+    "web": dict(pool_size=10, max_overflow=10, pool_timeout=10, pool_recycle=3600),
+    "scraper": dict(pool_size=2, max_overflow=2, pool_timeout=60),
+    "processor": dict(pool_size=2, max_overflow=2, pool_timeout=60),
+}
+
+
+class _MeteredQueuePool(QueuePool):
+    """A connection pool that keeps count of checkouts and
+    of the time spent waiting for a connection"""
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.checkouts = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def connect(self) -> Any:
+        t0 = time.perf_counter()
+        try:
+            return super().connect()
+        finally:
+            wait = time.perf_counter() - t0
+            self.checkouts += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+
+def _dispose_after_fork(ref: "weakref.ReferenceType[GreynirDB]") -> None:
+    """Called in a child process after a fork: start a fresh connection
+    pool, leaving the connections inherited from the parent alone"""
+    db = ref()
+    if db is not None:
+        db.dispose(close=False)
+
+
 class GreynirDB:
     """Wrapper around the SQLAlchemy connection, engine and session"""
 
+    # The role of this process ("web", "scraper", "processor" or None),
+    # which determines the connection pool settings
+    role: Optional[str] = None
+
+    @classmethod
+    def configure(cls, role: Optional[str]) -> None:
+        """Set the role of this process. Only affects
+        GreynirDB instances that are created afterwards."""
+        assert role in _POOL_CONFIG
+        cls.role = role
+
     def __init__(self) -> None:
         """Initialize SQLAlchemy connection to the scraper database"""
 
@@ -72,10 +133,46 @@ class GreynirDB:
         )
 
         # Create engine and bind session
-        self._engine = create_engine(conn_str)
+        self._engine = create_engine(
+            conn_str,
+            poolclass=_MeteredQueuePool,
+            pool_pre_ping=True,
+            **_POOL_CONFIG[GreynirDB.role],
+        )
         self._Session: Type[Session] = cast(
             Type[Session], sessionmaker(bind=self._engine)
         )
+        self._pid = os.getpid()
+        # Pooled connections must not be shared between processes:
+        # worker processes forked by Gunicorn or multiprocessing.Pool
+        # get a pool of their own
+        if hasattr(os, "register_at_fork"):
+            os.register_at_fork(
+                after_in_child=lambda ref=weakref.ref(self): _dispose_after_fork(ref)
+            )
+
+    def dispose(self, close: bool = True) -> None:
+        """Replace the connection pool with a new one. If close is False,
+        the connections of the old pool are left untouched, as is
+        appropriate in a forked child process."""
+        self._engine.dispose(close=close)
+        self._pid = os.getpid()
+
+    def pool_status(self) -> Dict[str, Any]:
+        """Return the connection pool settings and usage of this process"""
+        pool = cast(_MeteredQueuePool, self._engine.pool)
+        return dict(
+            role=GreynirDB.role,
+            pid=self._pid,
+            size=pool.size(),
+            checked_in=pool.checkedin(),
+            checked_out=pool.checkedout(),
+            overflow=pool.overflow(),
+            checkouts=pool.checkouts,
+            wait_total=round(pool.wait_total, 3),
+            wait_avg=round(pool.wait_total / max(1, pool.checkouts), 6),
+            wait_max=round(pool.wait_max, 6),
+        )
 
     def create_tables(self) -> None:
         """Create all missing tables in the database"""
@@ -87,6 +184,12 @@ class GreynirDB:
         """Execute raw SQL directly on the engine"""
         return self._engine.execute(sql, **kwargs)  # type: ignore
 
+    def autocommit_connection(self) -> Connection:
+        """Return a pooled connection on which each statement is committed
+        as it is executed, so that the connection is never left idle in a
+        transaction (e.g. while it holds a session-level advisory lock)"""
+        return self._engine.execution_options(isolation_level="AUTOCOMMIT").connect()
+
     @property
     def session(self) -> Session:
         """Returns a freshly created Session instance from the sessionmaker"""
@@ -169,3 +272,32 @@ class SessionContext:
             self._session.close()
         # Return False to re-throw exception from the context, if any
         return False
+
+
+class PreparedStatement:
+    """A server-side prepared statement for a frequently executed query,
+    so that PostgreSQL parses and plans it once per database connection
+    instead of once per execution. The statement text refers to its
+    parameters as $1, $2, etc., and may not contain a literal percent
+    sign (pass LIKE patterns as parameters instead). The statement is
+    prepared on first use on each pooled connection, which remembers
+    its prepared statements for as long as it stays open."""
+
+    def __init__(self, name: str, sql: str) -> None:
+        self._name = name
+        self._sql = sql
+        self._nparams = max((int(n) for n in re.findall(r"\$(\d+)", sql)), default=0)
+
+    def execute(self, session: Session, *args: Any) -> CursorResult:
+        """Execute the statement with the given parameters
+        on the session's connection"""
+        assert len(args) == self._nparams
+        conn = session.connection()
+        prepared = conn.info.setdefault("prepared_statements", set())
+        if self._name not in prepared:
+            conn.exec_driver_sql(f"prepare {self._name} as {self._sql}")
+            prepared.add(self._name)
+        if not args:
+            return conn.exec_driver_sql(f"execute {self._name}")
+        placeholders = ", ".join(["%s"] * len(args))
+        return conn.exec_driver_sql(f"execute {self._name}({placeholders})", args)
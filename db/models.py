@@ -26,9 +26,9 @@
 from __future__ import annotations
 
 from db import Session
-from typing import Any, Optional, cast
+from typing import Any, Dict, Iterable, List, Optional, Tuple, cast
 
-from datetime import datetime
+from datetime import date, datetime
 from sqlalchemy import text
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import relationship, backref, Session
@@ -38,6 +38,7 @@ from sqlalchemy import (
     String,
     Float,
     DateTime,
+    Date,
     Sequence,
     Boolean,
     UniqueConstraint,
@@ -46,7 +47,7 @@ from sqlalchemy import (
     PrimaryKeyConstraint,
     func,
 )
-from sqlalchemy.dialects.postgresql import JSONB, INET
+from sqlalchemy.dialects.postgresql import JSONB, INET, ARRAY
 from sqlalchemy.dialects.postgresql import UUID as psql_UUID
 from sqlalchemy.ext.hybrid import Comparator, hybrid_property
 from sqlalchemy.orm.relationships import RelationshipProperty
@@ -227,6 +228,28 @@ class Article(Base):
         backref=backref("articles", order_by=url),
     )
 
+    # Insert the URLs that are not already present, to be scraped later
+    _Q_ADD_URLS = """
+        insert into articles (url, root_id)
+            select unnest(cast(:urls as varchar[])), :root_id
+            on conflict (url) do nothing;
+        """
+
+    @staticmethod
+    def add_urls(session: Session, root_id: Optional[int], urls: Iterable[str]) -> int:
+        """Add article URLs, belonging to the given root, that are not
+        already in the table, using a single statement. Returns the
+        number of URLs added."""
+        # Insert the URLs in a consistent order to avoid deadlocks
+        # between concurrent transactions (e.g. parallel scrapers)
+        url_list = sorted(set(urls))
+        if not url_list:
+            return 0
+        result = cast(Any, session).execute(
+            Article._Q_ADD_URLS, dict(urls=url_list, root_id=root_id)
+        )
+        return result.rowcount
+
     def __repr__(self):
         return "Article(url='{0}', heading='{1}', scraped={2})".format(
             self.url, self.heading, self.scraped
@@ -266,6 +289,32 @@ class Summary(Base):
     )
 
 
+class ArticleText(Base):
+    """Represents the text of an article as extracted from its HTML,
+    cached so that reparsing the article doesn't require the HTML
+    to be parsed and walked again (see Article._article_text())"""
+
+    __tablename__ = "articletext"
+
+    # The article UUID is the primary key
+    article_id = Column(
+        psql_UUID(as_uuid=False),
+        ForeignKey("articles.id", onupdate="CASCADE", ondelete="CASCADE"),
+        primary_key=True,
+    )
+    # Version of the text extraction, HTML parser and scrape helper
+    # (see Fetcher.text_version())
+    version = StringColumnRequired(160)
+    # MD5 digest of the HTML that the text was extracted from
+    html_md5 = StringColumnRequired(32)
+    # The extracted text, or None if the HTML had no content
+    text = StringColumn()
+    # Time taken to extract the text, in seconds
+    extract_time = FloatColumnRequired()
+    # Time of the extraction
+    timestamp = DateTimeColumn()
+
+
 class Person(Base):
     """Represents a person"""
 
@@ -473,6 +522,88 @@ class Word(Base):
         )
 
 
+class WordFrequency(Base):
+    """Represents the total number of occurrences of a word in the
+    articles of a given day, i.e. a daily rollup of the words table.
+    The counts are updated incrementally whenever the words of an
+    article are stored (see Article._store_words())."""
+
+    __tablename__ = "wordfreq"
+
+    # The word stem
+    stem = StringColumnRequired(Word.MAX_WORD_LEN)
+
+    # The word category
+    cat = StringColumnRequired(16)
+
+    # Day of the article timestamps
+    day = cast(date, Column(Date, nullable=False))
+
+    # Count of occurrences
+    cnt = IntegerColumnRequired(default=0)
+
+    # Add to the count, inserting a new row if required
+    _Q = """
+        insert into wordfreq as wf (stem, cat, day, cnt)
+            values (:stem, :cat, :day, :cnt)
+            on conflict (stem, cat, day)
+            do update set cnt = wf.cnt + excluded.cnt;
+        """
+
+    __table_args__ = (PrimaryKeyConstraint("stem", "cat", "day", name="wordfreq_pkey"),)
+
+    @staticmethod
+    def add(session: Session, counts: Dict[Tuple[str, str, date], int]) -> None:
+        """Add the given (possibly negative) counts, keyed by
+        (stem, cat, day), to the daily word frequencies"""
+        if not counts:
+            return
+        # Update the rows in a consistent order to avoid deadlocks
+        # between concurrent transactions (e.g. parallel scrapers)
+        rows = [
+            dict(stem=stem, cat=cat, day=day, cnt=cnt)
+            for (stem, cat, day), cnt in sorted(counts.items())
+        ]
+        cast(Any, session).execute(WordFrequency._Q, rows)
+
+    def __repr__(self):
+        return "WordFrequency(stem='{0}', cat='{1}', day='{2}', cnt={3})".format(
+            self.stem, self.cat, self.day, self.cnt
+        )
+
+
+class PersonPair(Base):
+    """Represents the number of articles on a given day that mention
+    a given pair of persons, rolled up from the words table
+    (see PersonPairsRollup in db/sql.py). A row where name1 == name2
+    holds the number of articles mentioning a single person."""
+
+    __tablename__ = "personpairs"
+
+    # Day of the article timestamps (or the scrape timestamps,
+    # for articles without a timestamp)
+    day = cast(date, Column(Date, nullable=False))
+
+    # The person names, with name1 <= name2
+    name1 = StringColumnRequired(Word.MAX_WORD_LEN)
+    name2 = StringColumnRequired(Word.MAX_WORD_LEN)
+
+    # Number of articles mentioning both persons
+    cnt = IntegerColumnRequired(default=0)
+
+    # When this row was computed
+    updated = cast(datetime, Column(DateTime, nullable=False))
+
+    __table_args__ = (
+        PrimaryKeyConstraint("day", "name1", "name2", name="personpairs_pkey"),
+    )
+
+    def __repr__(self):
+        return "PersonPair(day='{0}', name1='{1}', name2='{2}', cnt={3})".format(
+            self.day, self.name1, self.name2, self.cnt
+        )
+
+
 class Topic(Base):
     """Represents a topic for an article"""
 
@@ -594,6 +725,80 @@ class Trigram(Base):
         return "Trigram(t1='{0}', t2='{1}', t3='{2}')".format(self.t1, self.t2, self.t3)
 
 
+class TreeLabel(Base):
+    """Represents an entry in the inverted index of sentence tree labels,
+    i.e. the sentences of an article whose trees contain a given label
+    (see treeindex.py)"""
+
+    __tablename__ = "treelabels"
+
+    MAX_LABEL_LEN = 64
+
+    article_id = Column(
+        psql_UUID(as_uuid=False),
+        ForeignKey("articles.id", onupdate="CASCADE", ondelete="CASCADE"),
+        nullable=False,
+    )
+
+    # Node label, such as 'n:NP-POSS', 't:so' or 'l:maður'
+    label = StringColumnRequired(MAX_LABEL_LEN, index=True)
+
+    # Indices of the article's sentences whose trees contain the label
+    sentences = cast(List[int], Column(ARRAY(Integer), nullable=False))
+
+    __table_args__ = (
+        PrimaryKeyConstraint("article_id", "label", name="treelabels_pkey"),
+    )
+
+    def __repr__(self):
+        return "TreeLabel(label='{0}', sentences={1})".format(
+            self.label, self.sentences
+        )
+
+
+class ArticleStats(Base):
+    """Represents the statistics of the articles from a given root
+    on a given day, rolled up from the articles and persons tables
+    (see ArticleStatsRollup in db/sql.py)"""
+
+    __tablename__ = "articlestats"
+
+    # Day of the article timestamps (or the scrape timestamps,
+    # for articles without a timestamp)
+    day = cast(date, Column(Date, nullable=False))
+
+    # Foreign key to a root
+    root_id = cast(
+        int,
+        Column(
+            Integer,
+            ForeignKey("roots.id", onupdate="CASCADE", ondelete="CASCADE"),
+            nullable=False,
+        ),
+    )
+
+    # Number of articles, sentences and parsed sentences
+    articles = IntegerColumnRequired(default=0)
+    sentences = IntegerColumnRequired(default=0)
+    parsed = IntegerColumnRequired(default=0)
+
+    # Number of persons mentioned in the articles, in total and by gender
+    persons = IntegerColumnRequired(default=0)
+    persons_kk = IntegerColumnRequired(default=0)
+    persons_kvk = IntegerColumnRequired(default=0)
+    persons_hk = IntegerColumnRequired(default=0)
+
+    # When this row was computed
+    updated = cast(datetime, Column(DateTime, nullable=False))
+
+    __table_args__ = (PrimaryKeyConstraint("day", "root_id", name="articlestats_pkey"),)
+
+    def __repr__(self):
+        return "ArticleStats(day='{0}', root_id={1}, articles={2})".format(
+            self.day, self.root_id, self.articles
+        )
+
+
 class Link(Base):
     """Represents a (content-type, key) to URL mapping,
     usable for instance to cache image searches"""
@@ -790,20 +995,23 @@ class QueryLog(Base):
 
     error = Column(String(256), nullable=True)
 
+    # The fields of the queries table that are copied to this table
+    FIELDS = (
+        "timestamp",
+        "interpretations",
+        "question",
+        "bquestion",
+        "answer",
+        "voice",
+        "qtype",
+        "key",
+        "error",
+    )
+
     @staticmethod
     def from_Query(q: Query) -> QueryLog:
         """Create QueryLog object from Query object."""
-        return QueryLog(
-            timestamp=q.timestamp,
-            interpretations=q.interpretations,
-            question=q.question,
-            bquestion=q.bquestion,
-            answer=q.answer,
-            voice=q.voice,
-            qtype=q.qtype,
-            key=q.key,
-            error=q.error,
-        )
+        return QueryLog(**{f: getattr(q, f) for f in QueryLog.FIELDS})
 
     def __repr__(self):
         return "QueryLog(question='{0}', answer='{1}')".format(
@@ -811,6 +1019,37 @@ class QueryLog(Base):
         )
 
 
+class QueryStats(Base):
+    """Represents the statistics of the queries received on a given day,
+    rolled up from the queries table (see QueryStatsRollup in db/sql.py).
+    Logged queries are deleted after a while, but their statistics are kept."""
+
+    __tablename__ = "querystats"
+
+    __table_args__ = (PrimaryKeyConstraint("day", name="querystats_pkey"),)
+
+    day = cast(date, Column(Date, nullable=False))
+
+    # Number of queries and of distinct clients
+    queries = IntegerColumnRequired(default=0)
+    clients = IntegerColumnRequired(default=0)
+
+    # Number of queries per query type, as {qtype: count}
+    qtypes = cast(Any, Column(JSONB, nullable=False))
+
+    # Number of queries per client type and version,
+    # as [[client_type, client_version, count], ...]
+    client_types = cast(Any, Column(JSONB, nullable=False))
+
+    # When this row was computed
+    updated = cast(datetime, Column(DateTime, nullable=False))
+
+    def __repr__(self):
+        return "QueryStats(day='{0}', queries={1}, clients={2})".format(
+            self.day, self.queries, self.clients
+        )
+
+
 class QueryClientData(Base):
     """Represents client data saved from a processed query."""
 
@@ -23,18 +23,20 @@
 
 """
 
-from typing import Any, Iterable, Optional, Tuple, Union, cast
+from typing import Any, Dict, Iterable, List, Optional, Tuple, Union, cast
 
-from datetime import datetime
+from datetime import date, datetime, timedelta
 
 from . import SessionContext, Session
 
 
 ArticleListItem = Tuple[str, str, datetime, str, str]
-ChartQueryItem = Tuple[str, int, int, int]
+ChartQueryItem = Tuple[date, str, int, int, int]
 RelatedWordsItem = Tuple[str, str, int]
 BestAuthorsItem = Tuple[str, int, int, int, float]
 QueryCountItem = Tuple[int, int]
+QueryStatsItem = Tuple[date, int, int, Any, Any]
+PersonPairItem = Tuple[str, str, int]
 
 
 class _BaseQuery:
@@ -59,66 +61,232 @@ class _BaseQuery:
 
 
 class GenderQuery(_BaseQuery):
-    """A query for gender representation in the persons table."""
+    """A query for gender representation in the persons table,
+    from the daily rollup in the articlestats table."""
 
     _Q = """
-        select domain,
-            sum(case when gender = 'kk' then cnt else 0 end) as kk,
-            sum(case when gender = 'kvk' then cnt else 0 end) as kvk,
-            sum(case when gender = 'hk' then cnt else 0 end) as hk,
-            sum(cnt) as total
-            from (
-                select r.domain, p.gender, sum(1) as cnt
-                    from persons as p, articles as a, roots as r
-                    where p.article_url = a.url and a.root_id = r.id and r.visible
-                    group by r.domain, p.gender
-            ) as q
-            group by domain
-            order by domain;
+        select r.domain,
+            sum(s.persons_kk) as kk,
+            sum(s.persons_kvk) as kvk,
+            sum(s.persons_hk) as hk,
+            sum(s.persons) as total
+            from articlestats as s, roots as r
+            where s.root_id = r.id and r.visible
+            group by r.domain
+            having sum(s.persons) > 0
+            order by r.domain;
         """
 
 
 class StatsQuery(_BaseQuery):
-    """A query for statistics on articles."""
+    """A query for statistics on articles,
+    from the daily rollup in the articlestats table."""
 
     _Q = """
         select r.domain,
             r.scrape as enabled,
-            sum(1) as art,
-            coalesce(sum(a.num_sentences),0) as sent,
-            coalesce(sum(a.num_parsed),0) as parsed
-            from articles as a, roots as r
-            where a.root_id = r.id and r.visible
+            sum(s.articles) as art,
+            sum(s.sentences) as sent,
+            sum(s.parsed) as parsed
+            from articlestats as s, roots as r
+            where s.root_id = r.id and r.visible
             group by r.domain, r.scrape
             order by r.domain;
         """
 
 
 class ChartsQuery(_BaseQuery):
-    """Statistics on article, sentence and parse count
-    for all sources for a given time period."""
+    """Statistics on article, sentence and parse count for all
+    sources for each day in a given time period, from the daily
+    rollup in the articlestats table."""
 
     _Q = """
-        select r.description AS name,
-            count(a.id) AS cnt,
-            coalesce(sum(a.num_sentences),0) as sent,
-            coalesce(sum(a.num_parsed),0) as parsed
-            from roots as r
-            left join articles as a on r.id = a.root_id
-            and a.timestamp >= :start and a.timestamp < :end
+        select d.day::date as day,
+            r.description as name,
+            coalesce(sum(s.articles),0) as cnt,
+            coalesce(sum(s.sentences),0) as sent,
+            coalesce(sum(s.parsed),0) as parsed
+            from generate_series(:start, :last, interval '1 day') as d(day)
+            cross join roots as r
+            left join articlestats as s on s.root_id = r.id and s.day = d.day::date
             where r.visible and r.scrape
-            group by name
-            order by name
+            group by d.day, name
+            order by d.day, name
         """
 
     @classmethod
     def period(
-        cls, start: datetime, end: datetime, enclosing_session: Optional[Session] = None
+        cls, start: date, end: date, enclosing_session: Optional[Session] = None
     ) -> Iterable[ChartQueryItem]:
+        """Return (day, name, count, sentences, parsed) for each
+        source and each day from start up to but not including end"""
         r: Iterable[ChartQueryItem] = []
+        last = end - timedelta(days=1)
+        with SessionContext(session=enclosing_session, read_only=True) as session:
+            r = cast(
+                Iterable[ChartQueryItem], cls().execute(session, start=start, last=last)
+            )
+        return r
+
+
+class ArticleStatsRollup(_BaseQuery):
+    """Maintains the articlestats table, which holds the number of
+    articles, sentences, parsed sentences and person mentions per
+    root and day. The stats pages read this table instead of
+    aggregating over the whole articles and persons tables."""
+
+    # Recompute the rows for a range of days
+    _DELETE = """
+        delete from articlestats where day >= :start and day < :end
+        """
+
+    _Q = """
+        with a as (
+            select url, root_id, date(coalesce(timestamp, scraped)) as day,
+                num_sentences, num_parsed
+                from articles
+                where root_id is not null and (
+                    (timestamp >= :start and timestamp < :end)
+                    or (timestamp is null and scraped >= :start and scraped < :end)
+                )
+        ),
+        s as (
+            select day, root_id,
+                count(*) as articles,
+                coalesce(sum(num_sentences),0) as sentences,
+                coalesce(sum(num_parsed),0) as parsed
+                from a
+                group by day, root_id
+        ),
+        p as (
+            select a.day, a.root_id,
+                count(*) as persons,
+                count(*) filter (where p.gender = 'kk') as kk,
+                count(*) filter (where p.gender = 'kvk') as kvk,
+                count(*) filter (where p.gender = 'hk') as hk
+                from a join persons as p on p.article_url = a.url
+                group by a.day, a.root_id
+        )
+        insert into articlestats (day, root_id, articles, sentences, parsed,
+            persons, persons_kk, persons_kvk, persons_hk, updated)
+            select s.day, s.root_id, s.articles, s.sentences, s.parsed,
+                coalesce(p.persons,0), coalesce(p.kk,0),
+                coalesce(p.kvk,0), coalesce(p.hk,0), :now
+                from s left join p on p.day = s.day and p.root_id = s.root_id
+        """
+
+    _LAST_UPDATE = "select max(updated) from articlestats"
+
+    _FIRST_DAY = "select min(date(coalesce(timestamp, scraped))) from articles"
+
+    # Days with articles that have been scraped, parsed or processed
+    # (i.e. had persons extracted) since the last update
+    _STALE_DAYS = """
+        select distinct date(coalesce(timestamp, scraped)) as day
+            from articles
+            where (scraped >= :since or parsed >= :since or processed >= :since)
+            and coalesce(timestamp, scraped) is not null
+            order by day
+        """
+
+    @classmethod
+    def refresh(cls, session: Session, start: date, end: date, now: datetime) -> None:
+        """Recompute the rows for the days from start up to but not including end"""
+        s = cast(Any, session)
+        s.execute(cls._DELETE, dict(start=start, end=end))
+        s.execute(cls._Q, dict(start=start, end=end, now=now))
+
+    @classmethod
+    def update(cls, enclosing_session: Optional[Session] = None) -> int:
+        """Recompute the days with articles that have changed since the
+        last update, or all days if the table is empty. Returns the
+        number of days recomputed."""
+        # Changes made while we are updating are picked up next time
+        now = datetime.utcnow()
+        with SessionContext(session=enclosing_session, commit=True) as session:
+            s = cast(Any, session)
+            since: Optional[datetime] = s.scalar(cls._LAST_UPDATE)
+            if since is None:
+                first: Optional[date] = s.scalar(cls._FIRST_DAY)
+                if first is None:
+                    return 0
+                end = now.date() + timedelta(days=1)
+                cls.refresh(session, first, end, now)
+                return (end - first).days
+            days: List[date] = [
+                r[0] for r in s.execute(cls._STALE_DAYS, dict(since=since))
+            ]
+            for day in days:
+                cls.refresh(session, day, day + timedelta(days=1), now)
+            return len(days)
+
+
+class PersonPairsRollup(ArticleStatsRollup):
+    """Maintains the personpairs table, which holds the number of
+    articles per day that mention each pair of persons. A row where
+    name1 == name2 holds the number of articles mentioning a single
+    person. As in the original person graph, only persons with at least
+    two names are included. The words table, from which the mentions
+    are read, is updated when an article is parsed."""
+
+    _DELETE = """
+        delete from personpairs where day >= :start and day < :end
+        """
+
+    _Q = """
+        with m as (
+            select distinct a.id, date(coalesce(a.timestamp, a.scraped)) as day, w.stem
+                from articles as a join words as w on w.article_id = a.id
+                where w.cat like 'person_%' and w.stem like '% %' and (
+                    (a.timestamp >= :start and a.timestamp < :end)
+                    or (a.timestamp is null and a.scraped >= :start and a.scraped < :end)
+                )
+        )
+        insert into personpairs (day, name1, name2, cnt, updated)
+            select x.day, x.stem, y.stem, count(*), :now
+                from m as x join m as y on y.id = x.id and y.stem >= x.stem
+                group by x.day, x.stem, y.stem
+        """
+
+    _LAST_UPDATE = "select max(updated) from personpairs"
+
+
+class PersonGraphQuery(_BaseQuery):
+    """The persons most frequently mentioned over a given time period,
+    with the number of articles mentioning each pair of them,
+    from the daily rollup in the personpairs table"""
+
+    _Q = """
+        with top as (
+            select name1 as name from personpairs
+                where day >= :start and day < :end and name1 = name2
+                group by name1
+                order by sum(cnt) desc, name1
+                limit :limit
+        )
+        select p.name1, p.name2, sum(p.cnt) as cnt
+            from personpairs as p
+            join top as t1 on t1.name = p.name1
+            join top as t2 on t2.name = p.name2
+            where p.day >= :start and p.day < :end
+            group by p.name1, p.name2
+        """
+
+    @classmethod
+    def period(
+        cls,
+        start: date,
+        end: date,
+        limit: int,
+        enclosing_session: Optional[Session] = None,
+    ) -> Iterable[PersonPairItem]:
+        """Return (name1, name2, count) for the top persons; rows where
+        name1 == name2 give the number of articles mentioning a person"""
+        r: Iterable[PersonPairItem] = []
         with SessionContext(session=enclosing_session, read_only=True) as session:
             r = cast(
-                Iterable[ChartQueryItem], cls().execute(session, start=start, end=end)
+                Iterable[PersonPairItem],
+                cls().execute(session, start=start, end=end, limit=limit),
             )
         return r
 
@@ -187,6 +355,112 @@ class QueryClientTypeQuery(_BaseQuery):
         return g
 
 
+class QueryStatsQuery(_BaseQuery):
+    """Daily statistics on queries over a given time period,
+    from the daily rollup in the querystats table."""
+
+    _Q = """
+        select day, queries, clients, qtypes, client_types from querystats
+            where day >= :start and day < :end
+            order by day
+        """
+
+    @classmethod
+    def period(
+        cls, start: date, end: date, enclosing_session: Optional[Session] = None
+    ) -> Iterable[QueryStatsItem]:
+        """Return (day, queries, clients, qtypes, client_types) for
+        each day from start up to but not including end, where qtypes is
+        {qtype: count} and client_types is [[type, version, count], ...]"""
+        r: Iterable[QueryStatsItem] = []
+        with SessionContext(session=enclosing_session, read_only=True) as session:
+            r = cast(
+                Iterable[QueryStatsItem], cls().execute(session, start=start, end=end)
+            )
+        return r
+
+
+class QueryStatsRollup(_BaseQuery):
+    """Maintains the querystats table, which holds the number of
+    queries, distinct clients, queries per type and queries per client
+    type and version for each day. Logged queries are deleted after a
+    while (see scripts/prune_queries.sh), but their statistics remain."""
+
+    _DELETE = """
+        delete from querystats where day >= :start and day < :end
+        """
+
+    _Q = """
+        with q as (
+            select date(timestamp) as day, qtype, client_type, client_version, client_id
+                from queries
+                where timestamp >= :start and timestamp < :end
+        ),
+        t as (
+            select day, jsonb_object_agg(qtype, cnt) as qtypes
+                from (
+                    select day, qtype, count(*) as cnt from q
+                        where qtype is not null
+                        group by day, qtype
+                ) as x
+                group by day
+        ),
+        c as (
+            select day,
+                jsonb_agg(jsonb_build_array(client_type, client_version, cnt))
+                    as client_types
+                from (
+                    select day, client_type, client_version, count(*) as cnt from q
+                        where client_type is not null and client_type != ''
+                        group by day, client_type, client_version
+                ) as x
+                group by day
+        )
+        insert into querystats (day, queries, clients, qtypes, client_types, updated)
+            select d.day, d.queries, d.clients,
+                coalesce(t.qtypes, cast('{}' as jsonb)),
+                coalesce(c.client_types, cast('[]' as jsonb)),
+                :now
+                from (
+                    select day, count(*) as queries, count(distinct client_id) as clients
+                        from q
+                        group by day
+                ) as d
+                left join t on t.day = d.day
+                left join c on c.day = d.day
+        """
+
+    _LAST_UPDATE = "select max(updated) from querystats"
+
+    _FIRST_DAY = "select min(date(timestamp)) from queries"
+
+    @classmethod
+    def refresh(cls, session: Session, start: date, end: date, now: datetime) -> None:
+        """Recompute the rows for the days from start up to but not including end"""
+        s = cast(Any, session)
+        s.execute(cls._DELETE, dict(start=start, end=end))
+        s.execute(cls._Q, dict(start=start, end=end, now=now))
+
+    @classmethod
+    def update(cls, enclosing_session: Optional[Session] = None) -> int:
+        """Recompute the days from the day of the last update until today,
+        or all days if the table is empty. Returns the number of days
+        recomputed. Days before the last update are never recomputed,
+        since their queries may have been deleted."""
+        now = datetime.utcnow()
+        with SessionContext(session=enclosing_session, commit=True) as session:
+            s = cast(Any, session)
+            since: Optional[datetime] = s.scalar(cls._LAST_UPDATE)
+            first: Optional[date] = (
+                since.date() if since is not None else s.scalar(cls._FIRST_DAY)
+            )
+            if first is None:
+                return 0
+            end = now.date() + timedelta(days=1)
+            cls.refresh(session, first, end, now)
+            return (end - first).days
+
+
 class TopUnansweredQueriesQuery(_BaseQuery):
     """Return list of the most frequent *unanswered* queries
     over a given time period."""
@@ -411,9 +685,9 @@ class ArticleListQuery(_BaseQuery):
 
 
 class WordFrequencyQuery(_BaseQuery):
-    """A query yielding the number of times a given word occurs in
-    articles over a given period of time, broken down by either
-    day or week."""
+    """A query yielding the number of times each of a list of words
+    occurs in articles over a given period of time, broken down by
+    either day or week, from the daily rollup in the wordfreq table."""
 
     _Q = """
         with days as (
@@ -424,43 +698,100 @@ class WordFrequencyQuery(_BaseQuery):
                 :timeunit
             ) d
         ),
+        words as (
+            select distinct stem, cat
+            from unnest(cast(:stems as text[]), cast(:cats as text[])) as w(stem, cat)
+        ),
         appearances as (
-            select to_char(a.timestamp, :datefmt) date, sum(w.cnt) cnt
-            from words w, articles a
-            where w.stem = :stem
-            and w.cat = :cat
-            and w.article_id = a.id
-            and a.timestamp >= :start
-            and a.timestamp <= :end
-            group by date
-            order by date
+            select f.stem, f.cat, to_char(f.day, :datefmt) date, sum(f.cnt) cnt
+            from wordfreq f join words w on f.stem = w.stem and f.cat = w.cat
+            where f.day >= :start
+            and f.day < :end
+            group by f.stem, f.cat, date
         )
-        select days.date, coalesce(appearances.cnt,0) from days
-        left outer join appearances on days.date = appearances.date;
+        select words.stem, words.cat, days.date, coalesce(appearances.cnt,0)
+        from words cross join days
+        left outer join appearances on appearances.stem = words.stem
+            and appearances.cat = words.cat and appearances.date = days.date
+        order by words.stem, words.cat, days.date;
         """
 
     @classmethod
     def frequency(
         cls,
-        stem: str,
-        cat: str,
+        words: List[Tuple[str, str]],
         start: datetime,
         end: datetime,
         timeunit: str = "day",
         enclosing_session: Optional[Session] = None,
-    ) -> Iterable[Any]:
-        result: Iterable[Any] = []
+    ) -> Dict[Tuple[str, str], List[Tuple[str, int]]]:
+        """Return a dict mapping each (stem, cat) tuple in words
+        to a list of (date, count) tuples"""
+        result: Dict[Tuple[str, str], List[Tuple[str, int]]] = {w: [] for w in words}
+        if not words:
+            return result
         with SessionContext(session=enclosing_session, read_only=True) as session:
             assert timeunit in ["week", "day"]
             datefmt = "IYYY-IW" if timeunit == "week" else "YYYY-MM-DD"
             tu = f"1 {timeunit}"
-            result = cls().execute(
+            for stem, cat, d, cnt in cls().execute(
                 session,
-                stem=stem,
-                cat=cat,
+                stems=[w[0] for w in words],
+                cats=[w[1] for w in words],
                 start=start,
                 end=end,
                 timeunit=tu,
                 datefmt=datefmt,
-            )
+            ):
+                result[(stem, cat)].append((d, cnt))
         return result
+
+
+class WordFrequencyRollup(_BaseQuery):
+    """Rebuilds the wordfreq table, the daily rollup of the words table.
+    The table is normally kept up to date incrementally as articles are
+    stored (see Article._store_words()); a rebuild is only required to
+    populate it initially. It should not run concurrently with the scraper."""
+
+    _DELETE = """
+        delete from wordfreq where day >= :start and day < :end
+        """
+
+    _Q = """
+        insert into wordfreq (stem, cat, day, cnt)
+            select w.stem, w.cat, date(a.timestamp), sum(w.cnt)
+                from words as w join articles as a on a.id = w.article_id
+                where a.timestamp >= :start and a.timestamp < :end
+                group by w.stem, w.cat, date(a.timestamp)
+        """
+
+    _FIRST_DAY = "select min(date(timestamp)) from articles"
+
+    _EMPTY = "select not exists (select 1 from wordfreq)"
+
+    @classmethod
+    def rebuild(cls, chunk_days: int = 30) -> int:
+        """Recompute the table in chunks of days, committing after each
+        chunk. Returns the number of days recomputed."""
+        with SessionContext(read_only=True) as session:
+            first: Optional[date] = cast(Any, session).scalar(cls._FIRST_DAY)
+        if first is None:
+            return 0
+        end = datetime.utcnow().date() + timedelta(days=1)
+        start = first
+        while start < end:
+            stop = min(end, start + timedelta(days=chunk_days))
+            with SessionContext(commit=True) as session:
+                s = cast(Any, session)
+                s.execute(cls._DELETE, dict(start=start, end=stop))
+                s.execute(cls._Q, dict(start=start, end=stop))
+            start = stop
+        return (end - first).days
+
+    @classmethod
+    def populate(cls) -> int:
+        """Rebuild the table if it is empty. Returns the number
+        of days recomputed."""
+        with SessionContext(read_only=True) as session:
+            empty: bool = cast(Any, session).scalar(cls._EMPTY)
+        return cls.rebuild() if empty else 0
@@ -27,8 +27,10 @@ from typing import Any, Dict, Iterator, List, Optional, Set, Tuple, cast
 from types import ModuleType
 
 import re
+import time
 import importlib
 import logging
+import threading
 
 import requests
 import urllib.parse as urlparse
@@ -39,12 +41,21 @@ from bs4 import BeautifulSoup, NavigableString, Tag  # type: ignore
 from reynir import tokenize, Tok
 from nertokenizer import recognize_entities
 
+import httpclient
 from db import SessionContext, Session
 from db.models import Root, Article as ArticleRow
+from scrapers.default import HTML_PARSER
 
-# The HTML parser to use with BeautifulSoup
-# _HTML_PARSER = "html5lib"
-_HTML_PARSER = "html.parser"
+# Version of the text extraction in Fetcher.extract_text() and
+# Fetcher.TextList. Change this when modifying them, to invalidate
+# the cached article texts (see Fetcher.text_version()).
+TEXT_EXTRACTION_VERSION = "1"
+
+# Interval, in seconds, between reloads of the root domain index
+_ROOT_INDEX_TTL = 10 * 60.0
+
+# Type of the root domain index: domain -> (order of root, scrape helper)
+RootIndex = Dict[str, Tuple[int, Optional[ModuleType]]]
 
 
 class Fetcher:
@@ -93,6 +104,11 @@ class Fetcher:
     # Cache of instantiated scrape helpers
     _helpers: Dict[str, ModuleType] = dict()
 
+    # Index of root domains, loaded on first use (see helper_for())
+    _root_index: Optional[RootIndex] = None
+    _root_index_loaded = 0.0
+    _root_index_lock = threading.Lock()
+
     def __init__(self):
         """No instances are supposed to be created of this class"""
         assert False
@@ -204,9 +220,15 @@ class Fetcher:
         # Extract the text content of the HTML into a list
         tlist = Fetcher.TextList()
         Fetcher.extract_text(soup, tlist)
-        text = tlist.result()
+        return Fetcher.text_to_tokens(tlist.result(), enclosing_session)
 
-        # Tokenize the resulting text, returning a generator
+    @staticmethod
+    def text_to_tokens(
+        text: str, enclosing_session: Optional[Session] = None
+    ) -> Iterator[Tok]:
+        """Convert text, as returned by TextList.result(),
+        into a parsable token stream"""
+        # Tokenize the text, returning a generator
         token_stream = tokenize(text)
         return recognize_entities(token_stream, enclosing_session=enclosing_session)
 
@@ -216,7 +238,7 @@ class Fetcher:
         html_doc = None
         try:
             # Normal external HTTP/HTTPS fetch
-            r = requests.get(url, timeout=10)
+            r = httpclient.get(url, timeout=10)
             # pylint: disable=no-member
             if r.status_code == requests.codes.ok:
                 html_doc = r.text
@@ -265,13 +287,45 @@ class Fetcher:
     def make_soup(doc: str, helper: Optional[ModuleType] = None) -> Optional[Tag]:
         """Convert a document to a soup, using the helper if available"""
         if helper is None:
-            soup = BeautifulSoup(doc, _HTML_PARSER) if doc else None
+            soup = BeautifulSoup(doc, HTML_PARSER) if doc else None
             if soup is None or soup.html is None:
                 return None
         else:
             soup = helper.make_soup(doc) if doc else None
         return soup
 
+    @staticmethod
+    def text_version(helper: Optional[ModuleType]) -> str:
+        """Return a version string identifying the way in which text
+        is extracted from HTML using the given helper, i.e. the
+        versions of the text extraction and the helper, and the
+        HTML parser"""
+        if helper is None:
+            helper_version = "-"
+        else:
+            h = cast(Any, helper)
+            helper_version = f"{h.scr_module}.{h.scr_class}/{h.scr_version}"
+        return f"{TEXT_EXTRACTION_VERSION}/{HTML_PARSER}/{helper_version}"
+
+    @staticmethod
+    def html_to_text(html: str, helper: Optional[ModuleType] = None) -> Optional[str]:
+        """Extract the text content of an HTML document, using the
+        helper if available, with paragraphs marked as by TextList.
+        Returns None if the document has no content."""
+        soup = Fetcher.make_soup(html, helper)
+        content: Optional[Tag]
+        if soup is None or soup.html is None:
+            content = None
+        elif helper is None:
+            content = soup.html.body
+        else:
+            content = cast(Any, helper).get_content(soup)
+        if not content:
+            return None
+        tlist = Fetcher.TextList()
+        Fetcher.extract_text(content, tlist)
+        return tlist.result()
+
     @classmethod
     def tokenize_html(
         cls, url: str, html: str, enclosing_session: Optional[Session] = None
@@ -279,18 +333,11 @@ class Fetcher:
         """Convert HTML into a token iterable (generator)"""
         with SessionContext(enclosing_session) as session:
             helper = cls.helper_for(session, url)
-            soup = Fetcher.make_soup(html, helper)
-            content: Optional[Tag]
-            if soup is None or soup.html is None:
-                content = None
-            elif helper is None:
-                content = soup.html.body
-            else:
-                content = cast(Any, helper).get_content(soup)
-            # Convert the content soup to a token iterable (generator)
+            text = cls.html_to_text(html, helper)
+            # Convert the text to a token iterable (generator)
             return (
-                Fetcher.to_tokens(content, enclosing_session=session)
-                if content
+                Fetcher.text_to_tokens(text, enclosing_session=session)
+                if text is not None
                 else None
             )
 
@@ -349,23 +396,57 @@ class Fetcher:
         return fetch
 
     @classmethod
-    def helper_for(cls, session: Session, url: str) -> Optional[ModuleType]:
-        """Return a scrape helper for the root of the given url"""
-        s = urlparse.urlsplit(url)
-        root: Optional[Root] = None
-        # Find which root this URL belongs to, if any
+    def _load_root_index(cls, session: Session) -> RootIndex:
+        """Load an index mapping the domain of each root,
+        i.e. www.ruv.is -> ruv.is, to its scrape helper"""
+        index: RootIndex = dict()
         r: Root
-        for r in session.query(Root).all():
+        for order, r in enumerate(session.query(Root).all()):
             root_s = urlparse.urlsplit(r.url)
             # Find the root of the domain, i.e. www.ruv.is -> ruv.is
             root_domain = ".".join(root_s.netloc.split(".")[-2:])
-            # This URL belongs to a root if the domain (netloc) part
-            # ends with the root domain
-            if s.netloc == root_domain or s.netloc.endswith("." + root_domain):
-                root = r
-                break
-        # Obtain a scrape helper for the root, if any
-        return cls._get_helper(root) if root else None
+            if root_domain in index:
+                # The first root for a domain takes precedence
+                continue
+            helper: Optional[ModuleType] = None
+            if r.scr_module and r.scr_class:
+                try:
+                    helper = cls._get_helper(r)
+                except Exception as e:
+                    logging.error(f"Unable to load helper for root {r.url}: {e}")
+            index[root_domain] = (order, helper)
+        return index
+
+    @classmethod
+    def reset_root_index(cls) -> None:
+        """Discard the root domain index, e.g. after roots have been
+        added or modified, so that it is reloaded on next use"""
+        with cls._root_index_lock:
+            cls._root_index = None
+
+    @classmethod
+    def helper_for(cls, session: Session, url: str) -> Optional[ModuleType]:
+        """Return a scrape helper for the root of the given url"""
+        index = cls._root_index
+        if index is None or time.monotonic() - cls._root_index_loaded > _ROOT_INDEX_TTL:
+            with cls._root_index_lock:
+                # Another thread may have loaded the index meanwhile
+                if cls._root_index is index:
+                    cls._root_index = cls._load_root_index(session)
+                    cls._root_index_loaded = time.monotonic()
+                index = cls._root_index
+            assert index is not None
+        # This URL belongs to a root if the domain (netloc) part
+        # equals, or ends with, the root domain. Look up each
+        # domain suffix, i.e. www.ruv.is, ruv.is and is, and pick
+        # the first root (in table order) that matches.
+        labels = urlparse.urlsplit(url).netloc.split(".")
+        found: Optional[Tuple[int, Optional[ModuleType]]] = None
+        for i in range(len(labels)):
+            entry = index.get(".".join(labels[i:]))
+            if entry is not None and (found is None or entry[0] < found[0]):
+                found = entry
+        return found[1] if found else None
 
     # noinspection PyComparisonWithNone
     @classmethod
@@ -24,15 +24,33 @@
 # corresponding country code, e.g. "Norður-Ítalía" -> "IT"
 # TODO: Most of this stuff should go into its own module, iceloc or something
 
-from typing import Mapping, Optional, Dict, Union, Tuple, List, Any, cast
+from typing import (
+    Generic,
+    Iterable,
+    Iterator,
+    Mapping,
+    Optional,
+    Dict,
+    TypeVar,
+    Union,
+    Tuple,
+    List,
+    Any,
+    cast,
+)
 
 import json
 import re
 import sys
 import os
 import math
+import threading
+from array import array
+from functools import lru_cache
+from itertools import islice
 
-from iceaddr import iceaddr_lookup, placename_lookup
+from iceaddr import iceaddr_lookup, placename_lookup, postcodes_for_placename, POSTCODES
+from iceaddr.db import shared_db
 from cityloc import city_lookup  # type: ignore
 from country_list import countries_for_language, available_languages
 
@@ -266,9 +284,10 @@ def location_description(loc: Dict[str, str]) -> str:
     if kind == "street":
         if loc.get("country") == ICELAND_ISOCODE:
             # Icelandic address
-            info = iceaddr_lookup(name, limit=200)
+            idx = street_index()
+            info = idx.lookup(name, limit=200)
             if info:
-                places = set([i["stadur_tgf"] for i in info])
+                places = set([idx.place(i, "stadur_tgf") for i in info])
                 # Disambugiate placename for description if we can
                 if len(places) == 1:
                     p = places.pop()
@@ -336,21 +355,19 @@ def location_info(
             loc["country"] = ICELAND_ISOCODE
         elif name not in ICE_PLACENAME_BLACKLIST:
             # Try to find a matching Icelandic placename
-            info_list = placename_lookup(name)
-            if info_list:
+            found, pn_coords = _icelandic_placename(name)
+            if found:
                 loc["country"] = ICELAND_ISOCODE
                 # Pick first matching placename
-                coords = coords_from_addr_info(info_list[0])
+                coords = pn_coords
 
         # OK, not Icelandic. Let's see if it's a foreign city
         if not info:
-            cities = lookup_city_info(name)
-            if cities:
+            city = _foreign_city(name)
+            if city is not None:
                 # Pick first match. Cityloc package should give us a match list
                 # ordered by population, with capital cities given precedence
-                c = cities[0]
-                loc["country"] = c.get("country")
-                coords = coords_from_addr_info(cast(Dict[str, float], c))
+                loc["country"], coords = city
 
     # Check if it's a US state (marked as either "lönd" or "örn" in BÍN)
     if "country" not in loc and (kind == "country" or kind == "placename"):
@@ -395,6 +412,34 @@ def lookup_city_info(name: str) -> Optional[List[Dict[str, Union[str, float]]]]:
     return city_lookup(cn)
 
 
+# Maximum number of names whose placename and city lookups are cached
+_LOOKUP_CACHE_SIZE = 20000
+
+
+@lru_cache(maxsize=_LOOKUP_CACHE_SIZE)
+def _icelandic_placename(name: str) -> Tuple[bool, Optional[LatLonTuple]]:
+    """Return a tuple (found, coordinates) for the first
+    Icelandic placename matching the name"""
+    info_list = placename_lookup(name)
+    if not info_list:
+        return False, None
+    return True, coords_from_addr_info(info_list[0])
+
+
+@lru_cache(maxsize=_LOOKUP_CACHE_SIZE)
+def _foreign_city(name: str) -> Optional[Tuple[Optional[str], Optional[LatLonTuple]]]:
+    """Return a tuple (country code, coordinates) for the first
+    city matching the name, or None if there is no match"""
+    cities = lookup_city_info(name)
+    if not cities:
+        return None
+    c = cities[0]
+    return (
+        cast(Optional[str], c.get("country")),
+        coords_from_addr_info(cast(Dict[str, float], c)),
+    )
+
+
 US_STATE_NAMES: Optional[Dict[str, str]] = None
 US_STATES_JSONPATH = os.path.join(
     os.path.dirname(__file__), "resources", "geo", "us_state_name2code.json"
@@ -493,6 +538,123 @@ def coords_for_country(iso_code: str) -> Optional[LatLonTuple]:
     return None
 
 
+class StreetIndex:
+    """An in-memory index of the Icelandic addresses in Staðfangaskrá,
+    as provided by the iceaddr package, for looking up street names
+    without querying its SQLite database. The addresses are kept in
+    compact arrays, in the order in which iceaddr_lookup() returns
+    them, and street names (nominative and dative) and special names
+    (e.g. "Harpa") map to arrays of address indices."""
+
+    # Address columns, in iceaddr_lookup()'s result order
+    _Q = """
+        select heiti_nf, heiti_tgf, serheiti, postnr, husnr, bokst, vidsk,
+            lat_wgs84, long_wgs84
+        from stadfong
+        order by vidsk != '', postnr asc, husnr asc, bokst asc, hnitnum asc
+        """
+
+    # Lower case for ASCII letters only, as in SQLite's NOCASE collation
+    _ASCII_LOWER = str.maketrans(
+        "ABCDEFGHIJKLMNOPQRSTUVWXYZ", "abcdefghijklmnopqrstuvwxyz"
+    )
+
+    def __init__(self) -> None:
+        self._postcode = array("H")
+        self._number = array("i")  # -1 if none
+        self._lat = array("d")
+        self._lon = array("d")
+        # Letter after the house number, lower case
+        self._letter: List[str] = []
+        # Number part of an address range suffix (viðskeyti), e.g. "4" in "4-6"
+        self._range: List[str] = []
+        self._streets: Dict[str, "array[int]"] = dict()
+        self._special: Dict[str, "array[int]"] = dict()
+        strings: Dict[str, str] = dict()
+        cursor = shared_db.connection().cursor()
+        for i, row in enumerate(cursor.execute(self._Q)):
+            nf, tgf, special = row["heiti_nf"], row["heiti_tgf"], row["serheiti"]
+            self._streets.setdefault(nf, array("I")).append(i)
+            if tgf and tgf != nf:
+                self._streets.setdefault(tgf, array("I")).append(i)
+            if special:
+                self._special.setdefault(special, array("I")).append(i)
+            self._postcode.append(row["postnr"] or 0)
+            self._number.append(-1 if row["husnr"] is None else row["husnr"])
+            self._lat.append(row["lat_wgs84"])
+            self._lon.append(row["long_wgs84"])
+            letter = (row["bokst"] or "").translate(self._ASCII_LOWER)
+            vidsk = row["vidsk"] or ""
+            rng = vidsk[: vidsk.find("-")] if "-" in vidsk else ""
+            # Share the (few distinct) letter and range strings
+            self._letter.append(strings.setdefault(letter, letter))
+            self._range.append(strings.setdefault(rng, rng))
+
+    def __len__(self) -> int:
+        return len(self._postcode)
+
+    def lookup(
+        self,
+        street_name: str,
+        number: Optional[int] = None,
+        letter: Optional[str] = None,
+        placename: Optional[str] = None,
+        limit: int = 50,
+    ) -> List[int]:
+        """Return the indices of the addresses matching the criteria, in
+        the same order and with the same semantics as iceaddr_lookup()"""
+        street_name = street_name.strip()
+        street_name = street_name[:1].upper() + street_name[1:]
+        indices: Iterable[int] = self._streets.get(street_name, ())
+        if not number:
+            # Also match special names, i.e. churches and places
+            # of interest like Harpa
+            special = self._special.get(street_name)
+            if special:
+                indices = sorted(set(indices).union(special))
+        postcodes = (
+            frozenset(postcodes_for_placename(placename.strip())) if placename else None
+        )
+        if letter:
+            letter = letter.translate(self._ASCII_LOWER)
+        result: List[int] = []
+        for i in indices:
+            if number:
+                if self._number[i] != number and self._range[i] != str(number):
+                    continue
+                if letter and self._letter[i] != letter:
+                    continue
+            if postcodes and self._postcode[i] not in postcodes:
+                continue
+            result.append(i)
+            if len(result) >= limit:
+                break
+        return result
+
+    def place(self, index: int, key: str = "stadur_nf") -> Optional[str]:
+        """Return the placename of an address, by default in nominative case"""
+        info = POSTCODES.get(self._postcode[index])
+        return info.get(key) if info else None
+
+    def coords(self, index: int) -> LatLonTuple:
+        """Return the coordinates of an address"""
+        return (self._lat[index], self._lon[index])
+
+
+_STREET_INDEX: Optional[StreetIndex] = None
+_STREET_INDEX_LOCK = threading.Lock()
+
+
+def street_index() -> StreetIndex:
+    """Return the street index, loading it on first use"""
+    global _STREET_INDEX
+    if _STREET_INDEX is None:
+        with _STREET_INDEX_LOCK:
+            if _STREET_INDEX is None:
+                _STREET_INDEX = StreetIndex()
+    return _STREET_INDEX
+
+
 def coords_for_street_name(
     street_name: str,
     placename: Optional[str] = None,
@@ -503,13 +665,14 @@ def coords_for_street_name(
     to a single street if possible. Street coordinates are the coordinates
     of the lowest house number."""
 
-    addresses = iceaddr_lookup(street_name, placename=placename, limit=100)
+    idx = street_index()
+    addresses = idx.lookup(street_name, placename=placename, limit=100)
 
     if not addresses:
         return None
 
     # Find all places containing street_name
-    places = set(a.get("stadur_nf") for a in addresses)
+    places = set(idx.place(a) for a in addresses)
     addr = None
 
     # Only exists in one place
@@ -518,13 +681,13 @@ def coords_for_street_name(
     elif placename_hints:
         # See if placename hints can narrow it down
         for pn in placename_hints:
-            addresses = iceaddr_lookup(street_name, placename=pn)
-            places = set(a.get("stadur_nf") for a in addresses)
+            addresses = idx.lookup(street_name, placename=pn)
+            places = set(idx.place(a) for a in addresses)
             if len(places) == 1:
                 addr = addresses[0]
                 break
 
-    return coords_from_addr_info(addr)
+    return idx.coords(addr) if addr is not None else None
 
 
 def coords_from_addr_info(info: Optional[Dict[str, float]]) -> Optional[LatLonTuple]:
@@ -577,28 +740,41 @@ def icelandic_addr_info(
     """Look up info about a specific Icelandic address in Staðfangaskrá via
     the iceaddr package. We want either a single definite match or nothing."""
     addr = parse_address_string(addr_str)
+    idx = street_index()
 
-    def lookup(pn: Optional[str]):
-        a = iceaddr_lookup(
+    def is_single(pn: Optional[str]) -> bool:
+        a = idx.lookup(
             addr["street"],
             number=addr.get("number"),
             letter=addr.get("letter"),
             placename=pn,
             limit=2,
         )
-        return a[0] if len(a) == 1 else None
+        return len(a) == 1
 
     # Look up with the (optional) placename provided
-    res = lookup(placename)
+    pn = placename
+    found = is_single(pn)
 
     # If no single address found, try to disambiguate using placename hints
-    if not res and placename_hints:
+    if not found and placename_hints:
         for p in placename_hints:
-            res = lookup(p)
-            if res:
+            if is_single(p):
+                pn = p
+                found = True
                 break
 
-    return res
+    if not found:
+        return None
+    # Fetch the full info about the address from the database
+    a = iceaddr_lookup(
+        addr["street"],
+        number=addr.get("number"),
+        letter=addr.get("letter"),
+        placename=pn,
+        limit=2,
+    )
+    return a[0] if len(a) == 1 else None
 
 
 def parse_address_string(addrstr: str) -> Dict[str, Any]:
@@ -865,6 +1041,146 @@ def near_capital_region(loc: LatLonTuple, km_radius: int = 30) -> bool:
     return distance(loc, RVK_COORDS) < km_radius
 
 
+# Length of one degree of latitude, in km
+_KM_PER_DEGREE = math.pi * _EARTH_RADIUS / 180.0
+# Half the circumference of the Earth: no two points are further apart
+_MAX_DISTANCE = math.pi * _EARTH_RADIUS
+
+T = TypeVar("T")
+
+
+class LocationIndex(Generic[T]):
+    """An index of items by location, for finding the items nearest
+    to a given location or within a given radius from it. The items
+    are kept in a grid of cells of roughly cell_km by cell_km, and
+    only the cells that can contain matching items are searched.
+    Distances are Haversine distances in km, as from distance()."""
+
+    def __init__(
+        self, items: Iterable[Tuple[LatLonTuple, T]], cell_km: float = 2.0
+    ) -> None:
+        self._cell_km = cell_km
+        # Size of a cell in degrees, both of latitude and longitude
+        self._cell = cell_km / _KM_PER_DEGREE
+        self._columns = max(1, math.ceil(360.0 / self._cell))
+        self._items: List[T] = []
+        # Latitudes, longitudes and cosines of latitudes, in radians
+        self._lat = array("d")
+        self._lon = array("d")
+        self._cos = array("d")
+        self._grid: Dict[Tuple[int, int], List[int]] = dict()
+        for (lat, lon), item in items:
+            ix = len(self._items)
+            self._items.append(item)
+            rlat = math.radians(lat)
+            self._lat.append(rlat)
+            self._lon.append(math.radians(lon))
+            self._cos.append(math.cos(rlat))
+            self._grid.setdefault(self._cell_for(lat, lon), []).append(ix)
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+    @property
+    def items(self) -> List[T]:
+        """The indexed items, in their original order"""
+        return self._items
+
+    def _cell_for(self, lat: float, lon: float) -> Tuple[int, int]:
+        return (
+            math.floor((lat + 90.0) / self._cell),
+            math.floor(((lon + 180.0) % 360.0) / self._cell),
+        )
+
+    def _candidates(self, lat: float, lon: float, km_radius: float) -> Iterable[int]:
+        """Return the indices of the items in the cells that intersect
+        the bounding box of a circle with the given radius"""
+        n = len(self._items)
+        if km_radius >= _MAX_DISTANCE:
+            return range(n)
+        dlat = km_radius / _KM_PER_DEGREE
+        if abs(lat) + dlat >= 90.0:
+            # The circle contains a pole: all longitudes are included
+            return range(n)
+        # Longitude extent of the circle, at its widest
+        dlon = math.degrees(
+            math.asin(math.sin(math.radians(dlat)) / math.cos(math.radians(lat)))
+        )
+        row0, col0 = self._cell_for(lat - dlat, lon - dlon)
+        row1, col1 = self._cell_for(lat + dlat, lon + dlon)
+        rows = row1 - row0 + 1
+        cols = (col1 - col0) % self._columns + 1
+        if 2.0 * (dlon + self._cell) >= 360.0 or rows * cols >= n:
+            # Cheaper to look at all the items than at all the cells
+            return range(n)
+        result: List[int] = []
+        grid = self._grid
+        for row in range(row0, row1 + 1):
+            for col in range(col0, col0 + cols):
+                cell = grid.get((row, col % self._columns))
+                if cell is not None:
+                    result.extend(cell)
+        return result
+
+    def _within(self, loc: LatLonTuple, km_radius: float) -> List[Tuple[float, int]]:
+        """Return (distance, index) tuples for the items within the radius"""
+        lat1, lon1 = loc
+        rlat1 = math.radians(lat1)
+        rlon1 = math.radians(lon1)
+        cos1 = math.cos(rlat1)
+        lats, lons, coss = self._lat, self._lon, self._cos
+        sin, sqrt, atan2 = math.sin, math.sqrt, math.atan2
+        result: List[Tuple[float, int]] = []
+        for ix in self._candidates(lat1, lon1, km_radius):
+            slat = sin((lats[ix] - rlat1) / 2)
+            slon = sin((lons[ix] - rlon1) / 2)
+            a = slat * slat + cos1 * coss[ix] * slon * slon
+            d = 2 * _EARTH_RADIUS * atan2(sqrt(a), sqrt(1 - a))
+            if d <= km_radius:
+                result.append((d, ix))
+        return result
+
+    def within(self, loc: LatLonTuple, km_radius: float) -> List[Tuple[float, T]]:
+        """Return (distance, item) tuples for the items within
+        the given radius, in order of increasing distance"""
+        found = self._within(loc, km_radius)
+        found.sort()
+        items = self._items
+        return [(d, items[ix]) for d, ix in found]
+
+    def iter_nearest(
+        self, loc: LatLonTuple, within_radius: Optional[float] = None
+    ) -> Iterator[Tuple[float, T]]:
+        """Generate (distance, item) tuples in order of increasing
+        distance, optionally only for items within the given radius.
+        The search radius is widened as items are consumed."""
+        limit = _MAX_DISTANCE if within_radius is None else within_radius
+        items = self._items
+        radius = self._cell_km
+        searched = -1.0
+        while searched < limit:
+            radius = min(radius, limit)
+            within = self._within(loc, radius)
+            # Items up to the previous radius have already been generated
+            found = [t for t in within if t[0] > searched]
+            found.sort()
+            for d, ix in found:
+                yield d, items[ix]
+            if len(within) == len(items):
+                break
+            searched = radius
+            radius *= 4.0
+
+    def nearest(
+        self, loc: LatLonTuple, n: int = 1, within_radius: Optional[float] = None
+    ) -> List[Tuple[float, T]]:
+        """Return (distance, item) tuples for the n items nearest
+        to the given location, optionally only within the given radius"""
+        if n < 1:
+            return []
+        return list(islice(self.iter_nearest(loc, within_radius), n))
+
+
 if __name__ == "__main__":
     """Test location info lookup via command line."""
     name = sys.argv[1] if len(sys.argv) > 1 else None
@@ -0,0 +1,226 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module implements the HTTP client used for outbound requests,
+    e.g. to external JSON APIs, news sites, image search and the neural
+    network servers.
+
+    Each process has one requests.Session, whose connection pools keep
+    connections to each host alive between requests. Repeated requests
+    to the same server thus don't pay for a new TCP connection and TLS
+    handshake each time. The session keeps no cookies, since it is shared
+    by all requests and clients of the process.
+
+    GET and HEAD requests that fail to connect or receive a 502, 503 or
+    504 status are retried with exponential backoff (see
+    Settings.HTTP_RETRIES and Settings.HTTP_BACKOFF), but only within a
+    total deadline for the request, which by default is its timeout.
+    Retries thus never make a caller wait longer than a single attempt
+    could.
+
+    The latency and errors of requests are counted per host in this
+    process; see metrics().
+
+"""
+
+from typing import Any, Dict, List, Optional, Tuple, Union
+
+import os
+import time
+import threading
+from http.cookiejar import DefaultCookiePolicy
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from settings import Settings
+
+
+# Number of hosts whose connection pools are kept
+_POOL_HOSTS = 32
+# Maximum number of connections kept alive per host
+_POOL_SIZE = 10
+
+# Upper bounds, in seconds, of the latency histogram buckets;
+# a final bucket counts slower requests
+_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Methods that are retried, and the statuses that cause a retry
+_RETRY_METHODS = frozenset(("GET", "HEAD"))
+_RETRY_STATUSES = frozenset((502, 503, 504))
+
+TimeoutType = Union[float, Tuple[float, float]]
+
+
+class _HostStats:
+    """Request latency and error counts for one host"""
+
+    __slots__ = ("requests", "errors", "statuses", "total", "max", "histogram")
+
+    def __init__(self) -> None:
+        self.requests = 0
+        # Requests that raised an exception, e.g. a timeout
+        self.errors = 0
+        # Responses by status class, e.g. "2xx"
+        self.statuses: Dict[str, int] = dict()
+        self.total = 0.0
+        self.max = 0.0
+        self.histogram: List[int] = [0] * (len(_LATENCY_BUCKETS) + 1)
+
+    def add(self, elapsed: float, status: Optional[int]) -> None:
+        self.requests += 1
+        if status is None:
+            self.errors += 1
+        else:
+            key = f"{status // 100}xx"
+            self.statuses[key] = self.statuses.get(key, 0) + 1
+        self.total += elapsed
+        self.max = max(self.max, elapsed)
+        ix = 0
+        while ix < len(_LATENCY_BUCKETS) and elapsed > _LATENCY_BUCKETS[ix]:
+            ix += 1
+        self.histogram[ix] += 1
+
+
+_lock = threading.Lock()
+_session: Optional[requests.Session] = None
+_pid = 0
+_stats: Dict[str, _HostStats] = dict()
+
+
+def session() -> requests.Session:
+    """Return this process' HTTP session, creating it if needed"""
+    global _session, _pid
+    with _lock:
+        if _session is None or _pid != os.getpid():
+            # Don't share connections with a parent process
+            adapter = HTTPAdapter(pool_connections=_POOL_HOSTS, pool_maxsize=_POOL_SIZE)
+            s = requests.Session()
+            # Don't let cookies set by one server response leak into
+            # requests made on behalf of other clients
+            s.cookies.set_policy(DefaultCookiePolicy(allowed_domains=[]))
+            s.mount("http://", adapter)
+            s.mount("https://", adapter)
+            _session = s
+            _pid = os.getpid()
+            _stats.clear()
+        return _session
+
+
+def _limit(timeout: TimeoutType, remaining: float) -> TimeoutType:
+    """Cap a timeout at the remaining time until a deadline"""
+    remaining = max(remaining, 0.001)
+    if isinstance(timeout, tuple):
+        return (min(timeout[0], remaining), min(timeout[1], remaining))
+    return min(timeout, remaining)
+
+
+def request(
+    method: str,
+    url: str,
+    *,
+    timeout: TimeoutType = 10.0,
+    deadline: Optional[float] = None,
+    **kwargs: Any,
+) -> requests.Response:
+    """Send an HTTP request through this process' session, with the
+    same parameters as requests.request(). The deadline is the total
+    time in seconds that retries may take, including the backoff; it
+    defaults to the timeout (the sum, for a (connect, read) tuple).
+    No attempt's timeout extends past the deadline. Exceptions are
+    raised as by requests."""
+    host = urlsplit(url).netloc
+    status: Optional[int] = None
+    t0 = time.perf_counter()
+    if deadline is None:
+        deadline = sum(timeout) if isinstance(timeout, tuple) else timeout
+    t_end = t0 + deadline
+    retries = Settings.HTTP_RETRIES if method.upper() in _RETRY_METHODS else 0
+    error: Optional[requests.ConnectionError] = None
+    try:
+        attempt = 0
+        while True:
+            t_attempt = _limit(timeout, t_end - time.perf_counter())
+            r: Optional[requests.Response] = None
+            try:
+                r = session().request(method, url, timeout=t_attempt, **kwargs)
+            except requests.ConnectionError as e:
+                # Includes connect timeouts, but not read timeouts
+                if attempt >= retries:
+                    raise
+                error = e
+            else:
+                if r.status_code not in _RETRY_STATUSES or attempt >= retries:
+                    status = r.status_code
+                    return r
+            delay = Settings.HTTP_BACKOFF * (2**attempt)
+            if time.perf_counter() + delay >= t_end:
+                # No time left for another attempt
+                if r is None:
+                    assert error is not None
+                    raise error
+                status = r.status_code
+                return r
+            if r is not None:
+                r.close()
+            time.sleep(delay)
+            attempt += 1
+    finally:
+        elapsed = time.perf_counter() - t0
+        with _lock:
+            stats = _stats.get(host)
+            if stats is None:
+                stats = _stats[host] = _HostStats()
+            stats.add(elapsed, status)
+
+
+def get(url: str, **kwargs: Any) -> requests.Response:
+    """Send a GET request; see request()"""
+    return request("GET", url, **kwargs)
+
+
+def post(url: str, **kwargs: Any) -> requests.Response:
+    """Send a POST request; see request()"""
+    return request("POST", url, **kwargs)
+
+
+def head(url: str, **kwargs: Any) -> requests.Response:
+    """Send a HEAD request; see request()"""
+    return request("HEAD", url, **kwargs)
+
+
+def metrics() -> Dict[str, Dict[str, Any]]:
+    """Return the number of requests, errors, responses by status class
+    and a latency histogram, per host, for this process"""
+    buckets = [f"<={b}" for b in _LATENCY_BUCKETS] + [f">{_LATENCY_BUCKETS[-1]}"]
+    with _lock:
+        if _pid != os.getpid():
+            return dict()
+        return {
+            host: dict(
+                requests=s.requests,
+                errors=s.errors,
+                statuses=dict(s.statuses),
+                latency_avg=round(s.total / max(1, s.requests), 6),
+                latency_max=round(s.max, 6),
+                histogram=dict(zip(buckets, s.histogram)),
+            )
+            for host, s in sorted(_stats.items())
+        }
@@ -22,25 +22,44 @@
     This module contains a function that retrieves the URL of an image corresponding to
     a (person) name. It uses a Google API on top of the Google Custom Search feature.
 
-    Retrieved image information is cached in the database.
+    Retrieved image information is cached in the database, and recently
+    used entries also in process memory. Searches that find no images
+    are cached for a shorter time than those that do, and a failed
+    search is not retried for a while. An ImagePrefetcher looks up
+    images for a list of names in the background (see routes/people.py).
 
 """
 
-from typing import List, Dict, NamedTuple, Optional, Sequence, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    FrozenSet,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+    Union,
+)
 
+import os
 import sys
 import json
+import time
+import random
 import logging
-import urllib.request
-import urllib.parse
-from urllib.error import HTTPError
+import threading
 from io import BytesIO
 from datetime import datetime, timedelta
-from contextlib import closing
 
-import requests
+import cachetools
+from sqlalchemy import text
+from sqlalchemy.dialects.postgresql import insert
 
-from db import Session, SessionContext
+import httpclient
+from db import Session, SessionContext, PreparedStatement
 from db.models import Link, BlacklistedLink
 from settings import Settings
 from utility import read_txt_api_key
@@ -52,29 +71,29 @@ QUERY_TIMEOUT = 4.0
 def _server_query(url: str, q: Dict[str, Union[int, str]]) -> Optional[bytes]:
     """Query a server via HTTP GET with a URL-encoded query string."""
     doc = None
-    if len(q):
-        url += "?" + urllib.parse.urlencode(q)
-    try:
-        with closing(urllib.request.urlopen(url, timeout=QUERY_TIMEOUT)) as response:
-            if response:
-                # Decode the HTML Content-type header to obtain the document
-                # type and the charset (content encoding), if specified
-                encoding = "ISO-8859-1"
-                # TODO: Why is this parsing done manually instead of using the stdlib?
-                ctype = response.getheader("Content-type", "")
-                if ";" in ctype:
-                    s = ctype.split(";")
-                    ctype = s[0]
-                    enc = s[1].strip()
-                    s = enc.split("=")
-                    if s[0] == "charset" and len(s) == 2:
-                        encoding = s[1]
-                if ctype == "application/json":
-                    doc = response.read()  # doc is a bytes object
-                    if doc:
-                        doc = doc.decode(encoding)
-    except HTTPError as e:
-        logging.warning(f"server_query exception: {e}")
+    response = httpclient.get(url, params=q, timeout=QUERY_TIMEOUT)
+    if not response.ok:
+        logging.warning(
+            f"server_query exception: HTTP status {response.status_code} "
+            f"{response.reason}"
+        )
+        return None
+    # Decode the HTML Content-type header to obtain the document
+    # type and the charset (content encoding), if specified
+    encoding = "ISO-8859-1"
+    # TODO: Why is this parsing done manually instead of using the stdlib?
+    ctype = response.headers.get("Content-type", "")
+    if ";" in ctype:
+        s = ctype.split(";")
+        ctype = s[0]
+        enc = s[1].strip()
+        s = enc.split("=")
+        if s[0] == "charset" and len(s) == 2:
+            encoding = s[1]
+    if ctype == "application/json":
+        doc = response.content  # doc is a bytes object
+        if doc:
+            doc = doc.decode(encoding)
     return doc
 
 
@@ -87,6 +106,20 @@ _CTYPE = "image-search-"
 # Time (in days) before cached items expire
 _CACHE_EXPIRATION_DAYS = 30
 
+# Time (in days) before cached searches that found no images expire,
+# so that persons who are new in the news get another chance soon
+_EMPTY_EXPIRATION_DAYS = 2
+
+# Time (in seconds) before a failed image search is retried
+_FAILED_RETRY_SECONDS = 15 * 60
+
+# Number of (content type, key) pairs whose links table entries are
+# also cached in process memory, and the time (in seconds) that they
+# are kept there. Changes made by other processes are seen once the
+# entry has left the in-process cache.
+_LINK_CACHE_SIZE = 2048
+_LINK_CACHE_TTL = 10 * 60
+
 # Number of image URLs to fetch and store
 _NUM_IMG_URLS = 6
 
@@ -103,6 +136,169 @@ Img = NamedTuple(
     ],
 )
 
+# A links table entry, with its content parsed, along with
+# the blacklisted image URLs for its key
+CachedLink = NamedTuple(
+    "CachedLink",
+    [
+        ("answer", Dict[str, Any]),
+        ("timestamp", datetime),
+        ("blacklist", FrozenSet[str]),
+    ],
+)
+
+
+# Look up a cached link
+_LINK_LOOKUP = PreparedStatement(
+    "greynir_link_lookup",
+    "select content, timestamp from links where ctype = $1 and key = $2",
+)
+
+# Take a lock that is held by the database connection until it is
+# released, so that only one worker process at a time prefetches images
+_PREFETCH_LOCK = text("select pg_try_advisory_lock(:key)")
+_PREFETCH_UNLOCK = text("select pg_advisory_unlock(:key)")
+_PREFETCH_LOCK_KEY = 0x696D6167  # "imag"
+
+_cache_lock = threading.Lock()
+_link_cache: "cachetools.TTLCache[Tuple[str, str], CachedLink]" = cachetools.TTLCache(
+    _LINK_CACHE_SIZE, _LINK_CACHE_TTL
+)
+# Searches that failed recently, by (content type, key)
+_failed: "cachetools.TTLCache[Tuple[str, str], bool]" = cachetools.TTLCache(
+    1024, _FAILED_RETRY_SECONDS
+)
+_link_cache_hits = 0
+_link_cache_misses = 0
+
+
+def _expiration(answer: Dict[str, Any]) -> timedelta:
+    """Return the time before a cached search result expires"""
+    if answer.get("items"):
+        return timedelta(days=_CACHE_EXPIRATION_DAYS)
+    return timedelta(days=_EMPTY_EXPIRATION_DAYS)
+
+
+def _parse(jdoc: str) -> Dict[str, Any]:
+    try:
+        answer = json.loads(jdoc)
+    except ValueError:
+        return dict()
+    return answer if isinstance(answer, dict) else dict()
+
+
+def _cached_link(session: Session, ctype: str, name: str) -> Optional[CachedLink]:
+    """Look up a cached search result, first in process memory
+    and then in the links table"""
+    global _link_cache_hits, _link_cache_misses
+    key = (ctype, name)
+    with _cache_lock:
+        entry = _link_cache.get(key)
+        if entry is not None:
+            _link_cache_hits += 1
+            return entry
+        _link_cache_misses += 1
+    link = _LINK_LOOKUP.execute(session, ctype, name).first()
+    if link is None or not link.content:
+        return None
+    entry = CachedLink(
+        _parse(link.content),
+        link.timestamp,
+        frozenset(_blacklisted_urls_for_key(name, enclosing_session=session)),
+    )
+    with _cache_lock:
+        _link_cache[key] = entry
+    return entry
+
+
+def _forget(name: str, ctype: Optional[str] = None) -> None:
+    """Remove a key from the in-process caches"""
+    with _cache_lock:
+        for c in (_link_cache, _failed):
+            for key in [k for k in c.keys() if k[1] == name]:
+                if ctype is None or key[0] == ctype:
+                    c.pop(key, None)
+
+
+def _search(name: str, hints: Sequence[str], size: str) -> Optional[str]:
+    """Ask the Google Custom Search API for images of a (person) name.
+    Returns the JSON response, or None if the search failed."""
+    key = read_txt_api_key("GoogleServerKey")
+    if not key:
+        # No API key: can't ask for an image
+        logging.warning("No API key for image lookup")
+        return None
+
+    # Assemble the query parameters
+    search_str = '"{0}" {1}'.format(name, " ".join(hints)).strip()
+    q: Dict[str, Union[str, int]] = dict(
+        q=search_str,
+        num=_NUM_IMG_URLS,
+        start=1,
+        imgSize=size,
+        # imgType = "face",   # Only images with faces
+        lr="lang_is",  # Higher priority for Icelandic language pages
+        gl="is",  # Higher priority for .is results
+        searchType="image",
+        cx=_CX,
+        key=key,
+    )
+    if Settings.DEBUG:
+        print(f"Sending Google image search request for '{search_str}'")
+    try:
+        jdoc = _server_query("https://www.googleapis.com/customsearch/v1", q)
+    except Exception as e:
+        logging.warning(f"Exception in image search for '{search_str}': {e}")
+        jdoc = None
+    if Settings.DEBUG:
+        print(f"Back from Google image search for '{search_str}'")
+    if not jdoc:
+        # Don't repeat the search on every request for a while
+        with _cache_lock:
+            _failed[(_CTYPE + size, name)] = True
+        return None
+    return jdoc
+
+
+def _store(session: Session, ctype: str, name: str, jdoc: str) -> CachedLink:
+    """Store a search result in the links table, replacing any previous
+    one (which another process may have stored meanwhile). The caller
+    should _remember() the result once the session has been committed."""
+    now = datetime.utcnow()
+    stmt = insert(Link).values(ctype=ctype, key=name, content=jdoc, timestamp=now)
+    session.execute(
+        stmt.on_conflict_do_update(
+            index_elements=[Link.ctype, Link.key],
+            set_=dict(content=stmt.excluded.content, timestamp=now),
+        )
+    )
+    entry = CachedLink(
+        _parse(jdoc),
+        now,
+        frozenset(_blacklisted_urls_for_key(name, enclosing_session=session)),
+    )
+    return entry
+
+
+def _remember(ctype: str, name: str, entry: CachedLink) -> None:
+    """Cache a stored search result in process memory"""
+    with _cache_lock:
+        _link_cache[(ctype, name)] = entry
+
+
+def _image_from(entry: CachedLink, name: str, thumb: bool) -> Optional[Img]:
+    """Return the first image in a search result that is not blacklisted"""
+    for item in entry.answer.get("items") or []:
+        if "link" not in item:
+            continue
+        k = item["link"] if not thumb else item["image"]["thumbnailLink"]
+        if k and item["link"] not in entry.blacklist:
+            image = item["image"]
+            h = image["height"] if not thumb else image["thumbnailHeight"]
+            w = image["width"] if not thumb else image["thumbnailWidth"]
+            return Img(k, w, h, image["contextLink"], item["displayLink"], name)
+    return None
+
 
 def get_image_url(
     name: str,
@@ -114,85 +310,143 @@ def get_image_url(
     cache_only: bool = False,
 ) -> Optional[Img]:
     """Use Google Custom Search API to obtain an image corresponding to a (person) name."""
-    jdoc = None
     ctype = _CTYPE + size
+    stored: Optional[CachedLink] = None
 
     with SessionContext(commit=True, session=enclosing_session) as session:
-        link = (
-            session.query(Link.content, Link.timestamp)
-            .filter(Link.ctype == ctype)
-            .filter(Link.key == name)
-            .one_or_none()
-        )
-        if link is not None:
-            # Found in cache. If the result is old, purge it
-            period = timedelta(days=_CACHE_EXPIRATION_DAYS)
-            expired = datetime.utcnow() - link.timestamp > period
-            if expired and not cache_only:
-                _purge_single(name, ctype=ctype, enclosing_session=session)
-            else:
-                jdoc = link.content
-
-        if not jdoc and cache_only:
+        entry = _cached_link(session, ctype, name)
+        if entry is None and cache_only:
             return None
 
-        if not jdoc:
-            # Not found in cache: prepare to ask Google
-            key = read_txt_api_key("GoogleServerKey")
-            if not key:
-                # No API key: can't ask for an image
-                logging.warning("No API key for image lookup")
-                return None
-
-            # Assemble the query parameters
-            search_str = '"{0}" {1}'.format(name, " ".join(hints)).strip()
-            q: Dict[str, Union[str, int]] = dict(
-                q=search_str,
-                num=_NUM_IMG_URLS,
-                start=1,
-                imgSize=size,
-                # imgType = "face",   # Only images with faces
-                lr="lang_is",  # Higher priority for Icelandic language pages
-                gl="is",  # Higher priority for .is results
-                searchType="image",
-                cx=_CX,
-                key=key,
-            )
-            if Settings.DEBUG:
-                print(f"Sending Google image search request for '{search_str}'")
-            jdoc = _server_query("https://www.googleapis.com/customsearch/v1", q)
-            if Settings.DEBUG:
-                print(f"Back from Google image search for '{search_str}'")
+        if entry is None or (
+            not cache_only
+            and datetime.utcnow() - entry.timestamp > _expiration(entry.answer)
+        ):
+            # Not found in cache, or the result is old: ask Google,
+            # unless a recent search failed
+            with _cache_lock:
+                failed = (ctype, name) in _failed
+            jdoc = None if failed else _search(name, hints, size)
             if jdoc:
-                # Store in the cache
-                lnk = Link(
-                    ctype=ctype, key=name, content=jdoc, timestamp=datetime.utcnow()
-                )
-                session.add(lnk)
+                entry = stored = _store(session, ctype, name, jdoc)
+            # If the search failed, an old result is better than none
 
-        if not jdoc:
-            return None
+    if stored is not None:
+        _remember(ctype, name, stored)
 
-        answer = json.loads(jdoc)
+    if entry is None:
+        # No answer that makes sense
+        return None
 
-        if (
-            answer
-            and "items" in answer
-            and answer["items"]
-            and "link" in answer["items"][0]
-        ):
-            blacklist = _blacklisted_urls_for_key(name, enclosing_session=session)
+    return _image_from(entry, name, thumb)
+
+
+class ImagePrefetcher:
+    """Looks up images for a list of names, such as the persons most
+    mentioned in recent articles, periodically in a background thread,
+    so that they are cached before a query or page view asks for them"""
+
+    def __init__(
+        self,
+        names: Callable[[], Iterable[str]],
+        *,
+        interval: float,
+        size: str = "large",
+    ) -> None:
+        # Returns the names to prefetch images for
+        self._names = names
+        # Time, in seconds, between prefetches (0 to disable)
+        self._interval = interval
+        self._size = size
+        self._pid = 0
+        self._rounds = 0
+        self._fetched = 0
+        self._last = 0.0
+
+    def start(self) -> None:
+        """Start the background thread, if not already
+        running in this process"""
+        if self._interval <= 0 or self._pid == os.getpid():
+            return
+        self._pid = os.getpid()
+        threading.Thread(target=self._run, name="ImagePrefetcher", daemon=True).start()
+
+    def _run(self) -> None:
+        # Spread the worker processes' prefetches over the interval
+        time.sleep(random.uniform(0.0, self._interval))
+        while True:
+            try:
+                self.prefetch()
+            except Exception as e:
+                logging.warning(f"Exception when prefetching images: {e}")
+            time.sleep(self._interval)
+
+    def prefetch(self) -> int:
+        """Look up images for the names that are not cached, or whose
+        cached result expires before the next prefetch. Returns the
+        number of searches made, or -1 if another process is already
+        prefetching."""
+        if not read_txt_api_key("GoogleServerKey"):
+            return 0
+        db = SessionContext.db
+        with db.autocommit_connection() as conn:
+            lock = conn.execute(_PREFETCH_LOCK, dict(key=_PREFETCH_LOCK_KEY))
+            if not lock.scalar():
+                return -1
+            try:
+                fetched = self._fetch()
+            finally:
+                conn.execute(_PREFETCH_UNLOCK, dict(key=_PREFETCH_LOCK_KEY))
+        self._rounds += 1
+        self._fetched += fetched
+        self._last = time.time()
+        return fetched
+
+    def _fetch(self) -> int:
+        """Make the searches of a prefetch, storing each result in its own
+        transaction, so that no transaction is open during a search"""
+        ctype = _CTYPE + self._size
+        margin = timedelta(seconds=self._interval)
+        fetched = 0
+        for name in self._names():
+            with SessionContext() as session:
+                entry = _cached_link(session, ctype, name)
+            if entry is not None and (
+                datetime.utcnow() - entry.timestamp < _expiration(entry.answer) - margin
+            ):
+                continue
+            with _cache_lock:
+                if (ctype, name) in _failed:
+                    continue
+            jdoc = _search(name, (), self._size)
+            if jdoc:
+                with SessionContext(commit=True) as session:
+                    entry = _store(session, ctype, name, jdoc)
+                _remember(ctype, name, entry)
+                fetched += 1
+        return fetched
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the number of prefetches and searches made by this process"""
+        return dict(
+            pid=self._pid,
+            rounds=self._rounds,
+            fetched=self._fetched,
+            last=datetime.utcfromtimestamp(self._last).isoformat()
+            if self._last
+            else None,
+        )
 
-            for item in answer["items"]:
-                k = item["link"] if not thumb else item["image"]["thumbnailLink"]
-                if k and item["link"] not in blacklist:
-                    image = item["image"]
-                    h = image["height"] if not thumb else image["thumbnailHeight"]
-                    w = image["width"] if not thumb else image["thumbnailWidth"]
-                    return Img(k, w, h, image["contextLink"], item["displayLink"], name)
 
-    # No answer that makes sense
-    return None
+def image_metrics() -> Dict[str, Any]:
+    """Return the size and hit rate of the in-process image link cache"""
+    with _cache_lock:
+        return dict(
+            size=len(_link_cache),
+            hits=_link_cache_hits,
+            misses=_link_cache_misses,
+            failed=len(_failed),
+        )
 
 
 def blacklist_image_url(name: str, url: str) -> Optional[Img]:
@@ -212,6 +466,7 @@ def blacklist_image_url(name: str, url: str) -> Optional[Img]:
             key=name, url=url, link_type="image", timestamp=datetime.utcnow()
         )
         session.add(b)
+        _forget(name)
 
         return get_image_url(name, enclosing_session=session)
 
@@ -235,10 +490,9 @@ def update_broken_image_url(name: str, url: str) -> Optional[Img]:
 
 def check_image_url(url: str) -> bool:
     """Check if image exists at URL by sending HEAD request."""
-    req = urllib.request.Request(url, method="HEAD")
     try:
-        response = urllib.request.urlopen(req, timeout=QUERY_TIMEOUT)
-        return response.status == 200
+        response = httpclient.head(url, timeout=QUERY_TIMEOUT, allow_redirects=True)
+        return response.status_code == 200
     except Exception:
         pass
 
@@ -285,6 +539,7 @@ def _purge_single(
             filters.append(Link.ctype == ctype)
 
         session.query(Link).filter(*filters).delete()
+        _forget(key, ctype)
 
 
 def _purge() -> None:
@@ -292,6 +547,9 @@ def _purge() -> None:
     if input("Purge all cached data? (y/n): ").lower().startswith("y"):
         with SessionContext(commit=True) as session:
             session.query(Link).delete()
+        with _cache_lock:
+            _link_cache.clear()
+            _failed.clear()
 
 
 STATICMAP_URL = (
@@ -316,7 +574,7 @@ def get_staticmap_image(
 
     url = STATICMAP_URL.format(zoom, width, height, key, latitude, longitude)
     try:
-        r = requests.get(url, stream=True, timeout=10)
+        r = httpclient.get(url, stream=True, timeout=10)
     except Exception as e:
         logging.warning(f"Exception fetching {url}: {e}")
         return None
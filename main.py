@@ -52,11 +52,15 @@ from dotenv import load_dotenv
 
 import reynir
 from reynir.bindb import GreynirBin
-from reynir.fastparser import Fast_Parser
 
 from settings import Settings, ConfigError
+from db import GreynirDB
 from article import Article as ArticleProxy
+from warmup import warm_up, skip_warm_up
+from queries.util.sources import use_shared_cache
+from querylog import query_log
 from utility import (
+    GREYNIR_ROOT_DIR,
     CONFIG_DIR,
     QUERIES_DIALOGUE_DIR,
     QUERIES_GRAMMAR_DIR,
@@ -96,9 +100,23 @@ app.config["TEMPLATES_AUTO_RELOAD"] = not RUNNING_AS_SERVER
 app.app_context().push()
 
 # Set up caching
-# Caching is disabled if app is invoked via the command line
-cache_type = "SimpleCache" if RUNNING_AS_SERVER else "null"
-app.config["CACHE"] = Cache(app, config={"CACHE_TYPE": cache_type})
+# Caching is disabled if app is invoked via the command line.
+# When running as a server, the cache is shared by all worker
+# processes and persists across restarts (see sharedcache.py). It is
+# kept in a directory that only the server's user can access.
+cache_type = "sharedcache.SQLiteCache" if RUNNING_AS_SERVER else "null"
+cache_dir = ENV.get("GREYNIR_CACHE_DIR") or str(GREYNIR_ROOT_DIR / "cache")
+app.config["CACHE"] = Cache(
+    app,
+    config={"CACHE_TYPE": cache_type, "CACHE_DIR": cache_dir},
+)
+if RUNNING_AS_SERVER:
+    # Data that query modules fetch from external services is also
+    # shared by the worker processes (see queries/util/sources.py)
+    use_shared_cache(app.config["CACHE"].cache)
+    # Clearing a client's query history also discards the
+    # client's queries buffered by other workers (see querylog.py)
+    query_log.use_shared_cache(app.config["CACHE"].cache)
 
 # Register blueprint routes
 from routes import routes, max_age  # type: ignore
@@ -206,6 +224,9 @@ except ConfigError as e:
     logging.error(f"Greynir did not start due to a configuration error: {e}")
     sys.exit(1)
 
+# Configure the database connection pool for serving concurrent requests
+GreynirDB.configure("web")
+
 if Settings.DEBUG:
     print(
         "\nStarting Greynir web app at {0} with debug={1}, "
@@ -227,6 +248,10 @@ if Settings.DEBUG:
 
 
 if not RUNNING_AS_SERVER:
+    # The development server loads data lazily, on the first request,
+    # so that it restarts quickly; there is no warm-up to wait for
+    skip_warm_up()
+
     if ENV.get("GREYNIR_ATTACH_PTVSD"):
         # Attach to the VSCode PTVSD debugger, enabling remote debugging via SSH
         # import ptvsd
@@ -318,6 +343,8 @@ else:
     print(log_str)
     sys.stdout.flush()
 
-    # Running as a server module: pre-load the grammar into memory
-    with Fast_Parser() as _:
-        pass
+    # Running as a server module: load the parser, BÍN and the
+    # query modules now rather than on the first request. Under Gunicorn
+    # with preload_app, this happens once in the master process and the
+    # loaded data is shared with the forked workers.
+    warm_up()
@@ -29,7 +29,7 @@
 
 """
 
-from typing import DefaultDict, List, Iterator, Dict, Union, Tuple, Optional, Type
+from typing import DefaultDict, List, Iterator, Dict, Union, Tuple, Optional, Type, cast
 
 from collections import defaultdict
 import logging
@@ -38,10 +38,23 @@ from tokenizer import TOK, Tok
 from tokenizer.abbrev import Abbreviations
 from reynir.bindb import GreynirBin
 
-from db import SessionContext, OperationalError, Session
+from db import SessionContext, OperationalError, Session, PreparedStatement
 from db.models import Entity
 
 
+# Entities whose names are or start with the given word(s)
+_FETCH_ENTITIES_FUZZY = PreparedStatement(
+    "greynir_fetch_entities_fuzzy",
+    "select name, verb, definition from entities where name like $1 or name = $2",
+)
+
+# Entities whose names are exactly the given word(s)
+_FETCH_ENTITIES = PreparedStatement(
+    "greynir_fetch_entities",
+    "select name, verb, definition from entities where name = $1",
+)
+
+
 def recognize_entities(
     token_stream: Iterator[Tok],
     enclosing_session: Optional[Session] = None,
@@ -72,12 +85,11 @@ def recognize_entities(
             """Return a list of entities matching the word(s) given,
             exactly if fuzzy = False, otherwise also as a starting word(s)"""
             try:
-                q = session.query(Entity.name, Entity.verb, Entity.definition)
                 if fuzzy:
-                    q = q.filter(Entity.name.like(w + " %") | (Entity.name == w))
+                    q = _FETCH_ENTITIES_FUZZY.execute(session, w + " %", w)
                 else:
-                    q = q.filter(Entity.name == w)
-                return q.all()
+                    q = _FETCH_ENTITIES.execute(session, w)
+                return cast(List[Entity], q.all())
             except OperationalError as e:
                 logging.warning(f"SQL error in fetch_entities(): {e}")
                 return []
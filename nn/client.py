@@ -30,8 +30,8 @@ from typing import Optional, Dict, Any, List, Union
 import json
 
 from flask import abort
-import requests
 
+import httpclient
 from settings import Settings
 
 
@@ -99,16 +99,16 @@ class ApiClient:
     def get(self, data):
         """Handler for GET requests"""
         assert self._url is not None
-        response = requests.get(
-            self._url, json.dumps(data), headers=self.headers, timeout=10
+        response = httpclient.get(
+            self._url, params=json.dumps(data), headers=self.headers, timeout=10
         )
         return json.loads(response.text)
 
     def post(self, data):
         """Handler for POST requests"""
         assert self._url is not None
-        response = requests.post(
-            self._url, json.dumps(data), headers=self.headers, timeout=10
+        response = httpclient.post(
+            self._url, data=json.dumps(data), headers=self.headers, timeout=10
         )
         return response.text
 
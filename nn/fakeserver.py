@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+"""
+    Greynir: Natural language processing for Icelandic
+
+    Fake neural network server
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module implements a stand-in for the middleware neural network
+    server that the clients in nn/nnclient.py connect to, for testing
+    them without the model servers. It answers /parse.api requests with
+    a flat parse tree that marks every token as an adverb, and
+    /translate.api requests with the input text in upper case. The
+    requests it receives are recorded, so that tests can check how
+    sentences were batched.
+
+    Usage: python -m nn.fakeserver [-p PORT] [-d DELAY]
+
+"""
+
+from typing import Any, Dict, List, Optional
+
+import json
+import time
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _predict(verb: str, sent: str) -> Dict[str, Any]:
+    """Return a made-up prediction for a single sentence"""
+    if verb == "parse":
+        terminals = " ".join("ao" for _ in sent.split())
+        return dict(outputs=f"P S0 ADVP {terminals} /ADVP /S0 /P", scores=[0.5])
+    return dict(outputs=sent.upper(), scores="0.5")
+
+
+class FakeNnServer:
+    """A local HTTP server that answers parse and translate requests"""
+
+    def __init__(
+        self, host: str = "127.0.0.1", port: int = 0, delay: float = 0.0
+    ) -> None:
+        # Time, in seconds, that each request takes
+        self.delay = delay
+        # The sentences of each request received, by verb
+        self.requests: Dict[str, List[List[str]]] = dict()
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+
+            def do_POST(self) -> None:
+                verb = self.path.strip("/").rsplit(".", 1)[0]
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length))
+                pgs = payload.get("pgs") or []
+                with server._lock:
+                    server.requests.setdefault(verb, []).append(list(pgs))
+                if server.delay:
+                    time.sleep(server.delay)
+                if verb in ("parse", "translate"):
+                    status = 200
+                    body = dict(predictions=[_predict(verb, s) for s in pgs])
+                else:
+                    status = 404
+                    body = dict(error=f"Unknown verb {verb}")
+                data = json.dumps(body).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        self.host, self.port = self._server.server_address[0:2]
+
+    def start(self) -> "FakeNnServer":
+        """Serve requests in a background thread"""
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, name="FakeNnServer", daemon=True
+        )
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self) -> "FakeNnServer":
+        return self.start()
+
+    def __exit__(self, *args: Any) -> None:
+        self.stop()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Fake neural network server")
+    parser.add_argument("-p", "--port", type=int, default=9000, help="port number")
+    parser.add_argument(
+        "-d",
+        "--delay",
+        type=float,
+        default=0.0,
+        help="time, in seconds, that each request takes",
+    )
+    args = parser.parse_args()
+    server = FakeNnServer(port=args.port, delay=args.delay)
+    print(f"Fake neural network server listening on port {server.port}")
+    try:
+        server._server.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -24,14 +24,29 @@
     neural network server (see nnserver/nnserver.py), which in turn
     connects to a TensorFlow model server.
 
+    Single sentences that are requested concurrently, e.g. by several
+    /nnparse.api requests, are coalesced into one batched request to the
+    server (see MicroBatcher). Longer texts are split into batches that
+    are sent concurrently, over the connections kept alive by httpclient.
+    The server's predictions are cached per (normalized) sentence, so a
+    sentence that was recently requested is not sent again.
+
+    For testing without the model servers, see nn/fakeserver.py.
+
 """
 
 from typing import List, Optional
 
+import os
+import copy
 import json
-import requests
 import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import cachetools
 
+import httpclient
 from settings import Settings
 import tokenizer
 
@@ -42,6 +57,73 @@ from reynir.binparser import BIN_Token
 from reynir import bintokenizer
 
 
+class _Batch:
+    """Sentences that are sent to the server in one request"""
+
+    __slots__ = ("sents", "data", "full", "done", "results", "error")
+
+    def __init__(self, data):
+        self.sents = []
+        self.data = data
+        # Set when no more sentences can join the batch
+        self.full = threading.Event()
+        # Set when the results (or an error) are in
+        self.done = threading.Event()
+        self.results = None
+        self.error = None
+
+
+class MicroBatcher:
+    """Coalesces single sentences that are submitted concurrently into
+    batches of at most max_size sentences. The first sentence of a batch
+    waits up to max_delay seconds for others to join it, and its caller
+    then sends the batch on behalf of all of them."""
+
+    def __init__(self, send, *, max_size, max_delay):
+        # Called with a list of sentences and the request data,
+        # returns a list of results
+        self._send = send
+        self._max_size = max_size
+        self._max_delay = max_delay
+        self._lock = threading.Lock()
+        # The batch that is open for new sentences, by request data
+        self._open = dict()
+        self.batches = 0
+        self.sentences = 0
+
+    def submit(self, sent, data=None):
+        """Return the result for a single sentence"""
+        key = json.dumps(data, sort_keys=True)
+        with self._lock:
+            batch = self._open.get(key)
+            leader = batch is None
+            if leader:
+                batch = self._open[key] = _Batch(data)
+            ix = len(batch.sents)
+            batch.sents.append(sent)
+            if len(batch.sents) >= self._max_size:
+                del self._open[key]
+                batch.full.set()
+        if leader:
+            batch.full.wait(self._max_delay)
+            with self._lock:
+                if self._open.get(key) is batch:
+                    del self._open[key]
+                self.batches += 1
+                self.sentences += len(batch.sents)
+            try:
+                batch.results = self._send(batch.sents, batch.data)
+            except Exception as e:
+                batch.error = e
+            finally:
+                batch.done.set()
+        else:
+            batch.done.wait()
+        if batch.error is not None:
+            raise batch.error
+        return batch.results[ix]
+
+
 class NnClient:
     """A client that connects to the HTTP REST interface of
     a tensorflow model server (using plaintext)"""
@@ -50,6 +132,22 @@ class NnClient:
     host = None  # type: Optional[str]
     verb = None  # type: Optional[str]
 
+    # Maximum number of sentences per request to the server
+    batch_size = 32
+    # Time, in seconds, that a single sentence waits for others
+    # to join its batch (0 to send it right away)
+    batch_delay = 0.005
+    # Maximum number of requests sent concurrently for one text
+    max_concurrent = 4
+    # Timeout, in seconds, of each request to the server
+    timeout = 10
+
+    # Predictions of recently requested sentences, shared by all clients
+    _cache = cachetools.TTLCache(4096, 3600)
+    _cache_lock = threading.Lock()
+    _executor = None
+    _executor_pid = 0
+
     @classmethod
     def request_sentence(cls, text):
         """Request neural network output for a single sentence"""
@@ -61,7 +159,7 @@ class NnClient:
         raise NotImplementedError
 
     @classmethod
-    def _request(cls, pgs, data=None):
+    def _post(cls, pgs, data=None):
         """Send serialized request to remote model server"""
         url = "http://{host}:{port}/{verb}.api".format(
             host=cls.host, port=cls.port, verb=cls.verb
@@ -74,18 +172,108 @@ class NnClient:
 
         logging.debug(str(payload))
         payload_json = json.dumps(payload)
-        resp = requests.post(url, data=payload_json, headers=headers, timeout=10)
+        resp = httpclient.post(
+            url, data=payload_json, headers=headers, timeout=cls.timeout
+        )
         resp.raise_for_status()
 
         obj = json.loads(resp.text)
-        if obj.get("predictions") is None:
+        predictions = obj.get("predictions")
+        if predictions is None or len(predictions) != len(pgs):
             raise ValueError("Invalid request or batch size too large")
-        predictions = obj["predictions"]
+        return predictions
+
+    @classmethod
+    def _get_executor(cls):
+        """Return the thread pool of this process for concurrent requests"""
+        with NnClient._cache_lock:
+            if NnClient._executor is None or NnClient._executor_pid != os.getpid():
+                NnClient._executor = ThreadPoolExecutor(
+                    max_workers=cls.max_concurrent, thread_name_prefix="NnClient"
+                )
+                NnClient._executor_pid = os.getpid()
+            return NnClient._executor
+
+    @classmethod
+    def _predict(cls, pgs, data=None):
+        """Return the server's predictions for a list of sentences,
+        from the cache if available, and otherwise by sending them in
+        batches of at most batch_size sentences, concurrently"""
+        pgs = list(pgs)
+        dkey = json.dumps(data, sort_keys=True)
+        predictions = [None] * len(pgs)
+        # Indices of the sentences that are not cached, by sentence
+        missing = dict()
+        with NnClient._cache_lock:
+            for ix, sent in enumerate(pgs):
+                inst = NnClient._cache.get((cls.verb, dkey, sent))
+                if inst is None:
+                    missing.setdefault(sent, []).append(ix)
+                else:
+                    predictions[ix] = inst
+        if missing:
+            sents = list(missing)
+            chunks = [
+                sents[i : i + cls.batch_size]
+                for i in range(0, len(sents), cls.batch_size)
+            ]
+            if len(chunks) == 1:
+                results = [cls._post(chunks[0], data)]
+            else:
+                results = cls._get_executor().map(
+                    lambda chunk: cls._post(chunk, data), chunks
+                )
+            for chunk, chunk_predictions in zip(chunks, results):
+                with NnClient._cache_lock:
+                    for sent, inst in zip(chunk, chunk_predictions):
+                        NnClient._cache[(cls.verb, dkey, sent)] = inst
+                        for ix in missing[sent]:
+                            predictions[ix] = inst
+        return predictions
+
+    @classmethod
+    def _batcher(cls):
+        """Return the micro-batcher of this client class"""
+        batcher = cls.__dict__.get("_micro_batcher")
+        if batcher is None:
+            with NnClient._cache_lock:
+                batcher = cls.__dict__.get("_micro_batcher")
+                if batcher is None:
+                    batcher = MicroBatcher(
+                        cls._predict,
+                        max_size=cls.batch_size,
+                        max_delay=cls.batch_delay,
+                    )
+                    cls._micro_batcher = batcher
+        return batcher
+
+    @classmethod
+    def _request(cls, pgs, data=None):
+        """Send sentences to the remote model server
+        and return the processed results"""
+        pgs = list(pgs)
+        if len(pgs) == 1 and cls.batch_delay > 0:
+            # Coalesce with concurrent requests for single sentences
+            predictions = [cls._batcher().submit(pgs[0], data)]
+        else:
+            predictions = cls._predict(pgs, data)
+        # Processing may modify the prediction, which is also cached
         return [
-            cls._process_response(inst, sent)
-            for (inst, sent) in zip(predictions, list(pgs))
+            cls._process_response(copy.deepcopy(inst), sent)
+            for (inst, sent) in zip(predictions, pgs)
         ]
 
+    @classmethod
+    def metrics(cls):
+        """Return the number of cached predictions and the number
+        of batches and sentences sent by the micro-batcher"""
+        batcher = cls.__dict__.get("_micro_batcher")
+        return dict(
+            cached=len(NnClient._cache),
+            batches=batcher.batches if batcher is not None else 0,
+            sentences=batcher.sentences if batcher is not None else 0,
+        )
+
     @classmethod
     def _process_response(cls, instance, sent):
         """Process the response from a single sentence.
@@ -141,7 +329,7 @@ class TranslateClient(NnClient):
         pg_map, sent_map = index_text(text)
         sents = list(sent_map.values())
         data = dict(src_lang=src_lang, tgt_lang=tgt_lang)
-        result = TranslateClient._request(sents, data=data)
+        result = cls._request(sents, data=data)
         inst_map = {idx: inst for (idx, inst) in enumerate(result)}
         resp = dict(pgs=pg_map, results=inst_map)
         return resp
@@ -158,7 +346,7 @@ class TranslateClient(NnClient):
                 if not verbatim
                 else list(sent_map.values())
             )
-            result = TranslateClient._request(sents, data=data)
+            result = cls._request(sents, data=data)
             inst_map = {idx: inst for (idx, inst) in zip(sent_map.keys(), result)}
             resp = dict(results=inst_map)
         else:
@@ -167,7 +355,7 @@ class TranslateClient(NnClient):
                 if not verbatim
                 else sent_map
             )
-            result = TranslateClient._request(sents, data=data)
+            result = cls._request(sents, data=data)
             inst_map = {idx: inst for (idx, inst) in enumerate(result)}
             resp = dict(results=inst_map)
         return resp
@@ -52,6 +52,7 @@ from pathlib import Path
 from settings import Settings, ConfigError
 from db import GreynirDB, Session
 from db.models import Article, Person, Column, DateTime
+from db.sql import ArticleStatsRollup
 from tree import Tree, ProcEnv, TreeStateDict
 from treeutil import PgsList
 from utility import modules_in_dir
@@ -380,6 +381,13 @@ def process_articles(
             del proc
         Processor.cleanup()
 
+    # Person mentions by gender are included in the daily article statistics
+    try:
+        days = ArticleStatsRollup.update()
+        print(f"Article statistics updated for {days} day(s)")
+    except Exception as e:
+        print(f"Exception when updating article statistics: {e}")
+
     t1 = time.time()
 
     print("\n------ Processing completed -------")
@@ -503,6 +511,9 @@ def _main(argv: Optional[List[str]] = None) -> int:
                 # Limit the number of workers
                 num_workers = int(a) if int(a) else None
 
+        # Configure the database connection pool for the processor processes
+        GreynirDB.configure("processor")
+
         if init:
             # Initialize the database
             init_db()
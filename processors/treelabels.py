@@ -0,0 +1,64 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Processor module to index sentence tree labels
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This processor stores the labels (nonterminals, terminal categories
+    and lemmas) of each sentence tree in an article in the treelabels
+    table, an inverted index used by Article.all_matches() to find
+    candidate sentences for tree pattern searches (see treeindex.py).
+
+    The processor does not traverse the sentence trees itself; the
+    labels are collected from the article's simple trees at the end
+    of article processing.
+
+"""
+
+from db.models import Article
+from tree import TreeStateDict, Node
+from treeindex import store_labels
+
+
+MODULE_NAME = __name__
+PROCESSOR_TYPE = "tree"
+
+
+def article_begin(state: TreeStateDict) -> None:
+    """Called at the beginning of article processing"""
+    pass
+
+
+def article_end(state: TreeStateDict) -> None:
+    """Called at the end of article processing"""
+
+    session = state["session"]  # Database session
+    url = state["url"]  # URL of the article being processed
+    tree = state.get("tree")
+    if tree is None:
+        return
+    article_id = session.query(Article.id).filter(Article.url == url).scalar()
+    if article_id is None:
+        return
+    # Replace any previously stored labels for this article
+    store_labels(session, article_id, tree.simple_trees())
+
+
+def visit(state: TreeStateDict, node: Node) -> bool:
+    """Don't traverse the sentence trees; see article_end()"""
+    return False
@@ -44,10 +44,14 @@ from typing import (
 )
 from typing_extensions import Protocol, Literal
 
-from types import FunctionType, ModuleType
+from types import FunctionType, ModuleType, SimpleNamespace
 
+import os
+import glob
+import hashlib
 import importlib
 import logging
+from time import perf_counter
 from datetime import datetime, timedelta
 import json
 import re
@@ -55,7 +59,7 @@ import random
 from collections import defaultdict, ChainMap
 
 from tokenizer import BIN_Tuple, detokenize
-from reynir import TOK, Tok, tokenize
+from reynir import TOK, Tok, tokenize, __version__ as reynir_version
 from reynir.fastparser import (
     Fast_Parser,
     ParseForestDumper,
@@ -72,13 +76,14 @@ from settings import Settings
 
 from queries.util import read_grammar_file
 
-from db import SessionContext, Session, desc
-from db.models import Query as QueryRow, QueryClientData, QueryLog
+from db import SessionContext, Session, PreparedStatement, desc
+from db.models import Query as QueryRow, QueryClientData
 
 from tree import ProcEnv, Tree, TreeStateDict, Node
 
 # from nertokenizer import recognize_entities
 from images import get_image_url
+from querylog import query_log
 from utility import QUERIES_DIR, modules_in_dir, QUERIES_UTIL_DIR
 from geo import LatLonTuple
 
@@ -148,19 +153,31 @@ class QueryGrammar(BIN_Grammar):
 
     """A subclass of BIN_Grammar that reads its input from
     strings obtained from query handler plug-ins in the
-    queries subdirectory, prefixed by a preamble"""
+    queries subdirectory, prefixed by a preamble.
+
+    The binary form of the query grammar is stored in a file whose
+    name contains a hash of the entire grammar text, i.e. the main
+    grammar file, the preamble and all grammar fragments. It is only
+    written if no binary file for the same grammar text exists, so
+    processes that start up with an unchanged set of query handlers
+    (such as web server workers) share a single binary grammar file."""
 
     def __init__(self) -> None:
         super().__init__()
         # Enable the 'include_queries' condition
         self.set_conditions({"include_queries"})
+        # The binary grammar file corresponding to the grammar text
+        self.binary_fname: Optional[str] = None
 
-    @classmethod
-    def is_grammar_modified(cls) -> bool:
-        """Override inherited function to specify that query grammars
-        should always be reparsed, since the set of plug-in query
-        handlers may have changed, as well as their grammar fragments."""
-        return True
+    @staticmethod
+    def binary_file_name(base_fname: str, lines: Iterable[str]) -> str:
+        """Return the name of the binary grammar file for the given
+        grammar text, e.g. Greynir.grammar.query.0123456789abcdef.bin"""
+        h = hashlib.sha256(reynir_version.encode("utf-8"))
+        for line in lines:
+            h.update(line.encode("utf-8"))
+            h.update(b"\n")
+        return "{0}.{1}.bin".format(base_fname, h.hexdigest()[0:16])
 
     def read(
         self, fname: str, verbose: bool = False, binary_fname: Optional[str] = None
@@ -169,39 +186,55 @@ class QueryGrammar(BIN_Grammar):
         text from a file as well as additional grammar fragments
         from query processor modules."""
 
-        def grammar_generator() -> Iterator[str]:
-            """A generator that yields a grammar file, line-by-line,
-            followed by grammar additions coming from a string
-            that has been coalesced from grammar fragments in query
-            processor modules."""
+        t0 = perf_counter()
+        try:
             with open(fname, "r", encoding="utf-8") as inp:
                 # Read grammar file line-by-line
-                for line in inp:
-                    yield line
-            # Yield the query grammar preamble
-            grammar_preamble = _QUERY_ROOT_GRAMMAR.split("\n")
-            for line in grammar_preamble:
-                yield line
-            # Yield grammar additions from plug-ins, if any
-            grammar_additions = QueryParser.grammar_additions().split("\n")
-            for line in grammar_additions:
-                yield line
+                lines = [line.rstrip("\n") for line in inp]
+        except (IOError, OSError):
+            raise GrammarError("Unable to open or read grammar file", fname, 0)
+        # Add the query grammar preamble
+        lines.extend(_QUERY_ROOT_GRAMMAR.split("\n"))
+        # Add grammar additions from plug-ins, if any
+        lines.extend(QueryParser.grammar_additions().split("\n"))
+
+        # Parse the grammar text; the binary file, if any, is handled below
+        self.read_from_generator(fname, iter(lines), verbose)
+        t1 = perf_counter()
+        if binary_fname is None:
+            return
 
+        self.binary_fname = self.binary_file_name(binary_fname, lines)
+        if os.path.exists(self.binary_fname):
+            logging.info(
+                "Query grammar parsed in {0:.2f} sec; reusing binary grammar {1}".format(
+                    t1 - t0, os.path.basename(self.binary_fname)
+                )
+            )
+            return
+        # Write the binary file under a temporary name, then rename it,
+        # so that concurrently starting processes never see a partially
+        # written file (they may both write it, but the result is the same)
+        tmp_fname = "{0}.{1}.tmp".format(self.binary_fname, os.getpid())
         try:
-            # Note that if Settings.DEBUG is True, we always write a fresh
-            # binary grammar file, regardless of file timestamps. This helps
-            # in query development, as query grammar fragment strings may change
-            # without any .grammar source file change (which is the default
-            # trigger for generating new binary grammar files).
-            self.read_from_generator(
-                fname,
-                grammar_generator(),
-                verbose,
-                binary_fname,
-                force_new_binary=Settings.DEBUG,
+            self._write_binary(tmp_fname)
+            os.replace(tmp_fname, self.binary_fname)
+        finally:
+            if os.path.exists(tmp_fname):
+                os.remove(tmp_fname)
+        # Remove binary files for other versions of the query grammar
+        for stale in glob.glob(glob.escape(binary_fname) + "*.bin"):
+            if stale != self.binary_fname:
+                try:
+                    os.remove(stale)
+                except OSError:
+                    pass
+        logging.info(
+            "Query grammar parsed in {0:.2f} sec; "
+            "wrote binary grammar {1} in {2:.2f} sec".format(
+                t1 - t0, os.path.basename(self.binary_fname), perf_counter() - t1
             )
-        except (IOError, OSError):
-            raise GrammarError("Unable to open or read grammar file", fname, 0)
+        )
 
 
 class QueryParser(Fast_Parser):
@@ -212,7 +245,10 @@ class QueryParser(Fast_Parser):
     # adding the forward slash ('/')
     _UNDERSTOOD_PUNCTUATION = BIN_Token._UNDERSTOOD_PUNCTUATION + "+/"
 
-    _GRAMMAR_BINARY_FILE = Fast_Parser._GRAMMAR_FILE + ".query.bin"
+    # Base name of the binary query grammar file; the actual file name
+    # includes a hash of the grammar text (see QueryGrammar)
+    _GRAMMAR_BINARY_BASE = Fast_Parser._GRAMMAR_FILE + ".query"
+    _GRAMMAR_BINARY_FILE = _GRAMMAR_BINARY_BASE + ".bin"
 
     # Keep a separate grammar class instance and time stamp for
     # QueryParser. This Python sleight-of-hand overrides
@@ -238,6 +274,18 @@ class QueryParser(Fast_Parser):
     def grammar_additions(cls) -> str:
         return cls._grammar_additions
 
+    @classmethod
+    def _load_grammar(cls, verbose: bool, ts: Optional[float]) -> BIN_Grammar:
+        """Load the query grammar, pointing the parser
+        to the binary grammar file that corresponds to it"""
+        # Override the inherited class attribute temporarily, to supply the
+        # base name of the binary file to QueryGrammar.read()
+        cls._GRAMMAR_BINARY_FILE = cls._GRAMMAR_BINARY_BASE
+        g = cast(QueryGrammar, super()._load_grammar(verbose, ts))
+        assert g.binary_fname is not None
+        cls._GRAMMAR_BINARY_FILE = g.binary_fname
+        return g
+
 
 class QueryTree(Tree):
 
@@ -247,6 +295,7 @@ class QueryTree(Tree):
     def __init__(self):
         super().__init__()
         self._query_trees: List[Node] = []
+        self._query_nonterminals: Set[str] = set()
 
     def handle_O(self, n: int, s: str) -> None:
         """Handle the O (option) tree record"""
@@ -261,6 +310,7 @@ class QueryTree(Tree):
         query = None if root is None else root.child
         # The child nodes of the Query node are the valid query parse trees
         self._query_trees = [] if query is None else list(query.children())
+        self._query_nonterminals = set(node.string_self() for node in self._query_trees)
 
     @property
     def query_trees(self) -> List[Node]:
@@ -270,10 +320,15 @@ class QueryTree(Tree):
     @property
     def query_nonterminals(self) -> Set[str]:
         """Return the set of query nonterminals that match this query"""
-        return set(node.string_self() for node in self._query_trees)
+        return self._query_nonterminals
 
     def process_queries(
-        self, query: "Query", session: Session, processor: ProcEnv
+        self,
+        query: "Query",
+        session: Session,
+        processor: ProcEnv,
+        *,
+        bin_db: Optional[GreynirBin] = None,
     ) -> bool:
         """Process all query trees that the given processor is interested in"""
         processor_query_types: Set[str] = processor.get("QUERY_NONTERMINALS", set())
@@ -285,7 +340,7 @@ class QueryTree(Tree):
             # But this processor is not interested in any of the nonterminals
             # in this query's parse forest: don't waste more cycles on it
             return False
-        with self.context(session, processor, query=query) as state:
+        with self.context(session, processor, bin_db=bin_db, query=query) as state:
             for query_tree in self._query_trees:
                 # Is the processor interested in the root nonterminal
                 # of this query tree?
@@ -298,6 +353,117 @@ class QueryTree(Tree):
         return False
 
 
+class PlainTextRouter:
+
+    """Routes plain text queries to the handle_plain_text() functions
+    of the query modules. A module can declare the queries that its
+    handler accepts, in lower case and without a trailing question mark:
+
+        PLAIN_TEXT_PHRASES: exact queries
+        PLAIN_TEXT_PREFIXES: prefixes of queries
+        PLAIN_TEXT_REGEXES: regular expressions, as used with re.search();
+            a regex that starts with ^ must be anchored as a whole,
+            i.e. not contain a top-level alternation
+
+    The phrases of all modules are collected into a single dict, and
+    the prefixes and regexes into a single regex that finds all the
+    matching modules in one pass. Only the handlers of matching modules,
+    and of modules that declare nothing, are invoked for a query."""
+
+    def __init__(self, modules: Sequence[ModuleType]) -> None:
+        """Compile the router for the given query modules,
+        which are in descending order of priority"""
+        self._handlers: List[Callable[["Query"], bool]] = []
+        self._names: List[str] = []
+        # Handlers that are invoked for every query
+        self._unrouted: List[int] = []
+        # Exact query -> handlers
+        self._phrases: DefaultDict[str, List[int]] = defaultdict(list)
+        # Regex group name -> handler
+        self._groups: Dict[str, int] = dict()
+        patterns: List[str] = []
+        for ix, m in enumerate(modules):
+            self._handlers.append(getattr(m, "handle_plain_text"))
+            self._names.append(m.__name__.split(".")[-1])
+            phrases: Iterable[str] = getattr(m, "PLAIN_TEXT_PHRASES", ())
+            prefixes: Iterable[str] = getattr(m, "PLAIN_TEXT_PREFIXES", ())
+            regexes: Iterable[str] = getattr(m, "PLAIN_TEXT_REGEXES", ())
+            alternatives: List[str] = []
+            if prefixes:
+                alternatives.append(
+                    "(?:{0})".format("|".join(re.escape(p) for p in prefixes))
+                )
+            for rx in regexes:
+                # Check each regex by itself, for a better error message
+                re.compile(rx)
+                alternatives.append(
+                    f"(?:{rx})" if rx.startswith("^") else f".*?(?:{rx})"
+                )
+            for phrase in phrases:
+                self._phrases[phrase].append(ix)
+            if alternatives:
+                # A lookahead for the alternatives, followed by an empty
+                # group that records whether the lookahead matched
+                group = f"_h{ix}"
+                self._groups[group] = ix
+                patterns.append(
+                    "(?:(?={0})(?P<{1}>))?".format("|".join(alternatives), group)
+                )
+            elif not phrases:
+                self._unrouted.append(ix)
+        # All lookaheads are anchored at the start of the query
+        self._regex = re.compile("".join(patterns), re.DOTALL) if patterns else None
+        # Number of calls and cumulative time spent, per handler
+        self._calls = [0] * len(self._handlers)
+        self._seconds = [0.0] * len(self._handlers)
+
+    def handlers_for(self, ql: str) -> List[int]:
+        """Return the handlers that match a lower case query string,
+        in descending order of priority"""
+        found = set(self._unrouted)
+        found.update(self._phrases.get(ql, ()))
+        if self._regex is not None:
+            m = self._regex.match(ql)
+            if m is not None:
+                found.update(
+                    ix for group, ix in self._groups.items() if m.group(group) == ""
+                )
+        return sorted(found)
+
+    def route(self, q: "Query") -> bool:
+        """Invoke the matching handlers for a query until one
+        of them handles it; return True if one did"""
+        ql = q.query_lower.strip().rstrip("?")
+        timings: List[Tuple[str, float]] = []
+        handled = False
+        for ix in self.handlers_for(ql):
+            t0 = perf_counter()
+            handled = self._handlers[ix](q)
+            elapsed = perf_counter() - t0
+            self._calls[ix] += 1
+            self._seconds[ix] += elapsed
+            timings.append((self._names[ix], elapsed))
+            if handled:
+                break
+        if Settings.DEBUG:
+            print(
+                "Plain text handlers: "
+                + (
+                    ", ".join(f"{name} {t * 1000.0:.2f} ms" for name, t in timings)
+                    or "none"
+                )
+            )
+        return handled
+
+    def timings(self) -> Dict[str, Tuple[int, float]]:
+        """Return the number of calls and the cumulative time
+        in seconds for each handler, since the router was created"""
+        return {
+            name: (self._calls[ix], self._seconds[ix])
+            for ix, name in enumerate(self._names)
+        }
+
+
 class Query:
 
     """A Query is initialized by parsing a query string using QueryRoot as the
@@ -307,11 +473,14 @@ class Query:
 
     # Processors that handle parse trees
     _tree_processors: List[ProcEnv] = []
+    # Query nonterminal -> the tree processors interested in it,
+    # as indices into _tree_processors, i.e. in priority order
+    _tree_processor_index: Dict[str, List[int]] = dict()
     # Functions from utility modules,
     # facilitating code reuse between query modules
     _utility_functions: ChainMapType[str, FunctionType] = ChainMap()
-    # Handler functions within processors that handle plain text
-    _text_processors: List[Callable[["Query"], bool]] = []
+    # Router for processors that handle plain text
+    _text_router: Optional[PlainTextRouter] = None
     # Handler of last resort for queries that no processor handles
     _last_resort_processor: Optional[Callable[["Query"], bool]] = None
     # Singleton instance of the query parser
@@ -333,6 +502,7 @@ class Query:
         private: bool = False,
     ) -> None:
         self._query = q = self._preprocess_query_string(query)
+        self._query_lower = q.lower()
         self._session = session
         self._location = location
         # Prepare a "beautified query" string that can be
@@ -408,7 +578,7 @@ class Query:
         processor modules and the query parser instance"""
         all_procs: List[ModuleType] = []
         tree_procs: List[Tuple[int, ModuleType]] = []
-        text_procs: List[Tuple[int, Callable[["Query"], bool]]] = []
+        text_procs: List[Tuple[int, ModuleType]] = []
         last_resort_proc: Optional[Callable[["Query"], bool]] = None
         # Load the query processor modules found in the
         # queries directory. The modules can be tree and/or text processors,
@@ -442,12 +612,10 @@ class Query:
                     # This is a tree processor
                     is_proc = True
                     tree_procs.append((priority, m))
-                handle_plain_text = getattr(m, "handle_plain_text", None)
-                if handle_plain_text is not None:
-                    # This is a text processor:
-                    # store a reference to its handler function
+                if getattr(m, "handle_plain_text", None) is not None:
+                    # This is a text processor
                     is_proc = True
-                    text_procs.append((priority, handle_plain_text))
+                    text_procs.append((priority, m))
                 if is_proc:
                     all_procs.append(m)
             except ImportError as e:
@@ -461,7 +629,15 @@ class Query:
             cls.create_processing_env(t[1])
             for t in sorted(tree_procs, key=lambda x: -x[0])
         ]
-        cls._text_processors = [t[1] for t in sorted(text_procs, key=lambda x: -x[0])]
+        # Index the tree processors by the query nonterminals they handle
+        index: DefaultDict[str, List[int]] = defaultdict(list)
+        for ix, processor in enumerate(cls._tree_processors):
+            for nt in processor.get("QUERY_NONTERMINALS", set()):
+                index[nt].append(ix)
+        cls._tree_processor_index = dict(index)
+        cls._text_router = PlainTextRouter(
+            [t[1] for t in sorted(text_procs, key=lambda x: -x[0])]
+        )
         cls._last_resort_processor = last_resort_proc
 
         if Settings.DEBUG:
@@ -469,7 +645,7 @@ class Query:
             print("Text processors:")
             print(
                 "\n".join(
-                    f"{p[0]:4} -> {p[1].__module__}.{p[1].__qualname__}"
+                    f"{p[0]:4} -> {p[1].__name__}.handle_plain_text"
                     for p in sorted(text_procs, key=lambda x: -x[0])
                 )
             )
@@ -695,11 +871,19 @@ class Query:
         """Attempt to execute a plain text query, without having to parse it"""
         if not self._query:
             return False
-        # Call the handle_plain_text() function in each text processor,
-        # until we find one that returns True, or return False otherwise
-        return any(
-            handle_plain_text(self) for handle_plain_text in self._text_processors
-        )
+        # Call the handle_plain_text() function in each matching text
+        # processor, until we find one that returns True, or return False otherwise
+        assert self._text_router is not None
+        return self._text_router.route(self)
+
+    @classmethod
+    def tree_processors_for(cls, nonterminals: Iterable[str]) -> List[ProcEnv]:
+        """Return the tree processors that are interested in any of
+        the given query nonterminals, in priority order"""
+        found: Set[int] = set()
+        for nt in nonterminals:
+            found.update(cls._tree_processor_index.get(nt, ()))
+        return [cls._tree_processors[ix] for ix in sorted(found)]
 
     def execute_from_tree(self) -> bool:
         """Execute the query or queries contained in the previously parsed tree;
@@ -707,30 +891,33 @@ class Query:
         if self._tree is None:
             self.set_error("E_QUERY_NOT_PARSED")
             return False
-        # Try each tree processor in turn, in priority order (highest priority first)
-        for processor in self._tree_processors:
-            self._error = None
-            self._qtype = None
-            # Process the tree, which has only one sentence, but may
-            # have multiple matching query nonterminals
-            # (children of Query in the grammar)
-            try:
-                # Note that passing query=self here means that the
-                # "query" field of the TreeStateDict is populated,
-                # turning it into a QueryStateDict.
-                if self._tree.process_queries(
-                    self,
-                    self._session,
-                    processor,
-                ):
-                    # This processor found an answer, which is already stored
-                    # in the Query object: return True
-                    return True
-            except Exception as e:
-                logging.error(
-                    f"Exception in execute_from_tree('{processor.get('__name__', 'UNKNOWN')}') "
-                    f"for query '{self._query}': {repr(e)}"
-                )
+        # Try each tree processor that is interested in the query nonterminals
+        # of this tree in turn, in priority order (highest priority first)
+        processors = self.tree_processors_for(self._tree.query_nonterminals)
+        if not processors:
+            return False
+        with GreynirBin.get_db() as bin_db:
+            for processor in processors:
+                self._error = None
+                self._qtype = None
+                # Process the tree, which has only one sentence, but may
+                # have multiple matching query nonterminals
+                # (children of Query in the grammar)
+                try:
+                    # Note that passing query=self here means that the
+                    # "query" field of the TreeStateDict is populated,
+                    # turning it into a QueryStateDict.
+                    if self._tree.process_queries(
+                        self, self._session, processor, bin_db=bin_db
+                    ):
+                        # This processor found an answer, which is already stored
+                        # in the Query object: return True
+                        return True
+                except Exception as e:
+                    logging.error(
+                        f"Exception in execute_from_tree('{processor.get('__name__', 'UNKNOWN')}') "
+                        f"for query '{self._query}': {repr(e)}"
+                    )
         # No processor was able to answer the query
         return False
 
@@ -738,12 +925,33 @@ class Query:
         """Return True if the query currently has an answer"""
         return bool(self._answer) and self._error is None
 
+    def _last_pending_row(self, within_minutes: int) -> Optional[Dict[str, Any]]:
+        """Return the newest non-error, no-repeat query log row for this
+        client that has not yet been written to the database, if any"""
+        since = (
+            datetime.utcnow() - timedelta(minutes=within_minutes)
+            if within_minutes > 0
+            else None
+        )
+        for row in reversed(query_log.pending()):
+            if (
+                row["client_id"] == self._client_id
+                and row["qtype"] != "Repeat"
+                and row["error"] is None
+                and (since is None or row["timestamp"] >= since)
+            ):
+                return row
+        return None
+
     def last_answer(self, *, within_minutes: int = 5) -> Optional[Tuple[str, str]]:
         """Return the last answer given to this client, by default
         within the last 5 minutes (0=forever)"""
         if not self._client_id:
             # Can't find the last answer if no client_id given
             return None
+        row = self._last_pending_row(within_minutes)
+        if row is not None:
+            return (row["answer"], row["voice"])
         # Find the newest non-error, no-repeat query result for this client
         q = (
             self._session.query(QueryRow.answer, QueryRow.voice)
@@ -765,6 +973,9 @@ class Query:
         if not self._client_id:
             # Can't find the last answer if no client_id given
             return None
+        row = self._last_pending_row(within_minutes)
+        if row is not None:
+            return row["context"]
         # Find the newest non-error, no-repeat query result for this client
         q = (
             self._session.query(QueryRow.context)
@@ -789,8 +1000,16 @@ class Query:
         if not self._client_id:
             # Can't find the last answer if no client_id given
             return 0
-        # Count the non-error query results for this client and query type
-        return (
+        # Count the non-error query results for this client and query type,
+        # including those that have not yet been written to the database
+        pending = sum(
+            1
+            for row in query_log.pending()
+            if row["client_id"] == self._client_id
+            and row["qtype"] == qtype
+            and row["error"] is None
+        )
+        return pending + (
             self._session.query(QueryRow.id)
             .filter(QueryRow.client_id == self._client_id)
             .filter(QueryRow.qtype == qtype)
@@ -806,7 +1025,7 @@ class Query:
     @property
     def query_lower(self) -> str:
         """The query text, all lower case"""
-        return self._query.lower()
+        return self._query_lower
 
     @property
     def beautified_query(self) -> str:
@@ -1284,18 +1503,35 @@ def to_genitive(np: str, *, filter_func: Optional[BinFilterFunc] = None) -> str:
         )
 
 
+# Look up the most recent unexpired answer to a question
+_CACHED_ANSWER = PreparedStatement(
+    "greynir_cached_answer",
+    """
+    select bquestion, answer, voice, expires, qtype, key from queries
+        where lower(question) = lower($1) and expires >= $2
+        order by expires desc
+        limit 1
+    """,
+)
+
+
 def _get_cached_answer(
     session: Session, qtext: str, clean_q: str, now: datetime
 ) -> ResponseDict:
     """Attempt to fetch a previously cached answer for the given query"""
-    cached_answer: Optional[QueryRow] = (
-        session.query(QueryRow)
-        .filter(QueryRow.question_lc == clean_q.lower())  # type: ignore
-        .filter(QueryRow.expires >= now)
-        .order_by(desc(QueryRow.expires))
-        .limit(1)
-        .one_or_none()
-    )
+    # Answers that have not yet been written to the database take precedence
+    q_lc = clean_q.lower()
+    cached_answer: Any = None
+    for row in query_log.pending():
+        if (
+            row["expires"] is not None
+            and row["expires"] >= now
+            and row["question"].lower() == q_lc
+            and (cached_answer is None or row["expires"] >= cached_answer.expires)
+        ):
+            cached_answer = SimpleNamespace(**row)
+    if cached_answer is None:
+        cached_answer = _CACHED_ANSWER.execute(session, q_lc, now).first()
     if cached_answer is None:
         # Not found in cache: return an empty dict
         return dict()
@@ -1317,7 +1553,6 @@ def _get_cached_answer(
 
 
 def _log_query(
-    session: Session,
     it: List[str],
     query: Optional[Query],
     clean_q: str,
@@ -1329,38 +1564,39 @@ def _log_query(
     client_type: Optional[str],
     client_version: Optional[str],
 ) -> None:
-    """Add a query log entry to the database"""
+    """Add a query log entry to the database. The entry, along with its
+    anonymised copy, is written in the background (see querylog.py)."""
     try:
         # Standard query logging
-        qrow = QueryRow(
-            timestamp=now,
-            interpretations=it,
-            question=clean_q,
-            # bquestion is the beautified query string
-            bquestion=result.get("q", clean_q),
-            answer=result.get("answer"),
-            voice=result.get("voice"),
-            error=result.get("error"),
-            # Only put an expiration on voice queries
-            expires=query.expires if voice and query is not None else None,
-            qtype=result.get("qtype"),
-            key=result.get("key"),
-            latitude=None,  # Disabled for now
-            longitude=None,  # Disabled for now
-            # Client identifier
-            client_id=client_id[:256] if client_id else None,
-            client_type=client_type[:80] if client_type else None,
-            client_version=client_version[:10] if client_version else None,
-            # IP address
-            remote_addr=remote_addr or None,
-            # Context dict, stored as JSON, if present
-            # (set during query execution)
-            context=None if query is None else query.context,
-            # All other fields are set to NULL
+        error = result.get("error")
+        query_log.log(
+            dict(
+                timestamp=now,
+                interpretations=it,
+                question=clean_q,
+                # bquestion is the beautified query string
+                bquestion=result.get("q", clean_q),
+                answer=result.get("answer"),
+                voice=result.get("voice"),
+                error=error[:256] if error else None,
+                # Only put an expiration on voice queries
+                expires=query.expires if voice and query is not None else None,
+                qtype=result.get("qtype"),
+                key=result.get("key"),
+                latitude=None,  # Disabled for now
+                longitude=None,  # Disabled for now
+                # Client identifier
+                client_id=client_id[:256] if client_id else None,
+                client_type=client_type[:80] if client_type else None,
+                client_version=client_version[:10] if client_version else None,
+                # IP address
+                remote_addr=remote_addr or None,
+                # Context dict, stored as JSON, if present
+                # (set during query execution)
+                context=None if query is None else query.context,
+                # All other fields are set to NULL
+            )
         )
-        session.add(qrow)
-        # Also log anonymised query
-        session.add(QueryLog.from_Query(qrow))
     except Exception as e:
         logging.error(f"Error logging query: {e}")
 
@@ -1452,7 +1688,6 @@ def process_query(
                     # If not in private mode, log the result
                     if not private:
                         _log_query(
-                            session,
                             it,
                             query,
                             clean_q,
@@ -1489,7 +1724,6 @@ def process_query(
                     # If not in private mode, log the result
                     if not private:
                         _log_query(
-                            session,
                             it,
                             query,
                             first_clean_q,
@@ -1524,7 +1758,6 @@ def process_query(
             Query.try_to_help(first_clean_q, result)
 
             _log_query(
-                session,
                 it,
                 None,
                 first_clean_q,
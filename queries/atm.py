@@ -23,14 +23,14 @@
 
 """
 
-from typing import Any, Dict, List, Mapping, cast
+from typing import Any, Callable, Dict, List, Mapping, cast
 
 import cachetools
 import logging
 import random
 import json
 
-from geo import distance
+from geo import LocationIndex
 from tree import Result, Node
 from queries import ContextDict, Query, QueryStateDict
 from reynir import NounPhrase
@@ -206,99 +206,61 @@ def _get_atm_data() -> List[Dict[str, Any]]:
     return atm_data
 
 
-def _atms_with_distance(loc: LatLonTuple) -> List[Dict[str, Any]]:
-    """Return list of atms w. added distance data."""
-    atm_data: List[Dict[str, Any]] = _get_atm_data()
-
-    # Calculate distance of all atms
-    for s in atm_data:
-        s["distance"] = distance(
-            loc, (s["location"]["latitude"], s["location"]["longitude"])
-        )
-
-    return atm_data
+@cachetools.cached(cachetools.TTLCache(1, _ATM_CACHE_TTL))
+def _get_atm_index() -> LocationIndex[Dict[str, Any]]:
+    """Return an index of the ATMs by location"""
+    return LocationIndex(
+        ((s["location"]["latitude"], s["location"]["longitude"]), s)
+        for s in _get_atm_data()
+    )
 
 
-def _group_closest_based_on_address(
-    atm_data: List[Dict[str, Any]]
+def _closest_atms(
+    loc: LatLonTuple, accept: Callable[[Dict[str, Any]], bool]
 ) -> List[Dict[str, Any]]:
     """
-    Group closest ATMs based on address,
-    returns all atms with the same address or
-    an empty list if no atms are found.
+    Find the ATM closest to the given location that passes the
+    accept filter, along with any other such ATMs at the same address,
+    returning them w. added distance data, or an empty list if no
+    atms are found.
     """
-    if len(atm_data) == 0:
-        return []
     atms: List[Dict[str, Any]] = []
-    # Sort by distance
-    atm_data.sort(key=lambda s: s["distance"])
-    atms.append(atm_data[0])
-    for idx, atm in enumerate(atm_data[:-1]):
-        if atm["address"]["street"] == atm_data[idx + 1]["address"]["street"]:
-            atms.append(atm_data[idx + 1])
-        else:
+    for dist, atm in _get_atm_index().iter_nearest(loc):
+        if not accept(atm):
+            continue
+        if atms and atm["address"]["street"] != atms[-1]["address"]["street"]:
             break
+        atms.append(dict(atm, distance=dist))
     return atms
 
 
 def _closest_atm(loc: LatLonTuple) -> List[Dict[str, Any]]:
     """Find ATM closest to the given location."""
-    atms: List[Dict[str, Any]] = _atms_with_distance(loc)
-    if len(atms) == 0:
-        return []
-    return _group_closest_based_on_address(atms)
+    return _closest_atms(loc, lambda atm: True)
 
 
 def _closest_atm_deposit(loc: LatLonTuple) -> List[Dict[str, Any]]:
     """Find ATM closest to the given location that accepts deposits."""
-    atms: List[Dict[str, Any]] = _atms_with_distance(loc)
-    if len(atms) == 0:
-        return []
-
-    filtered_atms: List[Dict[str, Any]] = []
-    for atm in atms:
-        services = atm.get("services", {})
-        if services.get("deposit", False) is True:
-            filtered_atms.append(atm)
-    atms = filtered_atms
-
-    return _group_closest_based_on_address(atms)
+    return _closest_atms(
+        loc, lambda atm: atm.get("services", {}).get("deposit", False) is True
+    )
 
 
 def _closest_atm_foreign_exchange(loc: LatLonTuple) -> List[Dict[str, Any]]:
     """Find ATM closest to the given location that accepts foreign exchange."""
-    atms: List[Dict[str, Any]] = _atms_with_distance(loc)
-    if len(atms) == 0:
-        return []
 
-    filtered_atms: List[Dict[str, Any]] = []
-    for atm in atms:
+    def accept(atm: Dict[str, Any]) -> bool:
         services = atm.get("services", {})
-        if services.get("foreign_exchange", {}).get("active", False) is True:
-            filtered_atms.append(atm)
-    atms = filtered_atms
+        return services.get("foreign_exchange", {}).get("active", False) is True
 
-    # Sort by distance
-    dist_sorted = sorted(atms, key=lambda s: s["distance"])
-    return _group_closest_based_on_address(dist_sorted)
+    return _closest_atms(loc, accept)
 
 
 def _closest_atm_coinmachine(loc: LatLonTuple) -> List[Dict[str, Any]]:
     """Find ATM closest to the given location that has a coinmachine."""
-    atms: List[Dict[str, Any]] = _atms_with_distance(loc)
-    if len(atms) == 0:
-        return []
-
-    filtered_atms: List[Dict[str, Any]] = []
-    for atm in atms:
-        services = atm.get("services", {})
-        if services.get("coinmachine", False) is True:
-            filtered_atms.append(atm)
-    atms = filtered_atms
-
-    # Sort by distance
-    dist_sorted = sorted(atms, key=lambda s: s["distance"])
-    return _group_closest_based_on_address(dist_sorted)
+    return _closest_atms(
+        loc, lambda atm: atm.get("services", {}).get("coinmachine", False) is True
+    )
 
 
 def _format_voice_street_number(s: str) -> str:
@@ -66,7 +66,7 @@ from queries.util import (
 )
 from speech.trans import gssml, strip_markup
 from settings import Settings
-from geo import in_iceland
+from geo import LatLonTuple, LocationIndex, in_iceland
 
 import straeto
 
@@ -74,6 +74,11 @@ import straeto
 schedule_today: Optional[straeto.BusSchedule] = None
 SCHEDULE_LOCK = Lock()
 
+# Index of bus stops by location, along with the dict of stops it was built from
+_stop_index: Optional[
+    Tuple[Dict[str, straeto.BusStop], LocationIndex[straeto.BusStop]]
+] = None
+
 
 # Indicate that this module wants to handle parse trees for queries,
 # as opposed to simple literal text strings
@@ -428,6 +433,23 @@ def hms_fmt(hms: _HMSTuple, voice: bool = False) -> str:
     return gssml(f"{h:02}:{m:02}", type="time") if voice else f"{h:02}:{m:02}"
 
 
+def closest_stops(
+    location: LatLonTuple, n: int = 1, within_radius: Optional[float] = None
+) -> List[straeto.BusStop]:
+    """Return the n bus stops closest to the given location, optionally
+    only those within the given radius (in kilometers). This is
+    equivalent to straeto.BusStop.closest_to_list(), but uses an index
+    of the stops instead of calculating the distance to each of them."""
+    global _stop_index
+    stops = straeto.BusStop._all_stops
+    index = _stop_index
+    if index is None or index[0] is not stops:
+        # Build the index, or rebuild it if the stops have been reinitialized
+        index = (stops, LocationIndex((stop.location, stop) for stop in stops.values()))
+        _stop_index = index
+    return [stop for _, stop in index[1].nearest(location, n, within_radius)]
+
+
 def hms_diff(hms1: _HMSTuple, hms2: _HMSTuple) -> int:
     """Return (hms1 - hms2) in minutes, where both are (h, m, s) tuples"""
     return (hms1[0] - hms2[0]) * 60 + (hms1[1] - hms2[1])
@@ -448,7 +470,8 @@ def query_nearest_stop(query: Query, result: Result) -> AnswerTuple:
         return gen_answer("Ég þekki ekki strætósamgöngur utan Íslands.")
 
     # Get the stop closest to the user
-    stop = straeto.BusStop.closest_to(location)
+    stops = closest_stops(location)
+    stop = stops[0] if stops else None
     if stop is None:
         return gen_answer("Ég finn enga stoppistöð nálægt þér.")
 
@@ -511,10 +534,10 @@ def query_arrival_time(query: Query, result: Result) -> AnswerTuple:
     else:
         # Obtain the closest stops (at least within 400 meters radius)
         assert location is not None
-        stops = straeto.BusStop.closest_to_list(location, n=2, within_radius=0.4)
+        stops = closest_stops(location, n=2, within_radius=0.4)
         if not stops:
             # This will fetch the single closest stop, regardless of distance
-            stops = [cast(straeto.BusStop, straeto.BusStop.closest_to(location))]
+            stops = closest_stops(location)
 
     # Handle the case where no bus number was specified (i.e. is 'Any')
     if result.bus_number == "Any" and stops:
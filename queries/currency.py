@@ -29,11 +29,11 @@
 
 from typing import Dict, List, Mapping, Optional, Sequence, cast
 
-import cachetools  # type: ignore
 import random
 import logging
 
 from queries import Query, QueryStateDict
+from queries.util.sources import CachedSource
 from queries.util import (
     query_json_api,
     iceformat_float,
@@ -201,9 +201,8 @@ _CURR_API_URL = "https://apis.is/currency/arion"
 _CURR_CACHE_TTL = 3600  # seconds
 
 
-@cachetools.cached(cachetools.TTLCache(1, _CURR_CACHE_TTL))
 def _fetch_exchange_rates() -> Optional[Dict[str, float]]:
-    """Fetch exchange rate data from apis.is and cache it."""
+    """Fetch exchange rate data from apis.is"""
     res = query_json_api(_CURR_API_URL)
     if not isinstance(res, dict) or "results" not in res:
         logging.warning(f"Unable to fetch exchange rate data from {_CURR_API_URL}")
@@ -215,9 +214,14 @@ def _fetch_exchange_rates() -> Optional[Dict[str, float]]:
     }
 
 
+_EXCHANGE_RATES = CachedSource(
+    "currency", _fetch_exchange_rates, refresh=_CURR_CACHE_TTL
+)
+
+
 def fetch_exchange_rates() -> Optional[Dict[str, float]]:
     """Fetch exchange rate data using cache"""
-    return _fetch_exchange_rates()
+    return _EXCHANGE_RATES.get()
 
 
 def _query_exchange_rate(curr1: str, curr2: str) -> Optional[float]:
@@ -229,7 +233,7 @@ def _query_exchange_rate(curr1: str, curr2: str) -> Optional[float]:
         return 1
 
     # Get exchange rate data
-    xr = _fetch_exchange_rates()
+    xr = fetch_exchange_rates()
     if xr is None:
         return None
 
@@ -359,6 +359,11 @@ def traveltime_answer_for_loc(
 _UNKNOWN_LOC_RESP = "Ég veit ekki hvar þú ert, og get því ekki reiknað út vegalengdir."
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_REGEXES = _QDISTANCE_REGEXES + _QTRAVELTIME_REGEXES
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle a plain text query."""
     ql = q.query_lower.rstrip("?")
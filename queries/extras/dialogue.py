@@ -48,7 +48,7 @@ except ModuleNotFoundError:
     import tomli as tomllib  # Used for Python <3.11
 
 from db import SessionContext, Session
-from db.models import DialogueData as DB_DialogueData, QueryData as DB_QueryData
+from db.models import DialogueData as DB_DialogueData, QueryClientData as DB_QueryData
 
 import queries.extras.resources as res
 from queries import AnswerTuple
@@ -78,8 +78,9 @@ _TOMLTypes = Union[
 ]
 
 
-class _ExtrasType(Dict[str, _TOMLTypes], TypedDict, total=False):
-    """Structure of 'extras' key in dialogue TOML files."""
+class _ExtrasType(TypedDict, total=False):
+    """Structure of 'extras' key in dialogue TOML files.
+    Other keys, with any TOML values, may also be present."""
 
     expiration_time: int
 
@@ -105,9 +106,10 @@ _EXPIRATION_TIME_KEY = "expiration_time"
 ActiveDialogueList = List[Tuple[str, str]]
 
 
-class SerializedResource(Dict[str, _JSONTypes], TypedDict, total=False):
+class SerializedResource(TypedDict, total=False):
     """
     Representation of the required keys of a serialized resource.
+    Other keys, with any JSON values, may also be present.
     """
 
     name: Required[str]
@@ -260,11 +262,23 @@ ResourceGraph = Dict[res.Resource, ResourceGraphItem]
 
 class DialogueStateManager:
     def __init__(self, client_id: Optional[str], db_session: Session) -> None:
-        """Initialize DSM instance and fetch the active dialogues for a client."""
+        """Initialize DSM instance. The active dialogues for the client
+        are fetched when first needed."""
         self._client_id = client_id
         self._db_session = db_session  # Database session of parent Query class
-        # Fetch active dialogues for this client (empty list if no client ID provided)
-        self._active_dialogues: ActiveDialogueList = self._get_active_dialogues()
+        self._active: Optional[ActiveDialogueList] = None
+
+    @property
+    def _active_dialogues(self) -> ActiveDialogueList:
+        """The active dialogues for this client
+        (empty list if no client ID provided)"""
+        if self._active is None:
+            self._active = self._get_active_dialogues()
+        return self._active
+
+    @_active_dialogues.setter
+    def _active_dialogues(self, active: ActiveDialogueList) -> None:
+        self._active = active
 
     def get_next_active_resource(self, dialogue_name: str) -> str:
         """
@@ -840,6 +854,12 @@ class DialogueStateManager:
 
         now = datetime.datetime.now()
         expires_at = now + datetime.timedelta(seconds=self._expiration_time)
+        data = _dialogue_serializer(
+            {
+                _RESOURCES_KEY: self._resources.values(),
+                _EXTRAS_KEY: self._extras,
+            }
+        )
         with SessionContext(session=self._db_session, commit=True) as session:
             try:
                 existing_dd_row: Optional[DB_DialogueData] = session.get(  # type: ignore
@@ -849,12 +869,7 @@ class DialogueStateManager:
                 if existing_dd_row:
                     # UPDATE existing row
                     existing_dd_row.modified = now  # type: ignore
-                    existing_dd_row.data = _dialogue_serializer(  # type: ignore
-                        {
-                            _RESOURCES_KEY: self._resources.values(),
-                            _EXTRAS_KEY: self._extras,
-                        }
-                    )
+                    existing_dd_row.data = data  # type: ignore
                     existing_dd_row.expires_at = expires_at  # type: ignore
                 else:
                     # INSERT new row
@@ -863,12 +878,7 @@ class DialogueStateManager:
                         dialogue_key=self._dialogue_name,
                         created=now,
                         modified=now,
-                        data=_dialogue_serializer(
-                            {
-                                _RESOURCES_KEY: self._resources.values(),
-                                _EXTRAS_KEY: self._extras,
-                            }
-                        ),
+                        data=data,
                         expires_at=expires_at,
                     )
                     session.add(dialogue_row)  # type: ignore
@@ -156,7 +156,7 @@ class ResourceSchema(Schema):
     name = fields.Str(required=True)
     type = fields.Str(required=True)
     data = fields.Raw(allow_none=True)
-    state = fields.Enum(IntFlag, by_value=True, required=True)
+    state = fields.Enum(ResourceState, by_value=True, required=True)
     requires = fields.List(fields.Str(), required=True)
     prompts = fields.Mapping(fields.Str(), fields.Str(), allow_none=True)
     cascade_state = fields.Bool()
@@ -31,11 +31,11 @@ from typing_extensions import TypedDict
 import re
 import random
 import logging
-import cachetools
 from datetime import datetime, timedelta, timezone
 
 from queries import Query, QueryStateDict
 from queries.util import query_json_api, is_plural, read_grammar_file
+from queries.util.sources import CachedSource
 from tree import ParamList, Result, Node
 from settings import changedlocale
 from speech.trans import gssml
@@ -135,10 +135,6 @@ _ISAVIA_FLIGHTS_URL = (
 
 _FLIGHTS_CACHE_TTL = 600  # seconds, ttl = 10 mins
 
-# Cache for flights either departing or arriving
-_FLIGHT_CACHE: cachetools.TTLCache = cachetools.TTLCache(  # type: ignore
-    maxsize=2, ttl=_FLIGHTS_CACHE_TTL
-)
 
 # For type checking
 class FlightType(TypedDict, total=False):
@@ -164,7 +160,7 @@ FlightList = List[FlightType]
 
 def _fetch_flight_data(
     from_date: datetime, to_date: datetime, iata_code: str, departing: bool
-) -> FlightList:
+) -> Optional[FlightList]:
     """
     Fetch data on flights to/from an Icelandic airport (given with its IATA code)
     between from_date and to_date from Isavia's JSON API.
@@ -187,13 +183,17 @@ def _fetch_flight_data(
         or not res["Success"]
         or "Items" not in res
     ):
-        return []
+        return None
 
-    # Add result to cache
-    _FLIGHT_CACHE[departing] = res["Items"]
     return res["Items"]
 
 
+# Flights to/from an airport, cached per airport, direction and time span
+_FLIGHTS = CachedSource(
+    "flights", _fetch_flight_data, refresh=_FLIGHTS_CACHE_TTL, maxsize=32
+)
+
+
 def _attribute_airport_match(flight: FlightType, attribute: str, airport: str) -> bool:
     """
     Safely checks whether the string flight[attribute] in lowercase
@@ -405,12 +405,12 @@ def _process_result(result: Result) -> Dict[str, str]:
 
     flight_count: int = result.get("flight_count", 1)
 
-    flight_data: FlightList
-    # Check first if function result in cache, else fetch data from API
-    if departing in _FLIGHT_CACHE:
-        flight_data = _FLIGHT_CACHE[departing]
-    else:
-        flight_data = _fetch_flight_data(from_date, to_date, iata_code, departing)
+    # Fetch flights for the time span from the start of the hour, so that
+    # queries within the same hour share the cached data (past flights
+    # are filtered out below)
+    start = from_date.replace(minute=0, second=0, microsecond=0)
+    end = to_date.replace(minute=0, second=0, microsecond=0)
+    flight_data: FlightList = _FLIGHTS.get(start, end, iata_code, departing) or []
 
     flight_data = _filter_flight_data(flight_data, airport, api_airport, flight_count)
 
@@ -28,15 +28,15 @@
 # TODO: Hvað er helst í fréttum í dag? Fréttir dagsins?
 # TODO: Phonetically transcribe news
 
-from typing import Any, List, Optional, Dict, cast
+from typing import List, Optional, Dict
 
 import logging
-import cachetools  # type: ignore
 import random
 
 from speech.trans import gssml
 from queries import Query, QueryStateDict, AnswerTuple
 from queries.util import gen_answer, query_json_api, read_grammar_file
+from queries.util.sources import CachedSource
 from tree import ParamList, Result, Node
 
 
@@ -73,7 +73,6 @@ _NEWS_API = "https://ruv.is/json/frettir/hladbord"
 _NEWS_CACHE_TTL = 300  # seconds, ttl = 5 mins
 
 
-@cachetools.cached(cast(Any, cachetools).TTLCache(1, _NEWS_CACHE_TTL))
 def _get_news_data(max_items: int = 8) -> Optional[List[Dict[str, str]]]:
     """Fetch news headline data from RÚV, preprocess it."""
     res = query_json_api(_NEWS_API)
@@ -92,6 +91,9 @@ def _get_news_data(max_items: int = 8) -> Optional[List[Dict[str, str]]]:
     return None
 
 
+_NEWS = CachedSource("news", _get_news_data, refresh=_NEWS_CACHE_TTL)
+
+
 def _clean_text(txt: str) -> str:
     txt = txt.replace("\r", " ").replace("\n", " ").replace("  ", " ")
     return txt.strip()
@@ -99,7 +101,7 @@ def _clean_text(txt: str) -> str:
 
 def top_news_answer() -> Optional[AnswerTuple]:
     """Answer query about top news."""
-    headlines = _get_news_data()
+    headlines = _NEWS.get()
     if not headlines:
         return None
 
@@ -29,10 +29,9 @@
 from typing import List, Dict, Optional
 
 import logging
-import cachetools  # type: ignore
 import random
 
-from geo import distance
+from geo import LocationIndex
 from tree import ParamList, Result, Node
 from queries import Query, QueryStateDict
 from queries.util import (
@@ -44,6 +43,7 @@ from queries.util import (
     LatLonTuple,
     read_grammar_file,
 )
+from queries.util.sources import CachedSource
 from speech.trans import gssml
 
 _PETROL_QTYPE = "Petrol"
@@ -114,7 +114,6 @@ _PETROL_API = "https://apis.is/petrol"
 _PETROL_CACHE_TTL = 3600  # seconds, ttl 1 hour
 
 
-@cachetools.cached(cachetools.TTLCache(1, _PETROL_CACHE_TTL))
 def _get_petrol_station_data() -> Optional[List]:
     """Fetch list of petrol stations w. prices from apis.is (Gasvaktin)"""
     pd = query_json_api(_PETROL_API)
@@ -129,38 +128,39 @@ def _get_petrol_station_data() -> Optional[List]:
     return pd["results"]
 
 
-def _stations_with_distance(loc: Optional[LatLonTuple]) -> Optional[List]:
-    """Return list of petrol stations w. added distance data."""
+def _get_petrol_station_index() -> Optional[LocationIndex[Dict]]:
+    """Return an index of the petrol stations by location"""
     pd = _get_petrol_station_data()
     if not pd:
         return None
+    return LocationIndex(((s["geo"]["lat"], s["geo"]["lon"]), s) for s in pd)
 
-    if loc:
-        # Calculate distance of all stations
-        for s in pd:
-            s["distance"] = distance(loc, (s["geo"]["lat"], s["geo"]["lon"]))
 
-    return pd
+_PETROL_STATIONS = CachedSource(
+    "petrol", _get_petrol_station_index, refresh=_PETROL_CACHE_TTL
+)
 
 
 def _closest_petrol_station(loc: LatLonTuple) -> Optional[Dict]:
     """Find petrol station closest to the given location."""
-    stations = _stations_with_distance(loc)
+    stations = _PETROL_STATIONS.get()
     if not stations:
         return None
 
-    # Sort by distance
-    dist_sorted = sorted(stations, key=lambda s: s["distance"])
-    return dist_sorted[0] if dist_sorted else None
+    closest = stations.nearest(loc)
+    if not closest:
+        return None
+    dist, station = closest[0]
+    return dict(station, distance=dist)
 
 
 def _cheapest_petrol_station() -> Optional[Dict]:
-    stations = _get_petrol_station_data()
+    stations = _PETROL_STATIONS.get()
     if not stations:
         return None
 
     # Sort by price
-    price_sorted = sorted(stations, key=lambda s: s["bensin95"])
+    price_sorted = sorted(stations.items, key=lambda s: s["bensin95"])
     return price_sorted[0] if price_sorted else None
 
 
@@ -169,16 +169,19 @@ _CLOSE_DISTANCE = 5.0  # km
 
 
 def _closest_cheapest_petrol_station(loc: LatLonTuple) -> Optional[Dict]:
-    stations = _stations_with_distance(loc)
+    stations = _PETROL_STATIONS.get()
     if not stations:
         return None
 
-    # Filter out all stations that are not close by
-    filtered = filter(lambda x: x["distance"] <= _CLOSE_DISTANCE, stations)
+    # Only consider stations that are close by
+    nearby = stations.within(loc, _CLOSE_DISTANCE)
 
     # Sort by price
-    price_sorted = sorted(filtered, key=lambda s: s["bensin95"])
-    return price_sorted[0] if price_sorted else None
+    price_sorted = sorted(nearby, key=lambda t: t[1]["bensin95"])
+    if not price_sorted:
+        return None
+    dist, station = price_sorted[0]
+    return dict(station, distance=dist)
 
 
 _ERRMSG = "Ekki tókst að sækja upplýsingar um bensínstöðvar."
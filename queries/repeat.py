@@ -77,6 +77,11 @@ def gen_repeat_answ(text: str, cmd_prefix: str, q: Query) -> None:
     )
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_PREFIXES = tuple(r + " " for r in _REPEAT_PREFIXES)
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handles a plain text query."""
 
@@ -35,13 +35,13 @@ from tree import Node, TerminalNode, ParamList, Result
 import logging
 import random
 import datetime
-import cachetools
 
 from tokenizer import split_into_sentences
 
 from speech.trans import gssml
 from settings import changedlocale
 from queries.util import query_json_api, read_grammar_file
+from queries.util.sources import CachedSource
 
 
 _SCHEDULES_QTYPE = "Schedule"
@@ -240,8 +240,9 @@ _STATION_ENDPOINTS = {
     # _SIMINN: "https://api.tv.siminn.is/oreo-api/v2/channels/{0}/events?start={1}&end={2}",
 }
 
-# Schedule cache (keep for one day)
-_SCHED_CACHE: cachetools.TTLCache = cachetools.TTLCache(maxsize=15, ttl=86400)  # type: ignore
+# Schedules are refreshed hourly and kept for one day
+_SCHED_CACHE_TTL = 3600
+_SCHED_MAX_AGE = 86400
 
 # Type for schedules
 _SchedType = List[Dict[str, Any]]
@@ -275,22 +276,16 @@ def _extract_ruv_schedule(response: Dict[str, Any]) -> _SchedType:
         return []
 
 
-def _query_schedule_api(channel: str, station: str, date: datetime.date) -> _SchedType:
-    """Fetch and return channel schedule from API or cache for specified date."""
-
-    if (channel, date) in _SCHED_CACHE:
-        return cast(_SchedType, _SCHED_CACHE[(channel, date)])
+def _fetch_schedule(
+    channel: str, station: str, date: datetime.date
+) -> Optional[_SchedType]:
+    """Fetch and return channel schedule from API for specified date."""
 
-    if station == _SIMINN:
-        # TODO: Síminn endpoint needs its own formatting
-        # since url includes start and end time along with channel ID
-        return []
-    else:
-        url: str = _STATION_ENDPOINTS[station].format(channel, date.isoformat())
+    url: str = _STATION_ENDPOINTS[station].format(channel, date.isoformat())
     response = query_json_api(url, timeout=30)
 
     if response is None:
-        return []
+        return None
 
     sched: _SchedType
     if station == _RUV:
@@ -301,10 +296,27 @@ def _query_schedule_api(channel: str, station: str, date: datetime.date) -> _Sch
 
     # Only cache non-empty schedules
     # (the empty schedules might get updated during the day)
-    if len(sched) > 0:
-        _SCHED_CACHE[(channel, date)] = sched
+    return sched or None
+
+
+_SCHEDULES = CachedSource(
+    "schedules",
+    _fetch_schedule,
+    refresh=_SCHED_CACHE_TTL,
+    max_age=_SCHED_MAX_AGE,
+    maxsize=15,
+)
+
+
+def _query_schedule_api(channel: str, station: str, date: datetime.date) -> _SchedType:
+    """Fetch and return channel schedule from API or cache for specified date."""
+
+    if station == _SIMINN:
+        # TODO: Síminn endpoint needs its own formatting
+        # since url includes start and end time along with channel ID
+        return []
 
-    return sched
+    return _SCHEDULES.get(channel, station, date) or []
 
 
 def _get_program_start_end(
@@ -2679,6 +2679,11 @@ _SPECIAL_QUERIES: Dict[str, Union[AnswerType, AnswerCallable]] = {
 }
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_PHRASES = frozenset(_SPECIAL_QUERIES.keys())
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle a plain text query."""
     ql = q.query_lower.rstrip("?")
@@ -404,6 +404,11 @@ _Q2HANDLER = {
 }
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_PHRASES = frozenset().union(*_Q2HANDLER.keys())
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle a plain text query about query statistics."""
     ql = q.query_lower.rstrip("?")
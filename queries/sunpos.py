@@ -46,7 +46,7 @@ import datetime
 import logging
 import random
 import re
-import requests
+import httpclient
 
 from bs4 import BeautifulSoup  # type: ignore
 from cachetools import TTLCache
@@ -348,7 +348,7 @@ def _get_almanak_hi_data() -> Optional[_SOLAR_DICT_TYPE]:
         return data
 
     try:
-        r = requests.get(_ALMANAK_HI_URL, timeout=10)
+        r = httpclient.get(_ALMANAK_HI_URL, timeout=10)
     except Exception as e:
         logging.warning(str(e))
         return None
@@ -184,6 +184,11 @@ _PHONECALL_REGEXES = [
 ]
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_REGEXES = _PHONECALL_REGEXES
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle a plain text query requesting a call to a telephone number."""
     ql = q.query_lower.strip().rstrip("?")
@@ -32,6 +32,11 @@ from queries.util import gen_answer
 _TEST_QTYPE = "Test"
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_PHRASES = frozenset(("keyrðu kóða", "opnaðu vefsíðu", "sýndu mynd"))
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle a plain text query."""
     ql = q.query_lower.rstrip("?")
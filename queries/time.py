@@ -161,6 +161,12 @@ def _loc2nom(loc: str) -> str:
     return NounPhrase(loc).nominative or loc
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_PHRASES = _TIME_QUERIES
+PLAIN_TEXT_PREFIXES = tuple(x.lower() for x in _TIME_IN_LOC_QUERIES)
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle plain text query."""
     ql = q.query_lower.rstrip("?")
@@ -478,6 +478,16 @@ _HANDLERS = tuple(
 )
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_PHRASES = (
+    _WHATS_MY_NAME | _WHATS_MY_ADDR | _DEVICE_TYPE_QUERIES | _CLIENT_VERSION_QUERIES
+)
+# "Hver er [nafn notanda]?"
+PLAIN_TEXT_PREFIXES = (_WHO_IS_ME.format(""),)
+PLAIN_TEXT_REGEXES = tuple(_MY_NAME_IS_REGEXES) + _MY_ADDRESS_REGEXES
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle plain text query."""
     ql = q.query_lower.rstrip("?")
@@ -37,7 +37,6 @@ from typing import (
 from typing_extensions import TypedDict
 
 import logging
-import requests
 import json
 import re
 import locale
@@ -47,6 +46,7 @@ from functools import lru_cache
 from timezonefinder import TimezoneFinder
 from pytz import country_timezones
 
+import httpclient
 from geo import country_name_for_isocode, iceprep_for_cc, LatLonTuple
 from speech.trans.num import number_to_text, float_to_text
 from reynir import NounPhrase
@@ -412,7 +412,7 @@ def query_json_api(
 
     # Send request
     try:
-        r = requests.get(url, headers=headers, timeout=timeout)
+        r = httpclient.get(url, headers=headers, timeout=timeout)
     except Exception as e:
         logging.warning(f"Exception when fetching {url}: {e}")
         return None
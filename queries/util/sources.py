@@ -0,0 +1,287 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Cached external data sources
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module provides caching of data that query modules fetch
+    from external services, such as exchange rates or news headlines.
+
+    A CachedSource wraps a function that fetches the data, typically
+    with query_json_api(), and keeps the last good value for each set
+    of arguments. Once a value is older than the source's refresh
+    interval, it is refreshed in a background thread while the old
+    value continues to be served (stale-while-revalidate). A request
+    only waits for the external service when there is no value yet,
+    or when the value has passed the source's maximum age. A fetch
+    fails if the function raises an exception or returns None. In that
+    case the last good value keeps being served, and the fetch is not
+    retried until the retry interval has passed.
+
+    When the web server is running, values are also kept in the shared
+    cache (see sharedcache.py and main.py). A value fetched by one
+    worker process is then used by the others, and only one worker at
+    a time refreshes a source.
+
+    The age of the cached values and the latency and failures of
+    fetches are reported per source by source_metrics().
+
+"""
+
+from typing import Any, Callable, Dict, Generic, Hashable, Optional, Tuple, TypeVar
+
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+from sharedcache import SQLiteCache
+
+
+T = TypeVar("T")
+
+# Maximum time, in seconds, that a worker holds the refresh lock of
+# a source in the shared cache
+_REFRESH_LOCK_TIMEOUT = 60
+
+# The shared cache, if enabled
+_shared_cache: Optional[SQLiteCache] = None
+
+# All sources, by name
+_sources: Dict[str, "CachedSource[Any]"] = dict()
+
+
+def use_shared_cache(cache: Optional[SQLiteCache]) -> None:
+    """Keep the values of all sources in the given shared cache,
+    or only in process memory if None"""
+    global _shared_cache
+    _shared_cache = cache
+
+
+class _Entry(Generic[T]):
+    """The cached value of a source for one set of arguments"""
+
+    __slots__ = ("value", "fetched", "retry", "refreshing")
+
+    def __init__(self) -> None:
+        self.value: Optional[T] = None
+        # Time (as in time.time()) when the value was fetched
+        self.fetched = 0.0
+        # Time before which a failed fetch is not retried
+        self.retry = 0.0
+        # Id of the process that is refreshing the value in the
+        # background, if any (a forked process doesn't inherit the thread)
+        self.refreshing = 0
+
+
+class CachedSource(Generic[T]):
+    """Caches the values returned by a function that fetches data from
+    an external service, refreshing them in the background"""
+
+    def __init__(
+        self,
+        name: str,
+        fetch: Callable[..., Optional[T]],
+        *,
+        refresh: float,
+        max_age: float = 86400.0,
+        retry: float = 60.0,
+        maxsize: int = 16,
+    ) -> None:
+        self._name = name
+        self._fetch = fetch
+        # Age, in seconds, at which a value is refreshed in the background
+        self._refresh = refresh
+        # Age, in seconds, at which a value is no longer served
+        self._max_age = max(max_age, refresh)
+        # Interval, in seconds, before a failed fetch is retried
+        self._retry = retry
+        # Maximum number of argument sets with cached values
+        self._maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: "OrderedDict[Hashable, _Entry[T]]" = OrderedDict()
+        self._fetches = 0
+        self._failures = 0
+        self._fetch_total = 0.0
+        self._fetch_max = 0.0
+        self._fetch_last = 0.0
+        self._served = 0
+        self._stale = 0
+        self._waits = 0
+        _sources[name] = self
+
+    @property
+    def name(self) -> str:
+        return self._name
+
+    def _shared_key(self, key: Hashable) -> str:
+        return f"source:{self._name}:{key!r}"
+
+    def _entry(self, key: Hashable) -> _Entry[T]:
+        """Return the entry for the key, creating it if needed.
+        Must be called with the lock held."""
+        entry = self._entries.get(key)
+        if entry is None:
+            entry = self._entries[key] = _Entry()
+            if len(self._entries) > self._maxsize:
+                self._entries.popitem(last=False)
+        else:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _adopt_shared(self, key: Hashable, entry: _Entry[T]) -> bool:
+        """Take a value from the shared cache if it is newer than the
+        entry's value. Returns True if the entry was updated."""
+        cache = _shared_cache
+        if cache is None:
+            return False
+        item: Optional[Tuple[float, T]] = cache.peek(self._shared_key(key))
+        if item is None:
+            return False
+        fetched, value = item
+        with self._lock:
+            if fetched <= entry.fetched:
+                return False
+            entry.value = value
+            entry.fetched = fetched
+        return True
+
+    def _do_fetch(self, key: Tuple[Any, ...], entry: _Entry[T]) -> None:
+        """Call the fetch function and update the entry, and the
+        shared cache, with its value if it succeeds"""
+        t0 = time.perf_counter()
+        try:
+            value = self._fetch(*key)
+        except Exception as e:
+            logging.warning(f"Exception when fetching source {self._name}: {e}")
+            value = None
+        elapsed = time.perf_counter() - t0
+        now = time.time()
+        with self._lock:
+            self._fetches += 1
+            self._fetch_total += elapsed
+            self._fetch_last = elapsed
+            self._fetch_max = max(self._fetch_max, elapsed)
+            if value is None:
+                self._failures += 1
+                entry.retry = now + self._retry
+                return
+            entry.value = value
+            entry.fetched = now
+            entry.retry = 0.0
+        cache = _shared_cache
+        if cache is not None:
+            cache.set(self._shared_key(key), (now, value), timeout=int(self._max_age))
+
+    def _refresh_entry(self, key: Tuple[Any, ...], entry: _Entry[T]) -> None:
+        """Refresh the value of an entry, unless another process has
+        refreshed it or is doing so"""
+        try:
+            if self._adopt_shared(key, entry) and (
+                time.time() - entry.fetched < self._refresh
+            ):
+                return
+            cache = _shared_cache
+            lock_key = self._shared_key(key) + ":refresh"
+            if cache is not None and not cache.add(
+                lock_key, os.getpid(), timeout=_REFRESH_LOCK_TIMEOUT
+            ):
+                # Another worker is refreshing the value: check back later
+                with self._lock:
+                    entry.retry = time.time() + min(self._retry, 5.0)
+                return
+            try:
+                self._do_fetch(key, entry)
+            finally:
+                if cache is not None:
+                    cache.delete(lock_key)
+        finally:
+            with self._lock:
+                entry.refreshing = 0
+
+    def get(self, *args: Any) -> Optional[T]:
+        """Return the value for the given arguments, which are passed
+        to the fetch function, or None if no value is available"""
+        now = time.time()
+        pid = os.getpid()
+        with self._lock:
+            entry = self._entry(args)
+            age = now - entry.fetched
+            if entry.value is not None and age < self._max_age:
+                self._served += 1
+                if age >= self._refresh:
+                    self._stale += 1
+                    if entry.refreshing != pid and now >= entry.retry:
+                        # Serve the current value while refreshing it
+                        entry.refreshing = pid
+                        threading.Thread(
+                            target=self._refresh_entry,
+                            args=(args, entry),
+                            name=f"CachedSource {self._name}",
+                            daemon=True,
+                        ).start()
+                return entry.value
+            if now < entry.retry:
+                # A recent fetch failed: don't wait for another one
+                return None
+            self._waits += 1
+        # No value that can be served: fetch it, unless there
+        # is one in the shared cache
+        if not (
+            self._adopt_shared(args, entry)
+            and time.time() - entry.fetched < self._max_age
+        ):
+            self._do_fetch(args, entry)
+        with self._lock:
+            if entry.value is not None and time.time() - entry.fetched < self._max_age:
+                self._served += 1
+                return entry.value
+        return None
+
+    def clear(self) -> None:
+        """Discard the cached values of this process"""
+        with self._lock:
+            self._entries.clear()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the age of the cached values and statistics on
+        fetches and served values, in this process"""
+        now = time.time()
+        with self._lock:
+            ages = [now - e.fetched for e in self._entries.values() if e.fetched]
+            return dict(
+                entries=len(ages),
+                age_max=round(max(ages), 1) if ages else None,
+                age_min=round(min(ages), 1) if ages else None,
+                refresh=self._refresh,
+                max_age=self._max_age,
+                served=self._served,
+                stale=self._stale,
+                waits=self._waits,
+                fetches=self._fetches,
+                failures=self._failures,
+                fetch_last=round(self._fetch_last, 6),
+                fetch_avg=round(self._fetch_total / max(1, self._fetches), 6),
+                fetch_max=round(self._fetch_max, 6),
+            )
+
+
+def source_metrics() -> Dict[str, Dict[str, Any]]:
+    """Return the metrics of all sources in this process, by name"""
+    return {name: source.metrics() for name, source in sorted(_sources.items())}
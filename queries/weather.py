@@ -46,7 +46,7 @@
 
 from __future__ import annotations
 
-from typing import Dict, Mapping, Optional, Union
+from typing import Any, Dict, Mapping, Optional, Union
 
 import os
 import re
@@ -63,10 +63,11 @@ from queries.util import (
     query_json_api,
     read_grammar_file,
 )
+from queries.util.sources import CachedSource
 from tree import ParamList, Result, Node
 from geo import in_iceland, RVK_COORDS, near_capital_region, ICE_PLACENAME_BLACKLIST
 from iceaddr import placename_lookup  # type: ignore
-from iceweather import observation_for_closest, observation_for_station, forecast_text  # type: ignore
+from iceweather import closest_stations, observation_for_station, forecast_text  # type: ignore
 
 from speech.trans import gssml
 
@@ -240,6 +241,45 @@ def _round_to_nearest_hour(t: datetime) -> datetime:
 
 _RVK_STATION_ID = 1
 
+_OBSERVATION_CACHE_TTL = 600  # seconds, ttl = 10 mins
+_OBSERVATION_MAX_AGE = 7200  # Don't serve observations older than 2 hours
+
+
+def _fetch_observation(station_id: int) -> Optional[Dict[str, Any]]:
+    """Fetch latest weather observation from a weather station"""
+    res = observation_for_station(station_id)
+    if (
+        not res
+        or "results" not in res
+        or not len(res["results"])
+        or res["results"][0].get("err")
+    ):
+        return None
+    return res
+
+
+_OBSERVATIONS = CachedSource(
+    "weather.observation",
+    _fetch_observation,
+    refresh=_OBSERVATION_CACHE_TTL,
+    max_age=_OBSERVATION_MAX_AGE,
+    maxsize=200,
+)
+
+
+def _observation_for_closest(lat: float, lon: float) -> Optional[Dict[str, Any]]:
+    """Return latest weather observation from the weather station closest
+    to the given coordinates. Tries up to three stations, returning the
+    first valid observation, as iceweather.observation_for_closest() does."""
+    first: Optional[Dict[str, Any]] = None
+    for ix, s in enumerate(closest_stations(lat, lon, limit=3)):
+        o = _OBSERVATIONS.get(s["id"])
+        if o and o["results"][0]["valid"]:
+            return o
+        if ix == 0:
+            first = o
+    return first
+
 
 def _curr_observations(query: Query, result: Result):
     """Fetch latest weather observation data from weather station closest
@@ -282,12 +322,9 @@ def _curr_observations(query: Query, result: Result):
     # Talk to weather API
     try:
         if loc and loc[0] and loc[1]:
-            res = observation_for_closest(loc[0], loc[1])
-            if isinstance(res, tuple):
-                # !!! FIXME: The type annotations here should be made more accurate
-                res = res[0]  # type: ignore
+            res = _observation_for_closest(loc[0], loc[1])
         else:
-            res = observation_for_station(_RVK_STATION_ID)  # Default to Reykjavík
+            res = _OBSERVATIONS.get(_RVK_STATION_ID)  # Default to Reykjavík
             result.subject = "Í Reykjavík"
     except Exception as e:
         logging.warning(f"Failed to fetch weather info: {e}")
@@ -393,6 +430,30 @@ def _descr4voice(descr: str) -> str:
 _COUNTRY_FC_ID = 2
 _CAPITAL_FC_ID = 3
 
+_FORECAST_CACHE_TTL = 900  # seconds, ttl = 15 mins
+_FORECAST_MAX_AGE = 43200  # Don't serve forecasts older than 12 hours
+
+
+def _fetch_forecast_text(txt_id: int) -> Optional[Dict[str, Any]]:
+    """Fetch weather forecast text"""
+    res = forecast_text(txt_id)
+    if (
+        not res
+        or "results" not in res
+        or not len(res["results"])
+        or "content" not in res["results"][0]
+    ):
+        return None
+    return res
+
+
+_FORECASTS = CachedSource(
+    "weather.forecast",
+    _fetch_forecast_text,
+    refresh=_FORECAST_CACHE_TTL,
+    max_age=_FORECAST_MAX_AGE,
+)
+
 
 def get_forecast_answer(query: Query, result: Result) -> AnswerTuple:
     """Handle weather forecast queries"""
@@ -406,18 +467,8 @@ def get_forecast_answer(query: Query, result: Result) -> AnswerTuple:
         elif result.location == "general":
             txt_id = _COUNTRY_FC_ID
 
-    try:
-        res = forecast_text(txt_id)
-    except Exception as e:
-        logging.warning(f"Failed to fetch weather text: {e}")
-        res = None
-
-    if (
-        not res
-        or "results" not in res
-        or not len(res["results"])
-        or "content" not in res["results"][0]
-    ):
+    res = _FORECASTS.get(txt_id)
+    if res is None:
         return gen_answer(_API_ERRMSG)
 
     answer: str = res["results"][0]["content"]
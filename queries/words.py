@@ -199,6 +199,11 @@ def spelling_answer_for_word(word: str, query: Query) -> AnswerTuple:
     return response, answ, voice
 
 
+# Queries for which the plain text router (see queries/__init__.py)
+# invokes handle_plain_text()
+PLAIN_TEXT_REGEXES = _SPELLING_RX + _DECLENSION_RX
+
+
 def handle_plain_text(q: Query) -> bool:
     """Handle a plain text query, contained in the q parameter."""
     ql = q.query_lower.rstrip("?")
@@ -60,7 +60,7 @@ from settings import Settings
 
 from db import SessionContext, Session, desc
 from db.models import Query as QueryRow
-from db.models import QueryData, QueryLog
+from db.models import QueryClientData, QueryLog
 from queries.extras.dialogue import (
     DialogueStateManager as DSM,
 )
@@ -1183,9 +1183,9 @@ class Query:
         with SessionContext(read_only=True) as session:
             try:
                 client_data = (
-                    session.query(QueryData)
-                    .filter(QueryData.key == key)
-                    .filter(QueryData.client_id == self.client_id)
+                    session.query(QueryClientData)
+                    .filter(QueryClientData.key == key)
+                    .filter(QueryClientData.client_id == self.client_id)
                 ).one_or_none()
                 return (
                     None
@@ -1207,9 +1207,9 @@ class Query:
         with SessionContext(read_only=True) as session:
             try:
                 client_data = (
-                    session.query(QueryData)
-                    .filter(QueryData.key == key)
-                    .filter(QueryData.client_id == client_id)
+                    session.query(QueryClientData)
+                    .filter(QueryClientData.key == key)
+                    .filter(QueryClientData.client_id == client_id)
                 ).one_or_none()
                 return (
                     None
@@ -1246,13 +1246,13 @@ class Query:
         try:
             with SessionContext(commit=True) as session:
                 row = (
-                    session.query(QueryData)
-                    .filter(QueryData.key == key)
-                    .filter(QueryData.client_id == client_id)
+                    session.query(QueryClientData)
+                    .filter(QueryClientData.key == key)
+                    .filter(QueryClientData.client_id == client_id)
                 ).one_or_none()
                 if row is None:
                     # Not already present: insert
-                    row = QueryData(
+                    row = QueryClientData(
                         client_id=client_id,
                         key=key,
                         created=now,
@@ -1284,11 +1284,11 @@ class Query:
         try:
             with SessionContext(commit=True) as session:
                 rows = (
-                    session.query(QueryData)
-                    .filter(QueryData.client_id == client_id)
-                    .filter(QueryData.key == "iot")
-                    # .filter(QueryData.data.contains(iot_group))
-                    # .filter(QueryData.data.contains(iot_name))
+                    session.query(QueryClientData)
+                    .filter(QueryClientData.client_id == client_id)
+                    .filter(QueryClientData.key == "iot")
+                    # .filter(QueryClientData.data.contains(iot_group))
+                    # .filter(QueryClientData.data.contains(iot_name))
                 ).all()
                 for row in rows:
                     iot_dict = row.data
@@ -0,0 +1,309 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module implements a background writer for the query log,
+    i.e. the queries table and its anonymized counterpart, the querylog
+    table, so that writing the log is not part of the latency of each
+    query response.
+
+    Logged queries are kept in an in-process buffer and written by a
+    background thread, in multi-row inserts, once the buffer holds a
+    batch of rows or the oldest row has waited for the flush interval.
+    If the buffer fills up, the caller writes it out itself. The buffer
+    is flushed when the process exits (see also worker_exit in
+    config/gunicorn_config.py).
+
+    Until they have been written, buffered rows are visible through
+    pending(), which the query code consults along with the database
+    when looking for cached answers and for a client's previous
+    answers and context (see queries/__init__.py). Other worker
+    processes see the rows once they have been written.
+
+    When a client's query history is cleared, forget() discards its
+    buffered rows before the database rows are deleted. Rows of the
+    client that were logged before the history was cleared are not
+    written afterwards, neither by this process nor, when the shared
+    cache is enabled (see main.py), by the other worker processes.
+
+"""
+
+from typing import Any, Deque, Dict, Iterable, List, Optional
+
+import os
+import time
+import atexit
+import logging
+import threading
+from collections import deque
+from datetime import datetime, timedelta
+
+from sqlalchemy import insert
+
+from db import SessionContext
+from db.models import Query as QueryRow, QueryLog
+from sharedcache import SQLiteCache
+
+
+# Time, in seconds, for which the worker processes remember that a
+# client's query history was cleared. This must exceed the time that
+# a row can wait in the buffer.
+_CLEARED_TTL = 300
+# Prefix of the shared cache keys holding the time when a client's
+# history was cleared, one key per client, so that concurrent clears
+# by different processes don't overwrite each other
+_CLEARED_KEY = "querylog:cleared:"
+
+
+class QueryLogWriter:
+    """Buffers query log rows and writes them in batches from a
+    background thread"""
+
+    def __init__(
+        self,
+        *,
+        interval: float = 0.25,
+        batch_size: int = 100,
+        max_pending: int = 5000,
+    ) -> None:
+        # Maximum time, in seconds, that a row waits in the buffer
+        self._interval = interval
+        # Number of rows that triggers an immediate write
+        self._batch_size = batch_size
+        # Maximum number of rows in the buffer
+        self._max_pending = max_pending
+        self._pid = 0
+        self._shared_cache: Optional[SQLiteCache] = None
+        self._init_process()
+
+    def _init_process(self) -> None:
+        """Initialize the buffer and the background thread state
+        of this process (also after a fork)"""
+        self._pid = os.getpid()
+        self._cond = threading.Condition()
+        self._queue: Deque[Dict[str, Any]] = deque()
+        # Rows that are being written, still visible through pending()
+        self._inflight: List[Dict[str, Any]] = []
+        # Serializes writes, including those made by callers
+        # when the buffer is full
+        self._write_lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+        # Time when the query history was cleared, by client id
+        self._cleared: Dict[str, datetime] = dict()
+        self._flushes = 0
+        self._written = 0
+        self._failed = 0
+        self._flush_total = 0.0
+        self._flush_max = 0.0
+        self._flush_last = 0.0
+
+    def use_shared_cache(self, cache: Optional[SQLiteCache]) -> None:
+        """Tell the other worker processes, through the given shared
+        cache, when a client's query history is cleared"""
+        self._shared_cache = cache
+
+    def _shared_cleared(self, clients: Iterable[Optional[str]]) -> Dict[str, datetime]:
+        """Return those of the given clients whose history was cleared
+        recently, according to the shared cache"""
+        cache = self._shared_cache
+        if cache is None:
+            return {}
+        cleared: Dict[str, datetime] = dict()
+        for c in set(clients):
+            t = cache.peek(_CLEARED_KEY + c) if c else None
+            if t is not None:
+                cleared[c] = t
+        return cleared
+
+    def _cleared_clients(self, shared: Dict[str, datetime]) -> Dict[str, datetime]:
+        """Return the clients whose history was cleared recently, by this
+        process or, according to shared, by the other processes. Must be
+        called with the condition held."""
+        cutoff = datetime.utcnow() - timedelta(seconds=_CLEARED_TTL)
+        cleared = {c: t for c, t in self._cleared.items() if t > cutoff}
+        self._cleared = dict(cleared)
+        for c, t in shared.items():
+            if t > cleared.get(c, cutoff):
+                cleared[c] = t
+        return cleared
+
+    @staticmethod
+    def _is_cleared(row: Dict[str, Any], cleared: Dict[str, datetime]) -> bool:
+        """Return True if the row was logged before its client's
+        query history was cleared"""
+        t = cleared.get(row.get("client_id") or "")
+        return t is not None and row["timestamp"] <= t
+
+    def forget(self, client_id: str) -> None:
+        """Discard the buffered rows of a client whose query history is
+        being cleared, waiting for any write in progress to finish, so
+        that the client's rows are in the database when this returns"""
+        if os.getpid() != self._pid:
+            self._init_process()
+        now = datetime.utcnow()
+        with self._cond:
+            self._cleared[client_id] = now
+            rows = [r for r in self._queue if r.get("client_id") != client_id]
+            self._queue.clear()
+            self._queue.extend(rows)
+        with self._write_lock:
+            # The batch being written, if any, may include the client's rows
+            pass
+        cache = self._shared_cache
+        if cache is not None:
+            cache.set(_CLEARED_KEY + client_id, now, timeout=_CLEARED_TTL)
+
+    def _ensure_thread(self) -> None:
+        """Start the background thread, if not already running
+        in this process. Must be called with the condition held."""
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=self._run, name="QueryLogWriter", daemon=True
+            )
+            self._thread.start()
+
+    def log(self, row: Dict[str, Any]) -> None:
+        """Add a row, keyed by column names of the queries table,
+        to the buffer"""
+        if os.getpid() != self._pid:
+            # We are in a forked child: don't touch the parent's state
+            self._init_process()
+        with self._cond:
+            if self._closed:
+                full = True
+            else:
+                self._ensure_thread()
+                full = len(self._queue) >= self._max_pending
+            self._queue.append(row)
+            if len(self._queue) >= self._batch_size:
+                self._cond.notify()
+        if full:
+            # The background writer is not keeping up (or we
+            # are shutting down): write the rows ourselves
+            self.flush()
+
+    def pending(self) -> List[Dict[str, Any]]:
+        """Return the rows that have not yet been written, oldest first"""
+        if os.getpid() != self._pid:
+            return []
+        with self._cond:
+            rows = self._inflight + list(self._queue)
+            if self._cleared:
+                cleared = self._cleared_clients({})
+                rows = [r for r in rows if not self._is_cleared(r, cleared)]
+            return rows
+
+    def _run(self) -> None:
+        """The background thread: write batches until closed"""
+        while True:
+            with self._cond:
+                while not self._queue and not self._closed:
+                    self._cond.wait()
+                if self._closed:
+                    return
+                # Give the batch a chance to fill up
+                deadline = time.monotonic() + self._interval
+                while len(self._queue) < self._batch_size and not self._closed:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._cond.wait(remaining)
+            self.flush()
+
+    def flush(self) -> int:
+        """Write all buffered rows to the database.
+        Returns the number of rows written."""
+        written = 0
+        with self._write_lock:
+            while True:
+                with self._cond:
+                    if not self._queue:
+                        break
+                    n = min(len(self._queue), self._batch_size)
+                    rows = [self._queue.popleft() for _ in range(n)]
+                    self._inflight = rows
+                shared = self._shared_cleared(r.get("client_id") for r in rows)
+                with self._cond:
+                    cleared = self._cleared_clients(shared)
+                    if cleared:
+                        rows = [r for r in rows if not self._is_cleared(r, cleared)]
+                    self._inflight = rows
+                if not rows:
+                    continue
+                t0 = time.perf_counter()
+                try:
+                    self._write(rows)
+                    written += len(rows)
+                except Exception as e:
+                    logging.error(f"Error writing {len(rows)} query log rows: {e}")
+                    self._failed += len(rows)
+                finally:
+                    elapsed = time.perf_counter() - t0
+                    with self._cond:
+                        self._inflight = []
+                        self._flushes += 1
+                        self._flush_total += elapsed
+                        self._flush_last = elapsed
+                        self._flush_max = max(self._flush_max, elapsed)
+        self._written += written
+        return written
+
+    @staticmethod
+    def _write(rows: List[Dict[str, Any]]) -> None:
+        """Insert a batch of rows into the queries and querylog tables,
+        using one multi-row insert statement for each"""
+        with SessionContext(commit=True) as session:
+            session.execute(insert(QueryRow).values(rows))
+            session.execute(
+                insert(QueryLog).values(
+                    [{f: row.get(f) for f in QueryLog.FIELDS} for row in rows]
+                )
+            )
+
+    def close(self) -> None:
+        """Stop the background thread and write any remaining rows"""
+        if os.getpid() != self._pid:
+            return
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout=5.0)
+        self.flush()
+
+    def metrics(self) -> Dict[str, Any]:
+        """Return the queue depth and write statistics of this process"""
+        with self._cond:
+            return dict(
+                pid=self._pid,
+                queue_depth=len(self._queue) + len(self._inflight),
+                flushes=self._flushes,
+                written=self._written,
+                failed=self._failed,
+                flush_last=round(self._flush_last, 6),
+                flush_avg=round(self._flush_total / max(1, self._flushes), 6),
+                flush_max=round(self._flush_max, 6),
+            )
+
+
+# The query log writer of this process
+query_log = QueryLogWriter()
+
+atexit.register(query_log.close)
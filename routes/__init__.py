@@ -26,6 +26,7 @@
 
 from typing import Dict, Callable, Union, Optional, Any
 
+import logging
 import threading
 import time
 import uuid
@@ -49,6 +50,8 @@ from werkzeug.datastructures import FileStorage
 from werkzeug.exceptions import HTTPException, InternalServerError
 import flask_caching  # type: ignore
 
+from sharedcache import SQLiteCache
+
 
 CacheableFunc = Callable[..., Union[str, Response]]
 ProgressFunc = Callable[[float], None]
@@ -68,6 +71,39 @@ cache: flask_caching.Cache = current_app.config["CACHE"]
 routes: Blueprint = Blueprint("routes", __name__)
 
 
+def cached(
+    timeout: int, key_prefix: str
+) -> Callable[[CacheableFunc], Callable[..., Any]]:
+    """Caching decorator for Flask - caches the response of a view,
+    keyed by the request path and query string. With the shared cache
+    (see sharedcache.py), concurrent misses for the same key in
+    different worker processes compute the response only once."""
+
+    def decorator(f: CacheableFunc) -> Callable[..., Any]:
+        cached_f = cache.cached(
+            timeout=timeout, key_prefix=key_prefix, query_string=True
+        )(f)
+
+        @wraps(f)
+        def decorated_function(*args: Any, **kwargs: Any) -> Any:
+            backend = cache.cache
+            if not isinstance(backend, SQLiteCache):
+                return cached_f(*args, **kwargs)
+            try:
+                key = cached_f.make_cache_key(*args, use_request=True, **kwargs)
+            except Exception:
+                logging.exception("Exception possibly due to cache backend.")
+                return f(*args, **kwargs)
+            # Errors of the cache backend are logged, not raised
+            return backend.get_or_compute(
+                key, lambda: f(*args, **kwargs), timeout=timeout
+            )
+
+        return decorated_function
+
+    return decorator
+
+
 def max_age(
     seconds: int,
 ) -> Callable[[CacheableFunc], Callable[..., Response]]:
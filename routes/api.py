@@ -27,6 +27,7 @@ from typing_extensions import TypedDict
 
 from datetime import datetime
 import logging
+from itertools import chain
 from pathlib import Path
 
 try:
@@ -40,6 +41,11 @@ from flask.wrappers import Response, Request
 from settings import Settings
 
 from tnttagger import ifd_tag
+from warmup import is_ready, report as warmup_report
+from sharedcache import SQLiteCache
+from querylog import query_log
+import httpclient
+from images import image_metrics
 from db import SessionContext
 from db.models import ArticleTopic, Query, QueryClientData, Summary
 from geo import LatLonTuple
@@ -52,18 +58,22 @@ from queries import Query as QueryObject
 from speech import (
     GreynirSSMLParser,
     text_to_audio_url,
+    text_to_audio_urls,
+    text_to_audio_stream,
+    DEFAULT_AUDIO_FORMAT,
     DEFAULT_VOICE,
     SUPPORTED_VOICES,
     RECOMMENDED_VOICES,
     DEFAULT_VOICE_SPEED,
 )
-from speech.voices import voice_for_locale
+from speech.voices import voice_for_locale, mimetype_for_audiofmt
 from queries.util.openai_gpt import summarize
+from queries.util.sources import source_metrics
 from utility import read_txt_api_key, icelandic_asciify
 from queries.extras.sonos import SonosClient
 from queries.extras.spotify import SpotifyClient
 
-from . import routes, better_jsonify, text_from_request, bool_from_request
+from . import routes, cache, better_jsonify, text_from_request, bool_from_request
 from . import MAX_URL_LENGTH, MAX_UUID_LENGTH
 
 
@@ -396,6 +406,9 @@ def query_api(version: int = 1) -> Response:
 
     # If voice is set, return a voice-friendly string
     voice = bool_from_request(request, "voice")
+    # If audio_chunks is set, synthesize the voice answer sentence by sentence
+    # and return an ordered list of audio URLs, one for each sentence
+    audio_chunks = bool_from_request(request, "audio_chunks")
     # Request a particular voice
     voice_id: str = icelandic_asciify(rv.get("voice_id", DEFAULT_VOICE))
     # Request a particular voice speed
@@ -486,9 +499,23 @@ def query_api(version: int = 1) -> Response:
                 vid = voice_for_locale(result["voice_locale"])
             result["voice_id"] = vid
             # Create audio data
-            url = text_to_audio_url(v, voice_id=vid, speed=voice_speed)
-            if url:
-                result["audio"] = file_url_to_host_url(url, request)
+            if audio_chunks:
+                try:
+                    urls = [
+                        file_url_to_host_url(u, request)
+                        for u in text_to_audio_urls(v, voice_id=vid, speed=voice_speed)
+                    ]
+                except Exception as e:
+                    # Don't return audio with sentences missing
+                    logging.warning(f"Speech synthesis failed: {e}")
+                    urls = []
+                if urls:
+                    result["audio"] = urls[0]
+                    result["audio_chunks"] = urls
+            else:
+                url = text_to_audio_url(v, voice_id=vid, speed=voice_speed)
+                if url:
+                    result["audio"] = file_url_to_host_url(url, request)
         response = cast(Optional[Dict[str, str]], result.get("response"))
         if response:
             if "sources" in response:
@@ -548,6 +575,10 @@ def query_history_api(version: int = 1) -> Response:
             errmsg=f"Invalid action parameter '{action}'. Should be in {VALID_ACTIONS}.",
         )
 
+    # Make sure that no buffered queries of the client
+    # are written after they have been deleted
+    query_log.forget(client_id)
+
     with SessionContext(commit=True) as session:
         # Clear all logged user queries
         # pylint: disable=no-member
@@ -565,7 +596,10 @@ def query_history_api(version: int = 1) -> Response:
 @routes.route("/speech.api", methods=["GET", "POST"])
 @routes.route("/speech.api/v<int:version>", methods=["GET", "POST"])
 def speech_api(version: int = 1) -> Response:
-    """Send in text, receive URL to speech synthesized audio file."""
+    """Send in text, receive URL to speech synthesized audio file.
+    If stream is set, the audio itself is returned, synthesized and
+    sent sentence by sentence as chunked audio. If chunks is set,
+    a list of URLs to audio files, one for each sentence, is returned."""
 
     if not (1 <= version <= 1):
         return better_jsonify(valid=False, reason="Unsupported version")
@@ -590,6 +624,43 @@ def speech_api(version: int = 1) -> Response:
     except ValueError:
         voice_speed = DEFAULT_VOICE_SPEED
 
+    if bool_from_request(request, "stream"):
+        # Playback can start as soon as the first sentence has been synthesized
+        audio = text_to_audio_stream(
+            text,
+            text_format=fmt,
+            voice_id=voice_id,
+            speed=voice_speed,
+        )
+        try:
+            # Synthesize the first sentence before responding,
+            # so that its failure can still be reported
+            first = next(audio)
+        except Exception:
+            return better_jsonify(**reply)
+        # If a later sentence fails, the exception aborts the response,
+        # so the client gets an incomplete chunked transfer rather than
+        # a complete response with audio missing
+        return Response(
+            chain([first], audio), mimetype=mimetype_for_audiofmt(DEFAULT_AUDIO_FORMAT)
+        )
+
+    if bool_from_request(request, "chunks"):
+        try:
+            urls = text_to_audio_urls(
+                text,
+                text_format=fmt,
+                voice_id=voice_id,
+                speed=voice_speed,
+            )
+        except Exception:
+            return better_jsonify(**reply)
+        urls = [file_url_to_host_url(u, request) for u in urls]
+        reply["audio_url"] = urls[0] if urls else None
+        reply["audio_urls"] = urls
+        reply["err"] = False
+        return better_jsonify(**reply)
+
     try:
         url = text_to_audio_url(
             text,
@@ -624,6 +695,45 @@ def voices_api(version: int = 1) -> Response:
     )
 
 
+@routes.route("/ready.api", methods=["GET"])
+def ready_api() -> Response:
+    """Readiness probe: returns HTTP 200 once the parser, BÍN and the
+    query modules have been loaded (see warmup.py), otherwise HTTP 503.
+    The development server, which doesn't warm up, is always ready.
+    Also reports the usage of this worker's database connection pool,
+    the state of its query log writer (see querylog.py), the latency
+    of its outbound HTTP requests per host (see httpclient.py) and the
+    hit rate of its image link cache (see images.py)."""
+    resp = better_jsonify(
+        **warmup_report(),
+        db=SessionContext.db.pool_status(),
+        querylog=query_log.metrics(),
+        http=httpclient.metrics(),
+        images=image_metrics(),
+    )
+    if not is_ready():
+        resp.status_code = 503
+    return resp
+
+
+@routes.route("/cache.api", methods=["GET"])
+def cache_api() -> Response:
+    """Return hit/miss metrics and size of the shared response cache,
+    per route, summed over all worker processes (see sharedcache.py)"""
+    backend = cache.cache
+    if not isinstance(backend, SQLiteCache):
+        return better_jsonify(valid=False, reason="Shared cache not enabled")
+    return better_jsonify(valid=True, routes=backend.metrics())
+
+
+@routes.route("/sources.api", methods=["GET"])
+def sources_api() -> Response:
+    """Return the age of the cached data from external services used by
+    the query modules, and the latency and failures of fetching it, per
+    source, in this worker process (see queries/util/sources.py)"""
+    return better_jsonify(valid=True, sources=source_metrics())
+
+
 @routes.route("/exit.api", methods=["GET"])
 def exit_api():
     """Allow a server to be remotely terminated if running in debug mode"""
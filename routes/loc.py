@@ -24,7 +24,7 @@
 from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple, Union, cast
 from typing_extensions import TypedDict
 
-from . import routes, better_jsonify, cache, days_from_period_arg
+from . import routes, better_jsonify, cached, days_from_period_arg
 
 from datetime import datetime, timedelta
 from collections import defaultdict
@@ -204,7 +204,7 @@ def world_map_data(days: int = _TOP_LOC_PERIOD) -> Dict[str, int]:
 
 
 @routes.route("/locations", methods=["GET"])
-@cache.cached(timeout=30 * 60, key_prefix="locations", query_string=True)
+@cached(timeout=30 * 60, key_prefix="locations")
 def locations():
     """Render locations page."""
     kind = request.args.get("kind")
@@ -220,7 +220,7 @@ def locations():
 
 
 @routes.route("/locations_icemap", methods=["GET"])
-@cache.cached(timeout=30 * 60, key_prefix="icemap", query_string=True)
+@cached(timeout=30 * 60, key_prefix="icemap")
 def locations_icemap():
     """Render Icelandic map locations page."""
     period = request.args.get("period", "")
@@ -236,7 +236,7 @@ def locations_icemap():
 
 
 @routes.route("/locations_worldmap", methods=["GET"])
-@cache.cached(timeout=30 * 60, key_prefix="worldmap", query_string=True)
+@cached(timeout=30 * 60, key_prefix="worldmap")
 def locations_worldmap():
     """Render world map locations page."""
     period = request.args.get("period", "")
@@ -255,7 +255,7 @@ def locations_worldmap():
 
 
 @routes.route("/staticmap", methods=["GET"])
-@cache.cached(timeout=60 * 60 * 24, key_prefix="staticmap", query_string=True)
+@cached(timeout=60 * 60 * 24, key_prefix="staticmap")
 def staticmap():
     """Proxy for Google Static Maps API."""
     try:
@@ -278,7 +278,7 @@ ZOOM_FOR_LOC_KIND = {"street": 11, "address": 12, "placename": 5, "country": 2}
 
 
 @routes.route("/locinfo", methods=["GET"])
-@cache.cached(timeout=60 * 60 * 24, key_prefix="locinfo", query_string=True)
+@cached(timeout=60 * 60 * 24, key_prefix="locinfo")
 def locinfo():
     """Return info about a location as JSON."""
     resp: Dict[str, Union[None, str, bool]] = dict(found=False)
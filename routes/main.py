@@ -51,7 +51,7 @@ from search import Search
 from treeutil import TreeUtility, StatsDict
 from images import Img, get_image_url, update_broken_image_url, blacklist_image_url
 
-from . import routes, max_age, cache, better_jsonify, restricted, Response
+from . import routes, max_age, cached, better_jsonify, restricted, Response
 from . import MAX_URL_LENGTH, MAX_UUID_LENGTH, MAX_TEXT_LENGTH_VIA_URL
 
 
@@ -484,7 +484,7 @@ def image() -> Response:
 
 
 @routes.route("/suggest", methods=["GET"])
-@cache.cached(timeout=30 * 60, key_prefix="suggest", query_string=True)
+@cached(timeout=30 * 60, key_prefix="suggest")
 def suggest(limit: int=10) -> Response:
     """Return suggestions for query field autocompletion"""
     limit = int(request.args.get("limit", limit))
@@ -21,20 +21,21 @@
 
 """
 
-from typing import Any, Dict, List, Set, Tuple, cast, Counter as CounterType
+from typing import Any, Dict, List, Tuple, cast, Counter as CounterType
 
-from . import routes, max_age, cache, restricted, days_from_period_arg
+from . import routes, max_age, cached, restricted, days_from_period_arg
 
 from datetime import datetime, timedelta
 from collections import defaultdict, Counter
-from itertools import permutations
 
 from flask import request, render_template
 
-from settings import changedlocale
+from settings import Settings, changedlocale
 
 from db import SessionContext, desc
 from db.models import Person, Article, Root, Word, Column
+from db.sql import PersonGraphQuery
+from images import ImagePrefetcher
 
 from reynir import correct_spaces
 from reynir.bindb import GreynirBin
@@ -150,67 +151,56 @@ def top_persons(
     return personlist[:limit]
 
 
-_DEFAULT_NUM_PERSONS_GRAPH = 50
+# Looks up images for the persons most mentioned in recent articles in
+# the background, so that they are cached before the first query or
+# page view asks for them (started in config/gunicorn_config.py)
+image_prefetcher = ImagePrefetcher(
+    lambda: [p["name"] for p in top_persons()],
+    interval=Settings.IMAGE_PREFETCH_INTERVAL,
+)
 
 
-def graph_data(num_persons: int=_DEFAULT_NUM_PERSONS_GRAPH):
-    """Get and prepare data for people graph"""
-    with SessionContext(read_only=True) as session:
-        # Find all persons mentioned in articles that
-        # have at least two names (i.e. match whitespace)
-        q = (
-            session.query(Word.stem, Word.article_id, Word.cat)
-            .filter(Word.cat.like("person_%"))
-            .filter(Word.stem.like("% %"))
-        )
-        res: List[Tuple[str, str, str]] = q.all()
-
-        # Count number of occurrences of each name
-        cnt: CounterType[str] = Counter()
-        for name, _, _ in res:
-            cnt[name] += 1
-
-        # Get most common names
-        names = [name for name, _ in cnt.most_common(num_persons)]
-
-        # Generate dict mapping article ids to a set of top names mentioned
-        articles: Dict[str, Set[str]] = defaultdict(set)
-        for name, art_id, _ in res:
-            if name in names:
-                articles[art_id].add(name)
-
-        # Find all links
-        nlinks: Dict[Tuple[int, int], int] = defaultdict(int)
-        for _, persons in articles.items():
-            if len(persons) < 2:
-                # We need at least two names to establish link
-                continue
-
-            # Find all permutations of people mentioned in article
-            perm = list(permutations(persons, 2))
-            for a, b in perm:
-                # We use a sorted tuple as hashable dict key when
-                # counting number of connections between any two names
-                k = tuple(sorted([names.index(a), names.index(b)]))
-                nlinks[cast(Tuple[int, int], k)] += 1
-
-        # Create final link and node data structures
-        links = [
-            {"source": k[0], "target": k[1], "weight": v} for k, v in nlinks.items()
-        ]
-        nodes = []
-        for idx, n in enumerate(names):
-            # print(cnt[n])
-            # TODO: Normalize influence
-            nodes.append({"name": n, "id": idx, "influence": cnt[n] / 7, "zone": 0})
-
-        dataset = {"nodes": nodes, "links": links}
-
-        return dataset
+_DEFAULT_NUM_PERSONS_GRAPH = 50
+_DEFAULT_GRAPH_PERIOD = 30  # in days
+
+
+def graph_data(
+    num_persons: int = _DEFAULT_NUM_PERSONS_GRAPH, days: int = _DEFAULT_GRAPH_PERIOD
+) -> Dict[str, Any]:
+    """Get and prepare data for people graph, from the daily
+    person co-occurrence counts (see PersonPairsRollup in db/sql.py)"""
+    end = datetime.utcnow().date() + timedelta(days=1)
+    start = end - timedelta(days=days)
+
+    # Number of articles mentioning each of the top persons,
+    # and each pair of them
+    cnt: CounterType[str] = Counter()
+    pairs: List[Tuple[str, str, int]] = []
+    for a, b, n in PersonGraphQuery.period(start, end, num_persons):
+        if a == b:
+            cnt[a] = n
+        else:
+            pairs.append((a, b, n))
+
+    names = [name for name, _ in cnt.most_common()]
+    index = {name: idx for idx, name in enumerate(names)}
+
+    # Create final link and node data structures
+    # (the weight is twice the number of articles mentioning
+    # both persons, for consistency with earlier versions)
+    links = [
+        {"source": index[a], "target": index[b], "weight": 2 * n} for a, b, n in pairs
+    ]
+    nodes = []
+    for idx, n in enumerate(names):
+        # TODO: Normalize influence
+        nodes.append({"name": n, "id": idx, "influence": cnt[n] / 7, "zone": 0})
+
+    return {"nodes": nodes, "links": links}
 
 
 @routes.route("/people_recent")
-@cache.cached(timeout=10 * 60, key_prefix="people", query_string=True)
+@cached(timeout=10 * 60, key_prefix="people")
 @max_age(seconds=10 * 60)
 def people_recent():
     """Page with a list of people recently appearing in articles"""
@@ -220,7 +210,7 @@ def people_recent():
 
 
 @routes.route("/people")
-@cache.cached(timeout=30 * 60, key_prefix="people_top", query_string=True)
+@cached(timeout=30 * 60, key_prefix="people_top")
 @max_age(seconds=10 * 60)
 def people_top():
     """Page showing people most frequently mentioned in recent articles"""
@@ -239,7 +229,9 @@ def people_top():
 def people_graph():
     """Page with a weighted, force directed graph of relations
     between people via mentions in articles."""
-    return render_template("people/graph.html", graph_data=graph_data())
+    period = request.args.get("period", "")
+    days = days_from_period_arg(period, _DEFAULT_GRAPH_PERIOD)
+    return render_template("people/graph.html", graph_data=graph_data(days=days))
 
 
 @routes.route("/people_timeline")
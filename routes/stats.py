@@ -21,7 +21,7 @@
 
 """
 
-from typing import Any, Dict, List, Optional, Union, Iterable
+from typing import Any, Dict, List, Optional, Tuple, Union, Iterable
 
 from werkzeug.wrappers import Response
 
@@ -29,13 +29,13 @@ from werkzeug.wrappers import Response
 import json
 import logging
 from colorsys import hsv_to_rgb
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 from decimal import Decimal
 
 from flask import request, render_template
 from reynir.bindb import GreynirBin
 
-from . import routes, cache, max_age
+from . import routes, cached, max_age
 from settings import changedlocale
 from utility import read_txt_api_key
 from db import SessionContext, Session
@@ -47,6 +47,7 @@ from db.sql import (
     QueryCountQuery,
     QueryTypesQuery,
     QueryClientTypeQuery,
+    QueryStatsQuery,
     TopUnansweredQueriesQuery,
     TopAnsweredQueriesQuery,
 )
@@ -86,29 +87,28 @@ def chart_stats(session: Optional[Session] = None, num_days: int = 7) -> Dict[st
     sources: Dict[str, List[int]] = {}
     parsed_data: List[float] = []
 
-    # Get article count for each source for each day, and query count for each day
+    # Get article count per source for each day, along with
+    # parsing stats for the parse % chart, from the daily rollup
+    start = today - timedelta(days=num_days - 1)
+    end = today + timedelta(days=1)
+    days: Dict[date, Tuple[int, int]] = {}
+    for day, name, cnt, s, p in ChartsQuery.period(
+        start.date(), end.date(), enclosing_session=session
+    ):
+        sources.setdefault(name, []).append(cnt)
+        sent, parsed = days.get(day, (0, 0))
+        days[day] = (sent + s, parsed + p)
+
     # We change locale to get localized weekday/month names
     with changedlocale(category="LC_TIME"):
         for n in range(0, num_days):
-            days_back = num_days - n - 1
-            start = today - timedelta(days=days_back)
-            end = today - timedelta(days=days_back - 1)
+            day = start + timedelta(days=n)
 
             # Generate date label
             dfmtstr = "%a %-d. %b"
-            labels.append(start.strftime(dfmtstr))
-
-            sent = 0
-            parsed = 0
-
-            # Get article count per source for day
-            # Also collect parsing stats for parse % chart
-            q = ChartsQuery.period(start, end, enclosing_session=session)
-            for name, cnt, s, p in q:
-                sources.setdefault(name, []).append(cnt)
-                sent += s
-                parsed += p
+            labels.append(day.strftime(dfmtstr))
 
+            sent, parsed = days.get(day.date(), (0, 0))
             percent = round((parsed / sent) * 100, 2) if sent else 0
             parsed_data.append(percent)
 
@@ -158,7 +158,7 @@ def top_authors(
 
 
 @routes.route("/stats", methods=["GET"])
-@cache.cached(timeout=30 * 60, key_prefix="stats", query_string=True)
+@cached(timeout=30 * 60, key_prefix="stats")
 @max_age(seconds=30 * 60)
 def stats() -> Union[Response, str]:
     """Render a page containing various statistics from the Greynir database."""
@@ -224,6 +224,12 @@ _DEFAULT_QUERY_STATS_PERIOD = 30
 _MAX_QUERY_STATS_PERIOD = 30
 
 
+def _client_key(item: Tuple[Tuple[str, Optional[str]], int]) -> Tuple[str, str]:
+    """Sort key for client types: by type, then version"""
+    (client_type, client_version), _ = item
+    return (client_type, client_version or "")
+
+
 def query_stats_data(
     session: Optional[Session] = None, num_days: int = _DEFAULT_QUERY_STATS_PERIOD
 ) -> Dict[str, Any]:
@@ -234,39 +240,54 @@ def query_stats_data(
     query_count_data = []
     unique_count_data = []
 
+    start = today - timedelta(days=num_days)
+    end = datetime.utcnow()
+
+    # Past days are read from the daily rollup in the querystats table,
+    # while today's numbers are computed from the queries table
+    counts: Dict[date, Tuple[int, int]] = {}
+    qtypes: Dict[str, int] = {}
+    client_types: Dict[Tuple[str, Optional[str]], int] = {}
+    for day, cnt, clients, qt, ct in QueryStatsQuery.period(
+        start.date(), today.date(), enclosing_session=session
+    ):
+        counts[day] = (cnt, clients)
+        for qtype, n in qt.items():
+            qtypes[qtype] = qtypes.get(qtype, 0) + n
+        for client_type, client_version, n in ct:
+            key = (client_type, client_version)
+            client_types[key] = client_types.get(key, 0) + n
+
+    q = list(QueryCountQuery.period(today, end, enclosing_session=session))
+    counts[today.date()] = (q[0][0], q[0][1])
+    for n, qtype in QueryTypesQuery.period(today, end, enclosing_session=session):
+        qtypes[qtype] = qtypes.get(qtype, 0) + n
+    for client_type, client_version, n in QueryClientTypeQuery.period(
+        today, end, enclosing_session=session
+    ):
+        key = (client_type, client_version)
+        client_types[key] = client_types.get(key, 0) + n
+
     # Get query count for each day
     # We change locale to get localized date weekday/month names
     with changedlocale(category="LC_TIME"):
         for n in range(0, num_days):
-            days_back = num_days - n - 1
-            start = today - timedelta(days=days_back)
-            end = today - timedelta(days=days_back - 1)
+            day = today - timedelta(days=num_days - n - 1)
 
             # Generate date label
             dfmtstr = "%a %-d. %b"
-            labels.append(start.strftime(dfmtstr))
-
-            # Get query count for day
-            q = list(QueryCountQuery.period(start, end, enclosing_session=session))
-            query_count_data.append(q[0][0])
+            labels.append(day.strftime(dfmtstr))
 
-            # Get num unique clients for day
-            unique_count_data.append(q[0][1])
+            # Get query count and num unique clients for day
+            cnt, clients = counts.get(day.date(), (0, 0))
+            query_count_data.append(cnt)
+            unique_count_data.append(clients)
 
     query_avg = sum(query_count_data) / num_days
     unique_avg = sum(unique_count_data) / num_days
 
-    start = today - timedelta(days=num_days)
-    end = datetime.utcnow()
-
-    # Query types
-    res = list(
-        QueryTypesQuery.period(
-            start=start,
-            end=end,
-            enclosing_session=session,
-        )
-    )
+    # Query types, most frequent first
+    res = sorted(((n, qtype) for qtype, n in qtypes.items()), reverse=True)
     total = sum([k[0] for k in res])
 
     # This function is used to ensure that all the query
@@ -300,7 +321,7 @@ def query_stats_data(
         "python": "#ffff00",
         "www": "#f7b924",
     }
-    res = QueryClientTypeQuery.period(start, end)
+    res = [(t, v, n) for (t, v), n in sorted(client_types.items(), key=_client_key)]
     total = sum([k[2] for k in res])
     client_types_data = {
         "labels": [f"{k[0]} {k[1] or ''}".rstrip() for k in res],
@@ -347,7 +368,7 @@ def query_stats_data(
 
 
 @routes.route("/stats/queries", methods=["GET"])
-@cache.cached(timeout=30 * 60, key_prefix="stats_queries", query_string=True)
+@cached(timeout=30 * 60, key_prefix="stats_queries")
 @max_age(seconds=30 * 60)
 def stats_queries() -> Union[Response, str]:
     """Render a page containing various statistics on query engine usage."""
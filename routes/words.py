@@ -25,7 +25,7 @@ from typing import Iterable, List, Optional, Union, Tuple, Dict, Any, cast
 
 import logging
 
-from . import routes, better_jsonify, cache
+from . import routes, better_jsonify, cached
 
 from datetime import datetime, timedelta
 from flask import request, render_template
@@ -133,7 +133,7 @@ def _desc4word(wc: Tuple[str, str]) -> str:
 
 
 @routes.route("/wordfreq", methods=["GET", "POST"])
-@cache.cached(timeout=60 * 60 * 4, key_prefix="wordfreq", query_string=True)
+@cached(timeout=60 * 60 * 4, key_prefix="wordfreq")
 def wordfreq():
     """Return word frequency chart data for a given time period."""
     resp: Dict[str, Any] = dict(err=True)
@@ -245,20 +245,17 @@ def wordfreq():
         labels=labels, labelDates=label_date_strings, datasets=[]
     )
     with SessionContext(commit=False) as session:
+        # Look up frequency of all words for the given period
+        freqs = WordFrequencyQuery.frequency(
+            words,
+            date_from,
+            date_to,
+            timeunit=timeunit,
+            enclosing_session=session,
+        )
         for w in words:
-            # Look up frequency of word for the given period
             (wd, cat) = w
-            res = (
-                WordFrequencyQuery.frequency(
-                    wd,
-                    cat,
-                    date_from,
-                    date_to,
-                    timeunit=timeunit,
-                    enclosing_session=session,
-                )
-                or []
-            )
+            res = freqs.get(w) or []
             # Generate data and config for chart
             label = f"{wd} ({CAT_DESC.get(cat)})"
             ds: Dict[str, Any] = dict(label=label, fill=False, lineTension=0)
@@ -41,6 +41,7 @@ import gc
 import getopt
 import time
 import logging
+import urllib.parse as urlparse
 
 import traceback
 
@@ -54,8 +55,14 @@ from settings import Settings, ConfigError
 from fetcher import Fetcher
 from article import Article
 
-from db import SessionContext, IntegrityError
+from db import GreynirDB, SessionContext
 from db.models import Root, Article as ArticleRow
+from db.sql import (
+    ArticleStatsRollup,
+    PersonPairsRollup,
+    QueryStatsRollup,
+    WordFrequencyRollup,
+)
 from db.setup import init_roots
 
 import feedparser  # type: ignore
@@ -121,45 +128,49 @@ class Scraper:
 
         return fetch_set
 
+    @staticmethod
+    def normalize_urls(fetch_set: Set[str], helper: Optional[ModuleType]) -> Set[str]:
+        """Normalize and deduplicate a set of discovered URLs, removing
+        fragments and those that the scrape helper doesn't want"""
+        result: Set[str] = set()
+        for url in fetch_set:
+            url, _ = urlparse.urldefrag(url.strip())
+            if not url.startswith(("http:", "https:")):
+                continue
+            if helper and helper.skip_url(url):
+                # The helper doesn't want this URL
+                continue
+            result.add(url)
+        # Don't fetch both http and https versions of the same article
+        return {
+            url
+            for url in result
+            if not (url.startswith("http:") and ("https:" + url[5:]) in result)
+        }
+
     def scrape_root(self, root: Root, helper: ModuleType) -> None:
         """Scrape a root URL"""
 
         t0 = time.time()
 
-        fetch_set = self.urls2fetch(root, helper)
+        fetch_set = self.normalize_urls(self.urls2fetch(root, helper), helper)
 
         # Add the children whose URLs we don't already have
-        # stored in the scraper articles table
-        with SessionContext() as session:
-            for url in fetch_set:
-                if helper and helper.skip_url(url):
-                    # The helper doesn't want this URL
-                    continue
-
-                if url.startswith("http:") and ("https:" + url[5:]) in fetch_set:
-                    # Don't fetch both http and https versions of the same article
-                    continue
-
-                # noinspection PyBroadException
-                try:
-                    article = ArticleRow(url=url, root_id=root.id)
-                    # Leave article.scraped as NULL for later retrieval
-                    session.add(article)
-                    session.commit()
-                except IntegrityError:
-                    # Article URL already exists in database:
-                    # roll back and continue
-                    session.rollback()
-                except Exception as e:
-                    logging.warning(
-                        f"Rollback due to exception when handling URL '{url}': {e}"
-                    )
-                    session.rollback()
+        # stored in the scraper articles table, leaving
+        # article.scraped as NULL for later retrieval
+        added = 0
+        with SessionContext(commit=True) as session:
+            try:
+                added = ArticleRow.add_urls(session, root.id, fetch_set)
+            except Exception as e:
+                logging.warning(f"Exception when adding URLs of root {root.url}: {e}")
+                session.rollback()
 
         t1 = time.time()
 
         logging.info(
-            "Root scrape of {0} completed in {1:.2f} seconds".format(str(root), t1 - t0)
+            "Root scrape of {0} completed in {1:.2f} seconds, "
+            "{2} of {3} URLs new".format(str(root), t1 - t0, added, len(fetch_set))
         )
 
     def scrape_article(self, url: str, helper: ModuleType) -> None:
@@ -189,6 +200,7 @@ class Scraper:
         t0 = time.time()
         num_sentences = 0
         num_parsed = 0
+        text_time_saved: Optional[float] = None
 
         # Load the article
         with SessionContext(commit=True) as session:
@@ -197,6 +209,7 @@ class Scraper:
                 a.parse(session)
                 num_sentences = a.num_sentences
                 num_parsed = a.num_parsed
+                text_time_saved = a.text_time_saved
 
         t1 = time.time()
         logging.info(
@@ -204,6 +217,12 @@ class Scraper:
                 t1 - t0, num_sentences, num_parsed, seq
             )
         )
+        if text_time_saved is not None:
+            logging.info(
+                "[{1}] Cached article text saved {0:.3f} seconds".format(
+                    text_time_saved, seq
+                )
+            )
 
     def _scrape_single_root(self, r: Root) -> None:
         """Single root scraper that will be called by a process within a
@@ -272,6 +291,10 @@ class Scraper:
         version = Article.parser_version()
         cnt = 0
 
+        # Look up scrape helpers from the roots as they are now, also
+        # in the worker processes forked below
+        Fetcher.reset_root_index()
+
         with SessionContext(commit=True) as session:
             # Use a multiprocessing pool to parse the articles.
             # Let the pool work on chunks of articles, recycling the
@@ -532,9 +555,28 @@ def scrape_articles(
     if count:
         logging.info("Average: {0:.2f} seconds per article".format((t1 - t0) / count))
 
+    # Bring the daily statistics used by the stats pages up to date
+    update_stats()
+
     logging.info("------ Scrape completed -------")
 
 
+def update_stats() -> None:
+    """Update the daily rollups of article and query statistics
+    and of person co-occurrences"""
+    t0 = time.time()
+    try:
+        days = ArticleStatsRollup.update()
+        logging.info("Article statistics updated for {0} day(s)".format(days))
+        days = QueryStatsRollup.update()
+        logging.info("Query statistics updated for {0} day(s)".format(days))
+        days = PersonPairsRollup.update()
+        logging.info("Person co-occurrences updated for {0} day(s)".format(days))
+    except Exception as e:
+        logging.warning("Exception when updating statistics: {0}".format(e))
+    logging.info("Statistics updated in {0:.1f} seconds".format(time.time() - t0))
+
+
 __doc__ = """
 
     Greynir - Natural language processing for Icelandic
@@ -642,6 +684,8 @@ def main(argv: Optional[List[str]] = None):
             Settings.read("config/Greynir.conf")
             # Don't run the scraper in debug mode unless --debug is specified
             Settings.DEBUG = debug
+            # Configure the database connection pool for the scraper processes
+            GreynirDB.configure("scraper")
         except ConfigError as e:
             print("Configuration error: {0}".format(e), file=sys.stderr)
             return 2
@@ -649,6 +693,12 @@ def main(argv: Optional[List[str]] = None):
         if init:
             # Initialize the scraper database
             init_roots()
+            # Roots may have been added
+            Fetcher.reset_root_index()
+            # Populate the daily word frequencies, if required
+            days = WordFrequencyRollup.populate()
+            if days:
+                print("Word frequencies computed for {0} days".format(days))
         else:
             # Run the scraper
             scrape_articles(
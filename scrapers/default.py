@@ -30,23 +30,36 @@ from __future__ import annotations
 
 from typing import Iterable, Match, Optional, Sequence, Union, List, cast
 
+import os
 import re
 import logging
 import urllib.parse as urlparse
-import requests
+import httpclient
 import json
 from datetime import datetime
 
-from bs4 import BeautifulSoup
+from bs4 import BeautifulSoup, FeatureNotFound
 from bs4.element import Tag, NavigableString
 
 from db.models import Root
 
 MODULE_NAME = __name__
 
-# The HTML parser to use with BeautifulSoup
-# _HTML_PARSER = "html5lib"
-_HTML_PARSER = "html.parser"
+# The HTML parser to use with BeautifulSoup. This is Python's built-in
+# html.parser unless a faster one, such as "lxml", is selected via the
+# GREYNIR_HTML_PARSER environment variable and is installed.
+# HTML_PARSER = "html5lib"
+HTML_PARSER = "html.parser"
+if os.environ.get("GREYNIR_HTML_PARSER"):
+    try:
+        BeautifulSoup("", os.environ["GREYNIR_HTML_PARSER"])
+        HTML_PARSER = os.environ["GREYNIR_HTML_PARSER"]
+    except FeatureNotFound:
+        logging.warning(
+            "HTML parser '{0}' is not installed; using '{1}'".format(
+                os.environ["GREYNIR_HTML_PARSER"], HTML_PARSER
+            )
+        )
 
 # Icelandic month names. Used for parsing
 # date strings in some of the scrapers
@@ -117,7 +130,7 @@ class ScrapeHelper:
 
     def make_soup(self, doc: str) -> Optional[BeautifulSoup]:
         """Make a soup object from a document"""
-        soup = BeautifulSoup(doc, _HTML_PARSER)
+        soup = BeautifulSoup(doc, HTML_PARSER)
         return None if soup.html is None else soup
 
     def skip_url(self, url: str) -> bool:
@@ -529,7 +542,7 @@ class RuvScraper(ScrapeHelper):
     def get_content(self, soup: BeautifulSoup) -> Optional[Tag]:
         """Find the article content (main text) in the soup"""
 
-        content = BeautifulSoup("", _HTML_PARSER)
+        content = BeautifulSoup("", HTML_PARSER)
 
         # Note: RÚV now uses client-side rendering. All the article
         # content is now stored in a huge JSON object in a script tag.
@@ -543,7 +556,7 @@ class RuvScraper(ScrapeHelper):
             for b in bodies:
                 if not b or b["block_type"] != "text_block":
                     continue
-                content.append(BeautifulSoup(b["text_block"]["html"], _HTML_PARSER))
+                content.append(BeautifulSoup(b["text_block"]["html"], HTML_PARSER))
         except Exception as e:
             logging.warning(f"RuvScraper: Could not parse JSON: {e}")
             return content
@@ -903,7 +916,7 @@ class VisirScraper(ScrapeHelper):
         # We shouldn't even try to extract text from the live sport event pages
         liveheader = ScrapeHelper.div_id(soup, "livefeed-sporthead")
         if liveheader:
-            return BeautifulSoup("", _HTML_PARSER)  # Return empty soup.
+            return BeautifulSoup("", HTML_PARSER)  # Return empty soup.
 
         result_soup = ScrapeHelper.div_class(soup, "article", "articletext")
         if not result_soup:
@@ -1452,7 +1465,7 @@ class FrettabladidScraper(ScrapeHelper):
         content = ScrapeHelper.div_class(soup, "article-body")
         # Some sports event pages don't have an article__body
         if not content:
-            return BeautifulSoup("", _HTML_PARSER)  # Return empty soup.
+            return BeautifulSoup("", HTML_PARSER)  # Return empty soup.
 
         # Get rid of stuff we don't want
         ScrapeHelper.del_tag(content, "h3")
@@ -1507,7 +1520,7 @@ class HagstofanScraper(ScrapeHelper):
     def fetch_url(self, url: str) -> str:
         # Requests defaults to ISO-8859-1 because content-type
         # does not declare encoding. In fact, charset is UTF-8.
-        r = requests.get(url, timeout=10)
+        r = httpclient.get(url, timeout=10)
         r.encoding = r.apparent_encoding
         return r.text
 
@@ -1560,7 +1573,7 @@ class HagstofanScraper(ScrapeHelper):
         # For some reason, Hagstofan's RSS feed sometimes includes
         # non-news statistics pages with a non-standard format
         if not content:
-            return BeautifulSoup("", _HTML_PARSER)  # Return empty soup.
+            return BeautifulSoup("", HTML_PARSER)  # Return empty soup.
 
         # Remove tables
         for div in content.find_all("div", {"class": "scrollable"}):
@@ -1644,7 +1657,7 @@ class DVScraper(ScrapeHelper):
         """Find the article content (main text) in the soup"""
         content = ScrapeHelper.div_class(soup, "textinn")
         if not content:
-            return BeautifulSoup("", _HTML_PARSER)  # Return empty soup.
+            return BeautifulSoup("", HTML_PARSER)  # Return empty soup.
 
         for t in content.find_all("style"):
             t.decompose()
@@ -49,7 +49,10 @@ deactivate
 
 echo "Removing binary grammar files"
 rm venv/site-packages/reynir/Greynir.grammar.bin
-rm venv/site-packages/reynir/Greynir.grammar.query.bin
+# The query grammar binaries are named by a hash of the grammar
+# (Greynir.grammar.query.<hash>.bin), so a stale one is never loaded.
+# Binaries for other hashes are removed when a new one is written
+# (see QueryGrammar.read() in queries/__init__.py).
 
 cd $SRC || exit 1
 
@@ -62,20 +65,25 @@ cp .env $DEST/.env
 cp article.py $DEST/article.py
 cp fetcher.py $DEST/fetcher.py
 cp geo.py $DEST/geo.py
+cp httpclient.py $DEST/httpclient.py
 cp images.py $DEST/images.py
 cp main.py $DEST/main.py
 cp nertokenizer.py $DEST/nertokenizer.py
 cp postagger.py $DEST/postagger.py
 cp processor.py $DEST/processor.py
+cp querylog.py $DEST/querylog.py
 cp scraper.py $DEST/scraper.py
 cp search.py $DEST/search.py
 cp settings.py $DEST/settings.py
+cp sharedcache.py $DEST/sharedcache.py
 cp similar.py $DEST/similar.py
 cp speak.py $DEST/speak.py
 cp tnttagger.py $DEST/tnttagger.py
 cp tree.py $DEST/tree.py
+cp treeindex.py $DEST/treeindex.py
 cp treeutil.py $DEST/treeutil.py
 cp utility.py $DEST/utility.py
+cp warmup.py $DEST/warmup.py
 cp -r db $DEST/
 cp -r routes $DEST/
 cp -r speech $DEST/
@@ -97,8 +105,11 @@ GITVERS=$(git rev-parse HEAD) # Get git commit ID
 GITVERS=${GITVERS:0:7} # Truncate it
 sed -i "s/\[Git-útgáfa\]/${GITVERS}/g" "${ABOUT_TPL}"
 
-echo "Reloading gunicorn server..."
+# The app is preloaded in the Gunicorn master process (see
+# config/gunicorn_config.py), so a reload (HUP) would fork new workers
+# from the old master, which still runs the old code: restart instead
+echo "Restarting gunicorn server..."
 
-sudo systemctl reload $SERVICE
+sudo systemctl restart $SERVICE
 
 echo "Deployment done"
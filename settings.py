@@ -155,6 +155,34 @@ class Settings:
             )
         )
 
+    # Outbound HTTP requests (see httpclient.py): the number of times
+    # a failed GET or HEAD request is retried, and the backoff factor
+    # for the delay between retries. Retries only happen within the
+    # request's total deadline, which defaults to its timeout.
+    HTTP_RETRIES_STR = os.environ.get("GREYNIR_HTTP_RETRIES", "2")
+    HTTP_BACKOFF_STR = os.environ.get("GREYNIR_HTTP_BACKOFF", "0.25")
+    try:
+        HTTP_RETRIES = int(HTTP_RETRIES_STR)
+        HTTP_BACKOFF = float(HTTP_BACKOFF_STR)
+    except ValueError:
+        raise ConfigError(
+            "Invalid environment variable value: GREYNIR_HTTP_RETRIES={0}, "
+            "GREYNIR_HTTP_BACKOFF={1}".format(HTTP_RETRIES_STR, HTTP_BACKOFF_STR)
+        )
+
+    # Interval, in seconds, between background lookups of images for the
+    # persons most mentioned in recent articles (see images.py); 0 disables
+    IMAGE_PREFETCH_INTERVAL_STR = os.environ.get(
+        "GREYNIR_IMAGE_PREFETCH_INTERVAL", "3600"
+    )
+    try:
+        IMAGE_PREFETCH_INTERVAL = float(IMAGE_PREFETCH_INTERVAL_STR)
+    except ValueError:
+        raise ConfigError(
+            "Invalid environment variable value: "
+            "GREYNIR_IMAGE_PREFETCH_INTERVAL={0}".format(IMAGE_PREFETCH_INTERVAL_STR)
+        )
+
     # Configuration settings from the Greynir.conf file
     @staticmethod
     def _handle_settings(s: str) -> None:
@@ -0,0 +1,452 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module implements a Flask-Caching backend that stores cached
+    values in an SQLite database file. The cache is thus shared by all
+    worker processes of the web server and survives restarts, without
+    requiring an external service such as Redis or Memcached.
+
+    The cache is bounded both by the number of items and by their total
+    size. When either bound is exceeded, expired items are removed first
+    and then the least recently used ones.
+
+    Concurrent misses for the same key in get_or_compute() are coalesced:
+    the first process (or greenlet) to miss takes out a lease on the key
+    and computes the value, while the others wait for the value to appear
+    in the cache, for at most the lease timeout. The lease is released
+    when the computation finishes, whether or not it succeeds. A plain
+    get() never takes out a lease.
+
+    Hits, misses and waits are counted per route (key prefix) and are
+    summed over all processes in the database; see SQLiteCache.metrics().
+
+    To use the backend, set CACHE_TYPE to "sharedcache.SQLiteCache".
+    The following configuration keys are read:
+
+        CACHE_DIR: directory of the database file (required). It is
+            created, accessible only to the server's user, if it doesn't
+            exist. Since cached values are unpickled, the directory must
+            be owned by that user and not be writable by anyone else.
+        CACHE_THRESHOLD: maximum number of items (default 2000)
+        CACHE_MAX_SIZE: maximum total size of items, in bytes
+            (default 256 MB)
+        CACHE_LEASE_TIMEOUT: maximum time, in seconds, to wait for
+            another process to compute a value (default 15)
+
+"""
+
+from typing import Any, Callable, Dict, List, Optional
+
+import os
+import re
+import time
+import pickle
+import sqlite3
+import logging
+import threading
+
+from flask_caching.backends.base import BaseCache
+
+
+# Name of the database file within the cache directory
+_DB_NAME = "greynir_cache.sqlite3"
+
+# Minimum interval, in seconds, between updates of an item's access
+# time on hits; a coarser LRU order in exchange for fewer writes
+_TOUCH_INTERVAL = 1.0
+
+# Interval, in seconds, between flushes of a process' metric counters
+_METRICS_FLUSH_INTERVAL = 10.0
+
+# Polling interval, in seconds, when waiting for another process
+_POLL_INTERVAL = 0.05
+
+_SCHEMA = """
+    create table if not exists items (
+        key text primary key,
+        value blob not null,
+        size integer not null,
+        expires real not null,
+        accessed real not null
+    );
+    create index if not exists items_accessed on items (accessed);
+    create table if not exists leases (
+        key text primary key,
+        expires real not null
+    );
+    create table if not exists metrics (
+        prefix text primary key,
+        hits integer not null default 0,
+        misses integer not null default 0,
+        waits integer not null default 0
+    );
+"""
+
+# Keys generated by Flask-Caching for routes cached with query_string=True
+# consist of the request path followed by an MD5 hex digest
+_QUERY_STRING_KEY = re.compile(r"^(/.*?)[0-9a-f]{32}$")
+
+
+def _private_dir(path: str) -> None:
+    """Create a directory that only this user can access, if it doesn't
+    exist. Raise an error if it is owned by another user or is writable
+    by others, as they could then plant items in the cache."""
+    os.makedirs(path, mode=0o700, exist_ok=True)
+    st = os.stat(path)
+    if st.st_uid != os.getuid() or st.st_mode & 0o022:
+        raise sqlite3.OperationalError(
+            f"Cache directory {path} must be owned by this user "
+            "and not be writable by others"
+        )
+
+
+def key_prefix(key: str) -> str:
+    """Return the route (key prefix) that a cache key belongs to"""
+    m = _QUERY_STRING_KEY.match(key)
+    return m.group(1) if m else key
+
+
+class SQLiteCache(BaseCache):
+    """A Flask-Caching backend storing items in an SQLite database
+    that is shared between processes"""
+
+    def __init__(
+        self,
+        path: str,
+        threshold: int = 2000,
+        max_size: int = 256 * 1024 * 1024,
+        lease_timeout: float = 15.0,
+        default_timeout: int = 300,
+    ) -> None:
+        super().__init__(default_timeout=default_timeout)
+        self._path = path
+        self._threshold = threshold
+        self._max_size = max_size
+        self._lease_timeout = lease_timeout
+        # One connection per process, opened lazily so that it is
+        # not inherited by worker processes forked from the master
+        self._conn: Optional[sqlite3.Connection] = None
+        self._pid = 0
+        self._lock = threading.Lock()
+        # Metric counters of this process, not yet flushed to the database
+        self._counts: Dict[str, List[int]] = dict()
+        self._flushed = time.time()
+
+    @classmethod
+    def factory(cls, app: Any, config: Dict[str, Any], args: Any, kwargs: Any):
+        cache_dir = config.get("CACHE_DIR")
+        if not cache_dir:
+            raise ValueError("CACHE_DIR must be set for the shared cache")
+        return cls(
+            os.path.join(cache_dir, _DB_NAME),
+            threshold=config.get("CACHE_THRESHOLD") or 2000,
+            max_size=config.get("CACHE_MAX_SIZE") or 256 * 1024 * 1024,
+            lease_timeout=config.get("CACHE_LEASE_TIMEOUT") or 15.0,
+            default_timeout=kwargs.get("default_timeout") or 300,
+        )
+
+    def _db(self) -> sqlite3.Connection:
+        """Return this process' connection to the database. Must be
+        called with the lock held."""
+        pid = os.getpid()
+        if self._conn is None or self._pid != pid:
+            # Checked in each process, since Gunicorn workers may
+            # run as another user than the master process
+            _private_dir(os.path.dirname(os.path.abspath(self._path)))
+            conn = sqlite3.connect(
+                self._path, timeout=10.0, isolation_level=None, check_same_thread=False
+            )
+            conn.execute("pragma journal_mode=wal")
+            conn.execute("pragma synchronous=normal")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+            self._pid = pid
+            self._counts = dict()
+        return self._conn
+
+    def _expiry(self, timeout: Optional[int]) -> float:
+        timeout = self._normalize_timeout(timeout)
+        # A timeout of 0 means that the item never expires
+        return time.time() + timeout if timeout else float("inf")
+
+    def _count(self, key: str, index: int) -> None:
+        """Count a hit (0), miss (1) or wait (2) for the key's route.
+        Must be called with the lock held."""
+        counts = self._counts.setdefault(key_prefix(key), [0, 0, 0])
+        counts[index] += 1
+        if time.time() - self._flushed >= _METRICS_FLUSH_INTERVAL:
+            self._flush_metrics()
+
+    def _flush_metrics(self) -> None:
+        """Add this process' metric counters to the totals in the
+        database. Must be called with the lock held."""
+        db = self._db()
+        for prefix, (hits, misses, waits) in self._counts.items():
+            db.execute(
+                "insert into metrics (prefix, hits, misses, waits) values (?, ?, ?, ?) "
+                "on conflict (prefix) do update set hits = hits + excluded.hits, "
+                "misses = misses + excluded.misses, waits = waits + excluded.waits",
+                (prefix, hits, misses, waits),
+            )
+        self._counts = dict()
+        self._flushed = time.time()
+
+    def _lookup(self, key: str) -> Any:
+        """Return the unpickled value of an unexpired item, or None.
+        Must be called with the lock held."""
+        now = time.time()
+        db = self._db()
+        row = db.execute(
+            "select value, expires, accessed from items where key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        value, expires, accessed = row
+        if expires <= now:
+            db.execute("delete from items where key = ?", (key,))
+            return None
+        try:
+            value = pickle.loads(value)
+        except Exception as e:
+            # The value may have been pickled by an earlier version
+            # of the code, e.g. one with classes that no longer exist
+            logging.warning(f"Removing cached item {key} that can't be loaded: {e}")
+            db.execute("delete from items where key = ?", (key,))
+            return None
+        if now - accessed >= _TOUCH_INTERVAL:
+            db.execute("update items set accessed = ? where key = ?", (now, key))
+        return value
+
+    def get(self, key: str) -> Any:
+        """Return the value of an item, or None if it is not found"""
+        with self._lock:
+            try:
+                value = self._lookup(key)
+                self._count(key, 0 if value is not None else 1)
+                return value
+            except sqlite3.Error as e:
+                logging.warning(f"Cache lookup failed: {e}")
+                return None
+
+    def get_or_compute(
+        self, key: str, compute: Callable[[], Any], timeout: Optional[int] = None
+    ) -> Any:
+        """Return the value of an item. On a miss, the caller either
+        obtains the lease on the key, computes the value by calling
+        compute() and stores it, or waits for the holder of the lease
+        to do so. The lease is released even if compute() raises.
+        A value of None is returned but not stored."""
+        waited = False
+        lease: Optional[float] = None
+        deadline = time.time() + self._lease_timeout
+        while True:
+            with self._lock:
+                try:
+                    value = self._lookup(key)
+                    if value is not None:
+                        self._count(key, 2 if waited else 0)
+                        return value
+                    now = time.time()
+                    # Take out the lease on the key, unless another
+                    # process holds an unexpired one
+                    expires = now + self._lease_timeout
+                    cur = self._db().execute(
+                        "insert into leases (key, expires) values (?, ?) "
+                        "on conflict (key) do update set expires = excluded.expires "
+                        "where leases.expires <= ?",
+                        (key, expires, now),
+                    )
+                    if cur.rowcount:
+                        lease = expires
+                    if cur.rowcount or now >= deadline:
+                        self._count(key, 1)
+                        break
+                except sqlite3.Error as e:
+                    logging.warning(f"Cache lookup failed: {e}")
+                    break
+            # Another process is computing the value: wait for it
+            waited = True
+            time.sleep(_POLL_INTERVAL)
+        try:
+            value = compute()
+            if value is not None:
+                try:
+                    self.set(key, value, timeout)
+                except Exception as e:
+                    # E.g. a value that can't be pickled: the caller
+                    # still gets it, it just isn't cached
+                    logging.warning(f"Cache store of {key} failed: {e}")
+            return value
+        finally:
+            if lease is not None:
+                self._release(key, lease)
+
+    def _release(self, key: str, lease: float) -> None:
+        """Release a lease on a key, unless it has expired
+        and been taken out by another process since"""
+        with self._lock:
+            try:
+                self._db().execute(
+                    "delete from leases where key = ? and expires = ?", (key, lease)
+                )
+            except sqlite3.Error as e:
+                logging.warning(f"Cache lease release failed: {e}")
+
+    def peek(self, key: str) -> Any:
+        """Return the value of an item, or None if it is not found,
+        without counting a hit or a miss"""
+        with self._lock:
+            try:
+                return self._lookup(key)
+            except sqlite3.Error as e:
+                logging.warning(f"Cache lookup failed: {e}")
+                return None
+
+    def has(self, key: str) -> bool:
+        with self._lock:
+            try:
+                row = (
+                    self._db()
+                    .execute(
+                        "select 1 from items where key = ? and expires > ?",
+                        (key, time.time()),
+                    )
+                    .fetchone()
+                )
+            except sqlite3.Error:
+                return False
+        return row is not None
+
+    def _store(self, key: str, value: Any, timeout: Optional[int], add: bool) -> bool:
+        data = pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+        now = time.time()
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute("begin immediate")
+                try:
+                    if add and db.execute(
+                        "select 1 from items where key = ? and expires > ?",
+                        (key, now),
+                    ).fetchone():
+                        db.execute("commit")
+                        return False
+                    db.execute(
+                        "insert or replace into items "
+                        "(key, value, size, expires, accessed) values (?, ?, ?, ?, ?)",
+                        (key, data, len(data), self._expiry(timeout), now),
+                    )
+                    db.execute("delete from leases where key = ?", (key,))
+                    self._evict(db, now)
+                    db.execute("commit")
+                except BaseException:
+                    db.execute("rollback")
+                    raise
+            except sqlite3.Error as e:
+                logging.warning(f"Cache store failed: {e}")
+                return False
+        return True
+
+    def _evict(self, db: sqlite3.Connection, now: float) -> None:
+        """Remove expired items and then the least recently used ones,
+        until the cache is within its bounds"""
+        count, size = db.execute(
+            "select count(*), coalesce(sum(size), 0) from items"
+        ).fetchone()
+        if count <= self._threshold and size <= self._max_size:
+            return
+        db.execute("delete from items where expires <= ?", (now,))
+        db.execute("delete from leases where expires <= ?", (now,))
+        count, size = db.execute(
+            "select count(*), coalesce(sum(size), 0) from items"
+        ).fetchone()
+        if count <= self._threshold and size <= self._max_size:
+            return
+        # Find the access time of the most recently used item that must go
+        excess_count = count - self._threshold
+        excess_size = size - self._max_size
+        cutoff: Optional[float] = None
+        for accessed, item_size in db.execute(
+            "select accessed, size from items order by accessed"
+        ):
+            cutoff = accessed
+            excess_count -= 1
+            excess_size -= item_size
+            if excess_count <= 0 and excess_size <= 0:
+                break
+        if cutoff is not None:
+            db.execute("delete from items where accessed <= ?", (cutoff,))
+
+    def set(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        return self._store(key, value, timeout, add=False)
+
+    def add(self, key: str, value: Any, timeout: Optional[int] = None) -> bool:
+        return self._store(key, value, timeout, add=True)
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            try:
+                db = self._db()
+                cur = db.execute("delete from items where key = ?", (key,))
+                db.execute("delete from leases where key = ?", (key,))
+            except sqlite3.Error:
+                return False
+        return cur.rowcount > 0
+
+    def clear(self) -> bool:
+        with self._lock:
+            try:
+                db = self._db()
+                db.execute("delete from items")
+                db.execute("delete from leases")
+            except sqlite3.Error:
+                return False
+        return True
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Return the number of hits, misses and waits (misses that were
+        served by waiting for another process), summed over all
+        processes, and the number and total size of cached items,
+        per route (key prefix)"""
+        result: Dict[str, Dict[str, Any]] = dict()
+        with self._lock:
+            db = self._db()
+            self._flush_metrics()
+            for prefix, hits, misses, waits in db.execute(
+                "select prefix, hits, misses, waits from metrics"
+            ):
+                result[prefix] = dict(
+                    hits=hits,
+                    misses=misses,
+                    waits=waits,
+                    hit_ratio=round((hits + waits) / max(1, hits + misses + waits), 3),
+                    items=0,
+                    size=0,
+                )
+            now = time.time()
+            for key, size in db.execute(
+                "select key, size from items where expires > ?", (now,)
+            ):
+                m = result.setdefault(
+                    key_prefix(key),
+                    dict(hits=0, misses=0, waits=0, hit_ratio=0.0, items=0, size=0),
+                )
+                m["items"] += 1
+                m["size"] += size
+        return result
@@ -27,6 +27,7 @@ from typing import (
     Deque,
     Dict,
     Iterable,
+    Iterator,
     List,
     Optional,
     Tuple,
@@ -34,13 +35,21 @@ from typing import (
 )
 from types import ModuleType
 
+import re
 import logging
 import importlib
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
 from pathlib import Path
 from inspect import isfunction, ismethod
 from html.parser import HTMLParser
 from collections import deque
-from speech.trans import TRANSCRIBER_CLASS, DefaultTranscriber, TranscriptionMethod
+from speech.trans import (
+    TRANSCRIBER_CLASS,
+    DefaultTranscriber,
+    TranscriptionMethod,
+    strip_markup,
+)
 
 from utility import GREYNIR_ROOT_DIR, cap_first, modules_in_dir
 
@@ -158,6 +167,141 @@ def text_to_audio_url(
     return fn(**_sanitize_args(args))
 
 
+class SpeechSynthesisError(Exception):
+    """Raised when synthesis of a sentence chunk fails"""
+
+
+# Maximum number of sentence chunks synthesized concurrently
+# (in total, per process) when streaming speech synthesis
+STREAM_MAX_WORKERS = 4
+
+# Sentence chunks shorter than this are merged with the following chunk
+_MIN_CHUNK_LENGTH = 24
+
+# Closing paragraph/sentence tags, emitted by DefaultTranscriber.generic
+_SSML_BOUNDARY_RE = re.compile(r"</[ps]>")
+_SSML_OPENING_RE = re.compile(r"<[ps]>")
+# Sentence-final punctuation (or a break tag) followed by
+# whitespace and what looks like the start of a new sentence
+_SENTENCE_BOUNDARY_RE = re.compile(
+    r"(?:(?<=[.!?])|(?<=/>))\s+(?=[\"„“'(]?[A-ZÁÐÉÍÓÚÝÞÆÖ0-9])"
+)
+
+_stream_pool: Optional[ThreadPoolExecutor] = None
+_stream_pool_lock = threading.Lock()
+
+
+def _synthesis_pool() -> ThreadPoolExecutor:
+    """Lazily create the thread pool used for concurrent synthesis
+    (lazily, so that no threads exist before a server process forks)."""
+    global _stream_pool
+    with _stream_pool_lock:
+        if _stream_pool is None:
+            _stream_pool = ThreadPoolExecutor(
+                max_workers=STREAM_MAX_WORKERS, thread_name_prefix="speech"
+            )
+        return _stream_pool
+
+
+def split_into_chunks(text: str) -> List[str]:
+    """
+    Split a (transcribed) voice string into sentence-sized chunks
+    which can be synthesized separately. Paragraph and sentence
+    tags are used as boundaries where present, otherwise the text is
+    split after sentence-final punctuation. Very short chunks are
+    merged with the following chunk.
+    """
+    chunks: List[str] = []
+    for part in _SSML_BOUNDARY_RE.split(text):
+        part = _SSML_OPENING_RE.sub("", part)
+        chunks.extend(c.strip() for c in _SENTENCE_BOUNDARY_RE.split(part))
+    merged: List[str] = []
+    pending = ""
+    for c in chunks:
+        if not c:
+            continue
+        pending = f"{pending} {c}" if pending else c
+        if len(strip_markup(pending)) >= _MIN_CHUNK_LENGTH:
+            merged.append(pending)
+            pending = ""
+    if pending:
+        if merged and len(strip_markup(pending)) < _MIN_CHUNK_LENGTH:
+            merged[-1] = f"{merged[-1]} {pending}"
+        else:
+            merged.append(pending)
+    return merged
+
+
+def _synthesize_chunks(fn_name: str, args: Dict[str, Any]) -> Iterator[Any]:
+    """
+    Split the text in args into sentence chunks, call the voice module
+    function fn_name for each chunk concurrently and yield
+    the results in the original order, as soon as each is ready.
+    Raises SpeechSynthesisError if a chunk fails, rather than
+    leaving it out.
+    """
+    voice_id = args["voice_id"]
+    if voice_id not in SUPPORTED_VOICES:
+        args["voice_id"] = DEFAULT_VOICE
+    args = _sanitize_args(args)
+    module = VOICE_TO_MODULE.get(args["voice_id"])
+    assert module is not None
+    fn = getattr(module, fn_name)
+    assert isfunction(fn)
+    pool = _synthesis_pool()
+    futures: List["Future[Any]"] = [
+        pool.submit(fn, **{**args, "text": chunk})
+        for chunk in split_into_chunks(args["text"])
+    ]
+    try:
+        for i, f in enumerate(futures):
+            result = f.result()
+            if not result:
+                raise SpeechSynthesisError(
+                    f"Speech synthesis of sentence chunk {i + 1} "
+                    f"of {len(futures)} failed"
+                )
+            yield result
+    finally:
+        # Don't synthesize remaining chunks if the consumer gives up
+        for f in futures:
+            f.cancel()
+
+
+def text_to_audio_stream(
+    text: str,
+    text_format: str = DEFAULT_TEXT_FORMAT,
+    audio_format: str = DEFAULT_AUDIO_FORMAT,
+    voice_id: str = DEFAULT_VOICE,
+    speed: float = DEFAULT_VOICE_SPEED,
+) -> Iterator[bytes]:
+    """
+    Synthesize text sentence by sentence, concurrently,
+    yielding audio data for each sentence in order.
+    The first chunk is available as soon as the first sentence
+    has been synthesized, so playback can start early.
+    Raises SpeechSynthesisError if a sentence fails.
+    """
+    args = locals().copy()
+    yield from _synthesize_chunks("text_to_audio_data", args)
+
+
+def text_to_audio_urls(
+    text: str,
+    text_format: str = DEFAULT_TEXT_FORMAT,
+    audio_format: str = DEFAULT_AUDIO_FORMAT,
+    voice_id: str = DEFAULT_VOICE,
+    speed: float = DEFAULT_VOICE_SPEED,
+) -> List[str]:
+    """
+    Synthesize text sentence by sentence, concurrently,
+    and return an ordered list of URLs to the audio for each sentence.
+    Raises SpeechSynthesisError if a sentence fails.
+    """
+    args = locals().copy()
+    return list(_synthesize_chunks("text_to_audio_url", args))
+
+
 class GreynirSSMLParser(HTMLParser):
     """
     Parses voice strings containing <greynir> tags and
@@ -26,6 +26,7 @@
 from typing import (
     Any,
     Callable,
+    Dict,
     FrozenSet,
     Iterable,
     List,
@@ -39,9 +40,11 @@ from typing import (
 
 import re
 import itertools
-from functools import lru_cache
+import threading
 
-from tokenizer import Abbreviations
+import cachetools
+
+from tokenizer import Abbreviations, split_into_sentences
 
 # Ensure abbreviations have been loaded
 Abbreviations.initialize()
@@ -50,7 +53,7 @@ from tokenizer.definitions import HYPHENS
 from islenska.basics import ALL_CASES, ALL_GENDERS, ALL_NUMBERS
 from reynir.bindb import GreynirBin
 from reynir.simpletree import SimpleTree
-from reynir import Greynir, TOK, Tok
+from reynir import Greynir, TOK, Tok, Sentence
 
 from speech.trans.num import (
     CaseType,
@@ -228,6 +231,14 @@ _SPORTS_LEMMAS: FrozenSet[str] = frozenset(("leikur", "vinna", "tapa", "sigra"))
 
 _HYPHEN_SYMBOLS = frozenset(HYPHENS)
 
+# Bounded cache for generic transcription of single sentences,
+# keyed by (transcriber class, sentence text)
+_SENTENCE_CACHE_SIZE = 2048
+_SENTENCE_CACHE: "cachetools.LRUCache[Tuple[type, str], str]" = cachetools.LRUCache(
+    maxsize=_SENTENCE_CACHE_SIZE
+)
+_SENTENCE_CACHE_LOCK = threading.Lock()
+
 _StrBool = Union[str, bool]
 TranscriptionMethod = Callable[..., str]
 
@@ -854,7 +865,6 @@ class DefaultTranscriber:
     @classmethod
     @_empty_str
     @_bool_args("full_text")
-    @lru_cache(maxsize=50)  # Caching, as this method could be slow
     def generic(cls, txt: str, *, full_text: bool = False) -> str:
         """
         Attempt to voicify some generic text.
@@ -862,10 +872,74 @@ class DefaultTranscriber:
         based on inferred meaning of words.
         if full_text is set to True,
         add paragraph and sentence markers.
+
+        The text is split into sentences and the transcription
+        of each sentence is cached, so only sentences which
+        haven't been seen recently are parsed (in a single batch).
+        """
+        sents: List[str] = [
+            " ".join(s.split()) for s in split_into_sentences(txt, original=True)
+        ]
+        sents = [s for s in sents if s]
+        transcribed: Dict[str, str] = {}
+        with _SENTENCE_CACHE_LOCK:
+            for s in sents:
+                t = _SENTENCE_CACHE.get((cls, s))
+                if t is not None:
+                    transcribed[s] = t
+        uncached = [s for s in dict.fromkeys(sents) if s not in transcribed]
+        if uncached:
+            new = dict(zip(uncached, cls._generic_sentences(uncached)))
+            with _SENTENCE_CACHE_LOCK:
+                for s, t in new.items():
+                    _SENTENCE_CACHE[(cls, s)] = t
+            transcribed.update(new)
+
+        parts: List[str] = []
+        for s in sents:
+            t = transcribed[s]
+            if full_text:
+                # A cached transcription can contain more than one sentence
+                parts.extend(cls.sentence(ts) for ts in t.split("\n"))
+            else:
+                parts.append(t.replace("\n", " "))
+
+        # Join sentences
+        para = " ".join(parts)
+        return cls.paragraph(para) if full_text else para
+
+    @classmethod
+    def _generic_sentences(cls, sents: List[str]) -> List[str]:
+        """
+        Parse a batch of sentences in a single call to the parser and
+        return a transcription for each of them. If the parser splits
+        an input sentence further, the transcriptions of the resulting
+        sentences are separated by newlines.
         """
         if cls._greynir is None:
             cls._greynir = Greynir(no_sentence_start=True)
-        p_result = cls._greynir.parse(txt)
+        # Each sentence is submitted as a separate paragraph,
+        # so the parse results map back to the input sentences
+        job = cls._greynir.submit("\n".join(sents), parse=True, split_paragraphs=True)
+        result = [
+            "\n".join(cls._generic_sentence(s) for s in pg.sentences())
+            for pg in job.paragraphs()
+        ]
+        if len(result) != len(sents):
+            # Some input didn't produce a paragraph of its own
+            # (should not happen); parse the sentences one by one
+            result = [
+                "\n".join(
+                    cls._generic_sentence(s)
+                    for s in cls._greynir.submit(sent, parse=True)
+                )
+                for sent in sents
+            ]
+        return result
+
+    @classmethod
+    def _generic_sentence(cls, s: Sentence) -> str:
+        """Voicify a single parsed sentence for the generic method."""
 
         def _ordinal(tok: Tok, term: Optional[SimpleTree]) -> str:
             """Handles ordinals, e.g. '14.' or '2.'."""
@@ -884,7 +958,7 @@ class DefaultTranscriber:
                         ),
                         "et",
                     )
-            return cls.ordinal(txt, case=case, gender=gender, number=number)
+            return cls.ordinal(tok.txt, case=case, gender=gender, number=number)
 
         def _number(tok: Tok, term: Optional[SimpleTree]) -> str:
             """Handles numbers, e.g. '135', '17,86' or 'fjörutíu og þrír'."""
@@ -895,10 +969,10 @@ class DefaultTranscriber:
             if term is not None:
                 case = next(filter(lambda v: v in ALL_CASES, term.variants), "nf")
                 gender = next(filter(lambda v: v in ALL_GENDERS, term.variants), "hk")
-            if "," in txt:
-                return cls.float(txt, case=case, gender=gender)
+            if "," in tok.txt:
+                return cls.float(tok.txt, case=case, gender=gender)
             else:
-                return cls.number(txt, case=case, gender=gender)
+                return cls.number(tok.txt, case=case, gender=gender)
 
         def _percent(tok: Tok, term: Optional[SimpleTree]) -> str:
             """Handles a percentage, e.g. '15,6%' or '40 prósent'."""
@@ -962,60 +1036,53 @@ class DefaultTranscriber:
             TOK.PERCENT: _percent,
         }
 
-        parts: List[str] = []
-        for s in p_result["sentences"]:
-            s_parts: List[str] = []
-            # List of (token, terminal node) pairs.
-            # Terminal nodes can be None if the sentence wasn't parseable
-            tk_term_list = tuple(
-                zip(s.tokens, s.terminal_nodes or (None for _ in s.tokens))
-            )
-            for tok, term in tk_term_list:
-                txt = tok.txt
-
-                if tok.kind in handler_map:
-                    # Found a handler for this token type
-                    s_parts.append(handler_map[tok.kind](tok, term))
-                    continue
+        s_parts: List[str] = []
+        # List of (token, terminal node) pairs.
+        # Terminal nodes can be None if the sentence wasn't parseable
+        tk_term_list = tuple(
+            zip(s.tokens, s.terminal_nodes or (None for _ in s.tokens))
+        )
+        for tok, term in tk_term_list:
+            txt = tok.txt
 
-                # Fallbacks if no handler found
-                if txt.isupper():
-                    # Fully uppercase string,
-                    # might be part of an entity name
-                    s_parts.append(cls.entity(txt))
-
-                elif _ABBREV_RE.match(txt) and (
-                    (term is not None and not _ABBREV_RE.match(term.lemma))
-                    or any(not _ABBREV_RE.match(m.stofn) for m in tok.meanings)
-                ):
-                    # Probably an abbreviation such as "t.d." or "MSc"
-                    s_parts.append(cls.abbrev(txt))
-
-                # Check whether this is a hyphen denoting a range
-                elif (
-                    txt in _HYPHEN_SYMBOLS
-                    and term is not None
-                    and term.parent is not None
-                    # Check whether parent nonterminal has at least 3 children (might be a range)
-                    and len(term.parent) >= 3
-                ):
-                    # Hyphen found, probably denoting a range
-                    if s.lemmas is not None and _SPORTS_LEMMAS.isdisjoint(s.lemmas):
-                        # Probably not the result from a sports match
-                        # (as the sentence doesn't contain sports-related lemmas),
-                        # so replace the range-denoting hyphen with 'til'
-                        s_parts.append("til")
-                else:
-                    # No transcribing happened
-                    s_parts.append(txt)
+            if tok.kind in handler_map:
+                # Found a handler for this token type
+                s_parts.append(handler_map[tok.kind](tok, term))
+                continue
 
-            # Finished parsing a sentence
-            sent = " ".join(s_parts).strip()
-            parts.append(cls.sentence(sent) if full_text else sent)
+            # Fallbacks if no handler found
+            if txt.isupper():
+                # Fully uppercase string,
+                # might be part of an entity name
+                s_parts.append(cls.entity(txt))
+
+            elif _ABBREV_RE.match(txt) and (
+                (term is not None and not _ABBREV_RE.match(term.lemma))
+                or any(not _ABBREV_RE.match(m.stofn) for m in tok.meanings)
+            ):
+                # Probably an abbreviation such as "t.d." or "MSc"
+                s_parts.append(cls.abbrev(txt))
+
+            # Check whether this is a hyphen denoting a range
+            elif (
+                txt in _HYPHEN_SYMBOLS
+                and term is not None
+                and term.parent is not None
+                # Check whether parent nonterminal has at least 3 children (might be a range)
+                and len(term.parent) >= 3
+            ):
+                # Hyphen found, probably denoting a range
+                if s.lemmas is not None and _SPORTS_LEMMAS.isdisjoint(s.lemmas):
+                    # Probably not the result from a sports match
+                    # (as the sentence doesn't contain sports-related lemmas),
+                    # so replace the range-denoting hyphen with 'til'
+                    s_parts.append("til")
+            else:
+                # No transcribing happened
+                s_parts.append(txt)
 
-        # Join sentences
-        para = " ".join(parts)
-        return cls.paragraph(para) if full_text else para
+        # Finished parsing a sentence
+        return " ".join(s_parts).strip()
 
     _PERSON_PRONUNCIATION: Mapping[str, str] = {
         "Jr": "djúníor",
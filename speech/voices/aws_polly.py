@@ -28,7 +28,7 @@ import json
 import logging
 from threading import Lock
 
-import requests
+import httpclient
 import cachetools
 import boto3  # type: ignore
 from botocore.exceptions import ClientError  # type: ignore
@@ -164,7 +164,7 @@ def text_to_audio_data(
     if not url:
         return None
     try:
-        r = requests.get(url, timeout=10)
+        r = httpclient.get(url, timeout=10)
         return r.content
     except Exception as e:
         logging.error(f"Error fetching URL {url}: {e}")
@@ -0,0 +1,95 @@
+#!/usr/bin/env python
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    Fake, local speech synthesis voice for offline testing.
+    The "audio" returned is simply the (markup-stripped) text,
+    optionally after a delay emulating the latency of a real service.
+
+    This module declares no voices, so it isn't offered to clients.
+    To use it, register it explicitly, e.g. in a test:
+
+        monkeypatch.setitem(speech.VOICE_TO_MODULE, fake.VOICE, fake)
+        monkeypatch.setattr(
+            speech, "SUPPORTED_VOICES", speech.SUPPORTED_VOICES | {fake.VOICE}
+        )
+
+"""
+
+from typing import Optional
+
+import time
+import uuid
+import logging
+from pathlib import Path
+
+from . import AUDIO_SCRATCH_DIR, suffix_for_audiofmt
+from speech.trans import strip_markup
+
+NAME = "Fake"
+VOICE = "Fake"
+# Intentionally empty, see above
+VOICES: frozenset = frozenset()
+AUDIO_FORMATS = frozenset(("mp3", "pcm", "ogg_vorbis", "opus"))
+
+# Emulated synthesis latency, in seconds
+LATENCY_BASE = 0.0
+LATENCY_PER_CHAR = 0.0
+
+
+def text_to_audio_data(
+    text: str,
+    text_format: str,
+    audio_format: str,
+    voice_id: str,
+    speed: float = 1.0,
+) -> Optional[bytes]:
+    """Returns fake audio data (the UTF-8 encoded text itself)."""
+    text = strip_markup(text)
+    delay = LATENCY_BASE + LATENCY_PER_CHAR * len(text)
+    if delay > 0.0:
+        time.sleep(delay)
+    return text.encode("utf-8")
+
+
+def text_to_audio_url(
+    text: str,
+    text_format: str,
+    audio_format: str,
+    voice_id: str,
+    speed: float = 1.0,
+) -> Optional[str]:
+    """Returns URL for fake speech-synthesized text."""
+
+    data = text_to_audio_data(**locals())
+    if not data:
+        return None
+
+    suffix = suffix_for_audiofmt(audio_format)
+    out_fn: str = str(AUDIO_SCRATCH_DIR / f"{uuid.uuid4()}.{suffix}")
+    try:
+        with open(out_fn, "wb") as f:
+            f.write(data)
+    except Exception as e:
+        logging.error(f"Error writing audio file {out_fn}: {e}")
+        return None
+
+    # Generate and return file:// URL to audio file
+    url = Path(out_fn).as_uri()
+    return url
@@ -28,7 +28,7 @@ import logging
 import uuid
 from pathlib import Path
 
-import requests
+import httpclient
 
 from . import AUDIO_SCRATCH_DIR, suffix_for_audiofmt
 from speech.trans import strip_markup
@@ -74,7 +74,7 @@ def text_to_audio_data(
     }
 
     try:
-        r = requests.post(_TIRO_TTS_URL, json=jdict, timeout=10)
+        r = httpclient.post(_TIRO_TTS_URL, json=jdict, timeout=10)
         if r.status_code != 200:
             raise Exception(
                 f"Received HTTP status code {r.status_code} from {NAME} server"
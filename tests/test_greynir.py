@@ -272,6 +272,7 @@ def test_geo():
         code_for_us_state,
         coords_for_us_state_code,
         location_info,
+        LocationIndex,
     )
 
     assert icelandic_city_name("London") == "Lundúnir"
@@ -372,6 +373,29 @@ def test_geo():
     assert not in_iceland((62.010846, -6.776709))
     assert not in_iceland((62.031342, -18.539553))
 
+    # Nearest-location index
+    places = [
+        ((64.141439, -21.943944), "Reykjavík"),
+        ((65.688131, -18.102528), "Akureyri"),
+        ((66.074585, -23.131931), "Ísafjörður"),
+        ((65.261162, -14.405479), "Egilsstaðir"),
+        ((64.067800, -21.944700), "Hafnarfjörður"),
+    ]
+    index = LocationIndex(places)
+    assert len(index) == 5
+    d, name = index.nearest((64.15, -21.95))[0]
+    assert name == "Reykjavík"
+    assert abs(d - distance((64.15, -21.95), (64.141439, -21.943944))) < 1e-9
+    nearest = index.nearest((64.12, -21.94), 2)
+    assert [name for _, name in nearest] == ["Reykjavík", "Hafnarfjörður"]
+    assert index.nearest((66.5, -15.9), 1, within_radius=10.0) == []
+    assert [name for _, name in index.within((64.1, -21.9), 10.0)] == [
+        "Hafnarfjörður",
+        "Reykjavík",
+    ]
+    names = [name for _, name in index.iter_nearest((65.7, -18.1))]
+    assert names[0] == "Akureyri" and len(names) == 5
+
     # US States
     assert code_for_us_state("Flórída") == "FL"
     assert code_for_us_state("Norður-Karólína") == "NC"
@@ -47,6 +47,7 @@ from processor import Processor, TokenContainer  # noqa
 
 import processors.entities as entities  # noqa
 import processors.persons as persons  # noqa
+from treeindex import ANY_SENTENCE, pattern_labels, store_labels, tree_labels  # noqa
 
 
 def test_processors():
@@ -96,6 +97,11 @@ class LocationsSessionShim(SessionShim):
         self.defs.add((row.name, row.kind))
 
 
+class TreeLabelsSessionShim(SessionShim):
+    def add(self, row):
+        self.defs.add((row.label, tuple(row.sentences)))
+
+
 def _make_tree(text: str) -> Tuple[Tree, str]:
     """Tokenize and parse text, create tree representation string
     from all the parse trees, return Tree object and token JSON."""
@@ -308,8 +314,60 @@ def test_locations():
     assert session.is_empty()
 
 
+def test_treelabels():
+    text = """
+
+    Maðurinn sá stóra hundinn í garðinum. Hundurinn gelti hátt.
+    Katrín Jakobsdóttir var á Alþingi í dag.
+
+    """
+    tree, _ = _make_tree(text)
+    trees = list(tree.simple_trees())
+    assert [ix for ix, _ in trees] == [1, 2, 3]
+    assert [ix for ix, _ in tree.simple_trees(indices=[3, 1])] == [1, 3]
+
+    session = TreeLabelsSessionShim()
+    store_labels(cast(Session, session), "article", trees)
+    assert (ANY_SENTENCE, (1, 2, 3)) in session
+    assert ("l:hundur", (1, 2)) in session
+    assert ("t:p", (1, 2, 3)) in session
+
+    assert pattern_labels("NP-SUBJ > { 'hundur' }") == {"n:NP-SUBJ", "l:hundur"}
+    assert pattern_labels("VP > [ .* so_et NP? .* ]") == {"n:VP", "t:so"}
+    assert pattern_labels("( NP-OBJ | NP-IOBJ )") == set()
+    assert pattern_labels("( NP > { no } | PP > { no } )") == {"t:no"}
+    assert pattern_labels("S0 > { . * }") == {"n:S0"}
+    assert pattern_labels('@"Hundurinn"') == set()
+    assert pattern_labels('NP > { @"hundurinn" }') == {"n:NP"}
+    assert pattern_labels("NP > { @'hundur' }") == {"n:NP"}
+
+    # Any sentence that matches a pattern must have all the labels
+    # the pattern requires, or the index would miss it
+    patterns = [
+        "NP-SUBJ > { 'hundur' }",
+        "NP-SUBJ >> { person }",
+        "VP > [ .* so_et NP? .* ]",
+        "IP > { NP-SUBJ VP }",
+        "( NP-OBJ | NP-IOBJ ) > { lo no }",
+        "S0 > [ .* p $ ]",
+        "PP >> { 'Alþingi' }",
+        '@"Hundurinn"',
+        'NP > { @"hundurinn" }',
+        "NP-OBJ >> { @'hundur' }",
+    ]
+    for pattern in patterns:
+        labels = pattern_labels(pattern)
+        matched = 0
+        for _, simple_tree in trees:
+            if simple_tree.first_match(pattern) is not None:
+                matched += 1
+                assert labels <= tree_labels(simple_tree), pattern
+        assert matched, pattern
+
+
 if __name__ == "__main__":
     """Run tests via command line invocation."""
     test_entities()
     test_persons()
     test_locations()
+    test_treelabels()
@@ -20,7 +20,7 @@
     Tests for speech-synthesis-related code in the Greynir repo.
 
 """
-from typing import Callable
+from typing import Any, Callable, Optional
 
 import os
 import re
@@ -955,6 +955,23 @@ def test_generic_transcription() -> None:
     # assert "þremur til fimm" in n # TODO
 
 
+def test_generic_sentence_cache() -> None:
+    from speech.trans import _SENTENCE_CACHE
+
+    s1 = "Það eru hæstu stýrivextir í Bretlandi í 14 ár."
+    s2 = "Fréttin var síðast uppfærð 2. janúar 2022."
+    n1 = DT.generic(s1, full_text=True)
+    assert (DT, s1) in _SENTENCE_CACHE
+    n2 = DT.generic(s2, full_text=True)
+    # Both sentences are cached, so this doesn't require parsing
+    n = DT.generic(f"{s1} {s2}", full_text=True)
+    assert n == f"<p>{n1[3:-4]} {n2[3:-4]}</p>"
+    assert DT.generic(f"{s2} {s1}") == f"{DT.generic(s2)} {DT.generic(s1)}"
+    # Repeated sentences within a text
+    n = DT.generic(f"{s1} {s1}")
+    assert n == f"{DT.generic(s1)} {DT.generic(s1)}"
+
+
 def test_person_transcription() -> None:
     # Roman numerals
     n = DT.person("Elísabet II")
@@ -1014,3 +1031,106 @@ def test_voice_breaks() -> None:
     for s in DT._VBREAK_STRENGTHS:
         n = DT.vbreak(strength=s)
         assert n == f'<break strength="{s}" />'
+
+
+@pytest.fixture
+def fake_voice(monkeypatch: pytest.MonkeyPatch):
+    """Register the local fake voice module for offline synthesis tests."""
+    import speech
+    from speech.voices import fake
+
+    monkeypatch.setitem(speech.VOICE_TO_MODULE, fake.VOICE, fake)
+    monkeypatch.setattr(
+        speech, "SUPPORTED_VOICES", speech.SUPPORTED_VOICES | {fake.VOICE}
+    )
+    return fake
+
+
+def test_split_into_chunks() -> None:
+    from speech import split_into_chunks
+
+    assert split_into_chunks("") == []
+    assert split_into_chunks("Halló.") == ["Halló."]
+    t = (
+        "<p><s>Breski seðlabankinn hækkaði stýrivexti sína í dag.</s> "
+        "<s>Það eru hæstu stýrivextir í Bretlandi í fjórtán ár.</s></p>"
+    )
+    assert split_into_chunks(t) == [
+        "Breski seðlabankinn hækkaði stýrivexti sína í dag.",
+        "Það eru hæstu stýrivextir í Bretlandi í fjórtán ár.",
+    ]
+    t = (
+        'Klukkan er tíu. Veðrið í Reykjavík er gott í dag.<break time="1s" /> '
+        "Á morgun verður rigning og rok um allt land."
+    )
+    # Short chunks are merged with the following chunk
+    assert split_into_chunks(t) == [
+        'Klukkan er tíu. Veðrið í Reykjavík er gott í dag.<break time="1s" />',
+        "Á morgun verður rigning og rok um allt land.",
+    ]
+    # Abbreviations followed by lowercase words don't end sentences
+    t = "Hér eru t.d. epli og bananar. Þar eru appelsínur og perur."
+    assert split_into_chunks(t) == [
+        "Hér eru t.d. epli og bananar.",
+        "Þar eru appelsínur og perur.",
+    ]
+
+
+def test_speech_synthesis_stream(fake_voice) -> None:
+    from speech import text_to_audio_stream, text_to_audio_urls
+
+    sents = [
+        "Breski seðlabankinn hækkaði stýrivexti sína í dag.",
+        "Það eru hæstu stýrivextir í Bretlandi í fjórtán ár.",
+        "Seðlabankinn vonar að vaxtahækkunin stemmi stigu við verðbólgu.",
+    ]
+    t = " ".join(sents)
+    chunks = list(text_to_audio_stream(t, voice_id=fake_voice.VOICE))
+    assert chunks == [s.encode("utf-8") for s in sents]
+
+    urls = text_to_audio_urls(t, voice_id=fake_voice.VOICE, audio_format="mp3")
+    assert len(urls) == len(sents)
+    for url, s in zip(urls, sents):
+        assert url.startswith("file://") and url.endswith(".mp3")
+        path = Path(url[7:])
+        assert path.read_text("utf-8") == s
+        path.unlink()
+
+
+def test_speech_synthesis_stream_failure(
+    fake_voice, monkeypatch: pytest.MonkeyPatch
+) -> None:
+    from speech import SpeechSynthesisError, text_to_audio_stream, text_to_audio_urls
+
+    sents = [
+        "Breski seðlabankinn hækkaði stýrivexti sína í dag.",
+        "Það eru hæstu stýrivextir í Bretlandi í fjórtán ár.",
+        "Seðlabankinn vonar að vaxtahækkunin stemmi stigu við verðbólgu.",
+    ]
+    text_to_audio_data = fake_voice.text_to_audio_data
+
+    def failing(text: str, **kwargs: Any) -> Optional[bytes]:
+        # Synthesis of the second sentence fails
+        return None if text == sents[1] else text_to_audio_data(text, **kwargs)
+
+    monkeypatch.setattr(fake_voice, "text_to_audio_data", failing)
+    t = " ".join(sents)
+
+    # The sentences before the failure are streamed,
+    # and then the stream is aborted
+    audio = text_to_audio_stream(t, voice_id=fake_voice.VOICE)
+    assert next(audio) == sents[0].encode("utf-8")
+    with pytest.raises(SpeechSynthesisError):
+        next(audio)
+
+    # No list of URLs with a sentence missing is returned
+    from speech.voices import AUDIO_SCRATCH_DIR
+
+    before = set(AUDIO_SCRATCH_DIR.iterdir())
+    try:
+        with pytest.raises(SpeechSynthesisError):
+            text_to_audio_urls(t, voice_id=fake_voice.VOICE)
+    finally:
+        # Remove the audio files of the sentences that succeeded
+        for path in set(AUDIO_SCRATCH_DIR.iterdir()) - before:
+            path.unlink()
@@ -21,10 +21,14 @@
 
 """
 
+from typing import Any, Callable, Dict, List, Optional
+
 import os
 import sys
 from pathlib import Path
 
+import pytest
+
 
 # Shenanigans to enable Pytest to discover modules in the
 # main workspace directory (the parent of /tests)
@@ -156,3 +160,504 @@ def test_read_txt_api_key():
         )
         == "123456789"
     )
+
+
+def test_sharedcache(tmp_path: Path):
+    """Test the shared SQLite cache backend in sharedcache.py."""
+
+    import time
+    import sqlite3
+    import threading
+
+    from sharedcache import SQLiteCache, key_prefix
+
+    path = str(tmp_path / "cache.sqlite3")
+    c = SQLiteCache(path, threshold=3, lease_timeout=5.0)
+
+    assert key_prefix("/stats" + "0" * 32) == "/stats"
+    assert key_prefix("people_top") == "people_top"
+
+    assert c.get("a") is None
+    assert c.set("a", {"x": 1})
+    assert c.get("a") == {"x": 1}
+    assert not c.add("a", 2)
+    assert c.has("a")
+
+    # Items expire
+    c.set("e", "expired", timeout=-1)
+    assert not c.has("e")
+
+    # The least recently used items are evicted beyond the threshold
+    for k in "bcd":
+        c.set(k, k)
+        time.sleep(0.01)
+    assert not c.has("a")
+    assert c.has("b") and c.has("c") and c.has("d")
+
+    # A concurrent miss in another process (here, another
+    # connection) waits for the holder of the lease
+    other = SQLiteCache(path, lease_timeout=5.0)
+    key = "/stats" + "1" * 32
+    started = threading.Event()
+
+    def compute() -> str:
+        started.set()
+        time.sleep(0.2)
+        return "page"
+
+    t = threading.Thread(target=lambda: c.get_or_compute(key, compute))
+    t.start()
+    started.wait()
+    assert other.get_or_compute(key, lambda: "other") == "page"
+    t.join()
+
+    # The lease is released if computing the value fails,
+    # so that the next miss doesn't wait for it
+    def fail() -> str:
+        raise ValueError
+
+    with pytest.raises(ValueError):
+        c.get_or_compute("/stats" + "2" * 32, fail)
+    t0 = time.time()
+    assert other.get_or_compute("/stats" + "2" * 32, lambda: "ok") == "ok"
+    assert time.time() - t0 < 1.0
+
+    # Each process adds its counts to the shared totals periodically
+    c.metrics()
+    m = other.metrics()["/stats"]
+    assert m["misses"] == 3 and m["waits"] == 1 and m["items"] == 2
+
+    # A value that can't be pickled is returned, but not cached
+    unpicklable = threading.Lock()
+    assert c.get_or_compute("/stats" + "3" * 32, lambda: unpicklable) is unpicklable
+    assert not c.has("/stats" + "3" * 32)
+
+    # An item that can't be unpickled, e.g. one whose class has been
+    # renamed since it was stored, is a miss and is removed
+    with sqlite3.connect(path) as db:
+        db.execute(
+            "update items set value = ? where key = ?",
+            (b"\x80\x04cno_such_module\nThing\n.", "/stats" + "2" * 32),
+        )
+    assert other.get("/stats" + "2" * 32) is None
+    assert not other.has("/stats" + "2" * 32)
+
+    # The cache directory must not be writable by others
+    shared = tmp_path / "shared"
+    shared.mkdir(mode=0o777)
+    shared.chmod(0o777)
+    unsafe = SQLiteCache(str(shared / "cache.sqlite3"))
+    assert not unsafe.set("a", 1) and unsafe.get("a") is None
+
+
+def test_sources(tmp_path: Path):
+    """Test the cached external data sources in queries/util/sources.py."""
+
+    import time
+
+    from sharedcache import SQLiteCache
+    from queries.util.sources import CachedSource, source_metrics, use_shared_cache
+
+    # A stand-in for an external service
+    calls: List[str] = []
+    upstream: Dict[str, Any] = {"value": 1, "fail": False}
+
+    def fetch(arg: str) -> Optional[Dict[str, Any]]:
+        calls.append(arg)
+        if upstream["fail"]:
+            raise IOError("Service unavailable")
+        return dict(arg=arg, value=upstream["value"])
+
+    def wait_for(cond: Callable[[], bool]) -> bool:
+        for _ in range(100):
+            if cond():
+                return True
+            time.sleep(0.02)
+        return False
+
+    s = CachedSource("test", fetch, refresh=0.2, max_age=60.0, retry=0.2)
+
+    # The first request waits for the value, later ones are served from cache
+    assert s.get("a") == {"arg": "a", "value": 1}
+    assert s.get("a") == {"arg": "a", "value": 1}
+    assert calls == ["a"]
+
+    # A stale value is served while it is refreshed in the background
+    upstream["value"] = 2
+    time.sleep(0.25)
+    assert s.get("a") == {"arg": "a", "value": 1}
+    assert wait_for(lambda: s.get("a") == {"arg": "a", "value": 2})
+    assert calls == ["a", "a"]
+
+    # If the service fails, the last good value is served
+    upstream["fail"] = True
+    time.sleep(0.25)
+    assert s.get("a") == {"arg": "a", "value": 2}
+    assert wait_for(lambda: s.metrics()["failures"] == 1)
+    assert s.get("a") == {"arg": "a", "value": 2}
+
+    # Without a value, a failed fetch is not retried for a while
+    assert s.get("b") is None
+    n = len(calls)
+    assert s.get("b") is None
+    assert len(calls) == n
+
+    m = source_metrics()["test"]
+    assert m["entries"] == 1 and m["fetches"] == len(calls)
+    assert m["stale"] >= 2 and m["fetch_max"] >= m["fetch_avg"] > 0.0
+
+    # With a shared cache, a value fetched by one process
+    # (here, another source instance) is used by the others
+    upstream["fail"] = False
+    use_shared_cache(SQLiteCache(str(tmp_path / "cache.sqlite3")))
+    try:
+        s1 = CachedSource("shared", fetch, refresh=60.0)
+        s2 = CachedSource("shared", fetch, refresh=60.0)
+        calls.clear()
+        assert s1.get("c") == {"arg": "c", "value": 2}
+        assert s2.get("c") == {"arg": "c", "value": 2}
+        assert calls == ["c"]
+    finally:
+        use_shared_cache(None)
+
+
+def test_httpclient():
+    """Test the pooled outbound HTTP client in httpclient.py."""
+
+    import threading
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    import httpclient
+
+    connections: List[Any] = []
+    statuses = [503, 200, 200, 200]
+    cookies: List[Optional[str]] = []
+
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def setup(self) -> None:
+            super().setup()
+            connections.append(self.connection)
+
+        def do_GET(self) -> None:
+            if self.path == "/busy":
+                status = 503
+            else:
+                status = statuses.pop(0) if statuses else 200
+            cookies.append(self.headers.get("Cookie"))
+            body = b'{"ok": true}'
+            self.send_response(status)
+            self.send_header("Set-Cookie", "session=abc; Path=/")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format: str, *args: Any) -> None:
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    t = threading.Thread(target=server.serve_forever, daemon=True)
+    t.start()
+    try:
+        host = "127.0.0.1:{0}".format(server.server_address[1])
+        url = f"http://{host}/test"
+        # The 503 response is retried
+        for _ in range(3):
+            r = httpclient.get(url, timeout=5.0)
+            assert r.status_code == 200 and r.json() == {"ok": True}
+        # All requests, including the retry, use the same connection
+        assert len(connections) == 1
+        m = httpclient.metrics()[host]
+        assert m["requests"] == 3 and m["errors"] == 0
+        assert m["statuses"] == {"2xx": 3}
+        assert sum(m["histogram"].values()) == 3
+        # Cookies set by the server are not sent back
+        assert cookies == [None] * 4
+        # Retries stop at the deadline
+        t0 = time.monotonic()
+        r = httpclient.get(f"http://{host}/busy", timeout=5.0, deadline=0.1)
+        assert r.status_code == 503
+        assert time.monotonic() - t0 < 1.0
+        assert len(cookies) == 5
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def test_image_cache():
+    """Test the expiration and blacklisting of cached image searches"""
+
+    from datetime import datetime
+
+    from images import CachedLink, _expiration, _image_from
+
+    item = dict(
+        link="https://example.is/a.jpg",
+        displayLink="example.is",
+        image=dict(
+            contextLink="https://example.is/a",
+            height=400,
+            width=300,
+            thumbnailLink="https://example.is/a_thumb.jpg",
+            thumbnailHeight=40,
+            thumbnailWidth=30,
+        ),
+    )
+    other = dict(item, link="https://example.is/b.jpg")
+    # Searches that found no images expire sooner
+    assert _expiration({}) < _expiration(dict(items=[item]))
+
+    now = datetime.utcnow()
+    entry = CachedLink(dict(items=[item, other]), now, frozenset())
+    img = _image_from(entry, "Jón Jónsson", thumb=False)
+    assert img is not None and img.src == item["link"] and img.width == 300
+    img = _image_from(entry, "Jón Jónsson", thumb=True)
+    assert img is not None and img.src.endswith("_thumb.jpg") and img.height == 40
+    entry = CachedLink(entry.answer, now, frozenset([item["link"]]))
+    img = _image_from(entry, "Jón Jónsson", thumb=False)
+    assert img is not None and img.src == other["link"]
+    entry = CachedLink(dict(), now, frozenset())
+    assert _image_from(entry, "Jón Jónsson", thumb=False) is None
+
+
+def test_nnclient():
+    """Test batching and caching in the neural network clients,
+    against the fake server in nn/fakeserver.py"""
+
+    import threading
+
+    from reynir.bindb import GreynirBin
+
+    from nn.fakeserver import FakeNnServer
+    from nn.nnclient import NnClient, ParsingClient, TranslateClient
+
+    with FakeNnServer(delay=0.05) as server:
+        # Subclasses keep their own micro-batchers
+        class Parser(ParsingClient):
+            host = server.host
+            port = server.port
+            batch_size = 4
+            batch_delay = 0.1
+
+        class Translator(TranslateClient):
+            host = server.host
+            port = server.port
+            batch_size = 4
+
+        NnClient._cache.clear()
+        # Load BÍN before tokenizing in several threads, as warmup.py does
+        GreynirBin.get_db()
+
+        # Concurrent single sentences are sent in batches
+        results: Dict[int, Any] = dict()
+        texts = [f"Hér er setning númer {i}" for i in range(8)]
+
+        def parse(i: int) -> None:
+            results[i] = Parser.request_sentence(texts[i], flat=True)
+
+        threads = [threading.Thread(target=parse, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i, text in enumerate(texts):
+            assert results[i]["outputs"].split().count("ao") == len(text.split())
+            assert results[i]["scores"] == 0.5
+        assert len(server.requests["parse"]) < 8
+        assert sum(len(r) for r in server.requests["parse"]) == 8
+        assert all(len(r) <= 4 for r in server.requests["parse"])
+
+        # Identical sentences are taken from the cache
+        tree = Parser.request_sentence(texts[0])
+        assert tree["outputs"].name == "P" and tree["outputs"].to_dict()
+        assert sum(len(r) for r in server.requests["parse"]) == 8
+
+        # Long texts are split into batches, sent concurrently
+        sents = [f"Setning {i}." for i in range(10)] + ["Setning 0."]
+        result = Translator.request_segmented(sents, "is", "en", verbatim=True)
+        assert [r["outputs"] for r in result["results"].values()] == [
+            s.upper() for s in sents
+        ]
+        assert sorted(len(r) for r in server.requests["translate"]) == [2, 4, 4]
+        # Translations to another language are not taken from the cache
+        Translator.request_segmented(sents[0:1], "en", "is", verbatim=True)
+        assert len(server.requests["translate"]) == 4
+        assert Translator.metrics()["batches"] == 1
+        # The micro-batcher also counts the sentence found in the cache
+        assert Parser.metrics()["sentences"] == 9
+
+
+def test_querylog_forget(tmp_path: Path):
+    """Test that clearing a client's query history discards its
+    buffered query log rows (see querylog.py)"""
+
+    from datetime import datetime, timedelta
+
+    from sharedcache import SQLiteCache
+    from querylog import QueryLogWriter
+
+    written: List[Dict[str, Any]] = []
+
+    class Writer(QueryLogWriter):
+        @staticmethod
+        def _write(rows: List[Dict[str, Any]]) -> None:
+            written.extend(rows)
+
+    def row(client_id: str, question: str) -> Dict[str, Any]:
+        return dict(
+            timestamp=datetime.utcnow(), client_id=client_id, question=question
+        )
+
+    cache = SQLiteCache(str(tmp_path / "cache.db"))
+    # A writer that doesn't flush on its own, and one
+    # standing in for another worker process
+    w = Writer(interval=3600.0, batch_size=100)
+    other = Writer(interval=3600.0, batch_size=100)
+    w.use_shared_cache(cache)
+    other.use_shared_cache(cache)
+
+    w.log(row("a", "fyrsta"))
+    w.log(row("b", "önnur"))
+    other.log(row("a", "þriðja"))
+    assert [r["question"] for r in w.pending()] == ["fyrsta", "önnur"]
+
+    w.forget("a")
+    assert [r["question"] for r in w.pending()] == ["önnur"]
+    # Queries made after the history was cleared are kept
+    later = row("a", "fjórða")
+    later["timestamp"] += timedelta(seconds=1)
+    w.log(later)
+    assert w.flush() == 2
+    assert [r["question"] for r in written] == ["önnur", "fjórða"]
+    # The other worker skips the client's rows logged before the clear
+    assert other.flush() == 0
+    assert len(written) == 2
+    # Clears by different workers don't overwrite each other
+    other.log(row("b", "fimmta"))
+    other.log(row("c", "sjötta"))
+    third = Writer(interval=3600.0, batch_size=100)
+    third.use_shared_cache(cache)
+    third.forget("c")
+    w.forget("b")
+    assert other.flush() == 0
+    w.close()
+    other.close()
+    third.close()
+
+
+def test_dialogue_state(monkeypatch: pytest.MonkeyPatch):
+    """Test the lazy loading of dialogue state in queries/extras/dialogue.py"""
+
+    from contextlib import contextmanager
+
+    import queries.extras.dialogue as dialogue
+    from queries.extras.dialogue import DialogueStateManager as DSM
+
+    class Session:
+        """A stand-in for a database session, with one client's rows"""
+
+        def __init__(self) -> None:
+            self.rows: Dict[Any, Any] = dict()
+            self.reads = 0
+
+        def query(self, model: Any) -> Any:
+            self.reads += 1
+            session = self
+
+            class Query:
+                def filter(self, *args: Any) -> Any:
+                    return self
+
+                def one_or_none(self) -> Any:
+                    return session.rows.get(model)
+
+            return Query()
+
+        def get(self, model: Any, key: Any) -> Any:
+            return self.rows.get(model)
+
+        def add(self, row: Any) -> None:
+            self.rows[type(row)] = row
+
+    @contextmanager
+    def session_context(session: Session, **kwargs: Any):
+        yield session
+
+    monkeypatch.setattr(dialogue, "SessionContext", session_context)
+    session = Session()
+
+    # The active dialogues are only fetched when a dialogue module
+    # needs them, and then only once per query
+    dsm = DSM("client1", session)  # type: ignore
+    assert session.reads == 0
+    dsm.prepare_dialogue("fruitseller")
+    assert session.reads == 1 and dsm.not_in_dialogue()
+    assert dsm.active_dialogue is None
+    assert session.reads == 1
+
+    # The state saved by one query is loaded by the next one,
+    # from the database, which all worker processes share
+    dsm.hotword_activated()
+    dsm.update_dialogue_data()
+    assert len(session.rows) == 2
+    dsm = DSM("client1", session)  # type: ignore
+    dsm.prepare_dialogue("fruitseller")
+    assert session.reads == 3
+    assert dsm.active_dialogue == "fruitseller" and not dsm.not_in_dialogue()
+    assert dsm.current_resource.name == dsm.get_next_active_resource("fruitseller")
+
+
+def test_plain_text_router() -> None:
+    """Test the routing of plain text queries to query modules"""
+
+    from types import ModuleType
+
+    # Query.init_class() imports all query modules, among them
+    # queries.time, which must not shadow anything the router uses
+    import queries.time
+    from queries import PlainTextRouter
+
+    calls: List[str] = []
+
+    def module(name: str, **attrs: Any) -> ModuleType:
+        m = ModuleType(f"queries.{name}")
+
+        def handle_plain_text(q: Any) -> bool:
+            calls.append(name)
+            return q.query_lower.startswith(name)
+
+        setattr(m, "handle_plain_text", handle_plain_text)
+        for k, v in attrs.items():
+            setattr(m, k, v)
+        return m
+
+    router = PlainTextRouter(
+        [
+            module("phrases", PLAIN_TEXT_PHRASES=frozenset(("hvað er klukkan",))),
+            module("prefixes", PLAIN_TEXT_PREFIXES=("segðu ",)),
+            module("regexes", PLAIN_TEXT_REGEXES=(r"^hringdu í (.+)$", r"langt frá")),
+            module("unrouted"),
+        ]
+    )
+    names = ["phrases", "prefixes", "regexes", "unrouted"]
+
+    def route(ql: str) -> List[str]:
+        return [names[ix] for ix in router.handlers_for(ql)]
+
+    assert route("hvað er klukkan") == ["phrases", "unrouted"]
+    assert route("hvað er klukkan á akureyri") == ["unrouted"]
+    assert route("segðu halló") == ["prefixes", "unrouted"]
+    assert route("hringdu í mömmu") == ["regexes", "unrouted"]
+    assert route("hvað er ég langt frá akureyri") == ["regexes", "unrouted"]
+    assert route("ég vil að þú hringdu í mömmu") == ["unrouted"]
+
+    class FakeQuery:
+        query_lower = "unrouted query?"
+
+    assert router.route(FakeQuery())  # type: ignore
+    assert calls == ["unrouted"]
+    assert router.timings()["unrouted"][0] == 1
+    assert router.timings()["phrases"][0] == 0
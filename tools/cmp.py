@@ -38,18 +38,32 @@
 
     TAGGER=local python tools/cmp.py
 
+    Local tagging can be done in batches, in parallel in a pool of
+    worker processes, each with its own (warmed up) parser, by setting
+    the WORKERS environment variable to the number of processes:
+
+    TAGGER=local WORKERS=8 python tools/cmp.py
+
+    The accuracy figures and timing of each run are appended to the
+    cmp_runs.jsonl file, as one JSON object per line, so that tagger
+    accuracy and speed can be tracked together over time.
+
 """
 
 import json
 import xml.etree.ElementTree as ET
 import os
 import sys
+import io
 import json
 import urllib.request
 
 from urllib.parse import quote
 from timeit import default_timer as timer
 from contextlib import contextmanager
+from datetime import datetime
+from itertools import islice
+from multiprocessing import Pool
 
 # Hack to make this Python program executable from the tools subdirectory
 basepath, _ = os.path.split(os.path.realpath(__file__))
@@ -89,9 +103,21 @@ else:
         IFD_PATH = "http://" + TAGGER + "/ifdtag.api/v1"
         POS_PATH = "http://" + TAGGER + "/postag.api/v1"
 
+# Number of worker processes for batched local tagging (1 = no batching)
+NUM_WORKERS = max(1, int(os.environ.get("WORKERS", "1")))
+if NUM_WORKERS > 1 and not USE_LOCAL_TAGGER:
+    print("WORKERS is only supported with TAGGER=local")
+    sys.exit(1)
+
+# Number of sentences sent to a worker process at a time
+CHUNK_SIZE = 100
+
 # The directory where the IFD corpus files are located
 IFD_DIR = "ifd"
 
+# File where the results and timing of each run are recorded
+RUNS_FILE = "cmp_runs.jsonl"
+
 
 # GREINARMERKI = {"!", "(", ")", ",", "-", ".", "...", "/", ":", ";", "?", "[", "]", "«", "»"} # Öll greinarmerki sem koma fyrir í OTB
 VINSTRI_GREINARMERKI = "([„«#$€<"
@@ -455,6 +481,54 @@ class Tagger:
         return cls()._create_session()
 
 
+# Tagging session of a worker process, kept open for the lifetime
+# of the process (see _init_worker())
+_WORKER_SESSION = None
+_WORKER_TAGGER = None
+
+
+def _init_worker():
+    """Initialize a worker process for batched tagging"""
+    global _WORKER_SESSION, _WORKER_TAGGER
+    _WORKER_SESSION = Tagger.session()
+    _WORKER_TAGGER = _WORKER_SESSION.__enter__()
+    # Warm up the parser before any sentences are timed
+    _WORKER_TAGGER.tag("Þetta er setning.")
+
+
+def _process_chunk(args):
+    """Process a chunk of sentences in a worker process, returning
+    the resulting statistics and sample output (if any)"""
+    process_name, offset, sents = args
+    comp = Comparison()
+    # Make sentence numbers in the sample output match a serial run
+    comp.setnf = offset
+    if process_name == "úrvinnsla_stikkprufa":
+        comp.stikk = io.StringIO()
+    process_func = getattr(comp, process_name)
+    for sent in sents:
+        process_func(_WORKER_TAGGER, sent)
+    sample = comp.stikk.getvalue() if comp.stikk is not None else ""
+    comp.stikk = None
+    return comp.stats(), sample
+
+
+@contextmanager
+def _tagging_pool():
+    """Yield a (pool, tagger) tuple for processing sentences: a pool of worker
+    processes if batching, otherwise a local or remote (None) tagger"""
+    if NUM_WORKERS > 1:
+        with Pool(NUM_WORKERS, initializer=_init_worker) as pool:
+            yield pool, None
+    elif USE_LOCAL_TAGGER:
+        # Call the Greynir POS tagger directly in-process
+        with Tagger.session() as tagger:
+            yield None, tagger
+    else:
+        # Use the Greynir HTTP JSON API for POS tagging (/postag.api)
+        yield None, None
+
+
 class Comparison:
     def __init__(self):
         self.ógreindar_setningar = 0  # Geymir fjölda setninga sem ekki tókst að greina
@@ -482,6 +556,57 @@ class Comparison:
         self.setnf = 0
         self.stikk = None  # Úttaksskrá
         self.CANNOT_PARSE = 0  # Number of sentences postag.api can't parse and sends to ifdtag.api (if postag.api is selected)
+        self.niðurstöður = {}  # Nákvæmnitölur, reiknaðar í prenta()
+
+    def stats(self):
+        """Return the counters of this comparison, for merging"""
+        return {
+            k: v
+            for k, v in vars(self).items()
+            if isinstance(v, int) or k == "M_confmat"
+        }
+
+    def merge(self, stats):
+        """Merge counters from another comparison (see stats()) into this one"""
+        for k, v in stats.items():
+            if k == "M_confmat":
+                for tvennd, tíðni in v.items():
+                    self.M_confmat[tvennd] = self.M_confmat.get(tvennd, 0) + tíðni
+            elif k == "setnf":
+                # Sentence numbers continue from the last chunk
+                self.setnf = max(self.setnf, v)
+            else:
+                setattr(self, k, getattr(self, k) + v)
+
+    def process(self, pool, tagger, process_func, sentences):
+        """Process a stream of sentences, either serially
+        or in chunks in a pool of worker processes"""
+        if pool is None:
+            for sent in sentences:
+                process_func(tagger, sent)
+            return
+
+        def chunks():
+            offset = self.setnf
+            while True:
+                chunk = list(islice(sentences, CHUNK_SIZE))
+                if not chunk:
+                    break
+                yield process_func.__name__, offset, chunk
+                offset += len(chunk)
+
+        t0 = timer()
+        for stats, sample in pool.imap(_process_chunk, chunks()):
+            self.merge(stats)
+            if sample and self.stikk is not None:
+                self.stikk.write(sample)
+                self.stikk.flush()
+            elapsed = timer() - t0
+            print(
+                "{0} setningar, {1:.1f} setningar á sekúndu".format(
+                    self.setnf, self.setnf / elapsed
+                )
+            )
 
     def úrvinnsla_stikkprufa(self, tagger, sent):
         stikk = self.stikk
@@ -1560,47 +1685,68 @@ class Comparison:
             )
         print("Nákvæmni (accuracy): {:.4f}\tMeð hlutréttu: {:.4f}".format(GMA, GMPA))
         print("*******************************************************")
+        self.niðurstöður = dict(
+            SA=SA, OA=OA, LA=LA, MA=MA, MPA=MPA, GOA=GOA, GLA=GLA, GMA=GMA, GMPA=GMPA
+        )
 
-    def start(self, process_func, filter_func=None, skip_func=None):
+    def record_run(self, description, seconds):
+        """Append the results and timing of a run to the runs file"""
+        run = dict(
+            timestamp=datetime.utcnow().isoformat(timespec="seconds"),
+            description=description,
+            tagger="ifdtag" if USE_IFD_TAGGER else "postag",
+            server="local" if USE_LOCAL_TAGGER else TAGGER,
+            workers=NUM_WORKERS,
+            sentences=self.setnf,
+            seconds=round(seconds, 1),
+            sentences_per_second=round(self.setnf / seconds, 2) if seconds else 0.0,
+            **{k: round(v, 4) for k, v in self.niðurstöður.items()},
+        )
+        with open(RUNS_FILE, "a", encoding="utf-8") as f:
+            f.write(json.dumps(run, ensure_ascii=False) + "\n")
+
+    def start(self, description, process_func, filter_func=None, skip_func=None):
         corpus = Corpus()
         sentences = corpus.raw_sentence_stream(filter_func=filter_func, skip=skip_func)
-        if USE_LOCAL_TAGGER:
-            # Call the Greynir POS tagger directly in-process
-            with Tagger.session() as tagger:
-                for sent in sentences:
-                    process_func(tagger, sent)
-        else:
-            # Use the Greynir HTTP JSON API for POS tagging (/postag.api)
-            for sent in sentences:
-                process_func(None, sent)
+        byrjun = timer()
+        with _tagging_pool() as (pool, tagger):
+            self.process(pool, tagger, process_func, iter(sentences))
+        liðið = timer() - byrjun
         self.prenta()
+        self.record_run(description, liðið)
 
     def start_stikkprufa(self):
         úrtak = 50
         with open("stikkprufa.txt", "w") as stikk:
             self.stikk = stikk
-            self.start(self.úrvinnsla_stikkprufa, skip_func=lambda n: n % úrtak != 0)
+            self.start(
+                "stikkprufa",
+                self.úrvinnsla_stikkprufa,
+                skip_func=lambda n: n % úrtak != 0,
+            )
             self.stikk = None
 
     def start_allt(self):
-        self.start(self.úrvinnsla)
+        self.start("allt", self.úrvinnsla)
 
     def start_fyllimengi(self):
         úrtak = 50
-        self.start(self.úrvinnsla, skip_func=lambda n: n % úrtak == 0)
+        self.start("fyllimengi", self.úrvinnsla, skip_func=lambda n: n % úrtak == 0)
 
 
 def start_flokkar():
     corpus = Corpus()
 
-    def _run_flokkar(tagger):
+    def _run_flokkar(pool, tagger):
         def _run_flokkur(filter_func, description):
             sents = corpus.raw_sentence_stream(filter_func=filter_func)
             comp = Comparison()
-            for sent in sents:
-                comp.úrvinnsla(tagger, sent)
+            byrjun = timer()
+            comp.process(pool, tagger, comp.úrvinnsla, iter(sents))
+            liðið = timer() - byrjun
             print("*** Niðurstöður fyrir {0} ***".format(description))
             comp.prenta()
+            comp.record_run(description, liðið)
 
         # Íslensk skáldverk
         f = lambda x: x.startswith("A1")
@@ -1632,11 +1778,8 @@ def start_flokkar():
         f = lambda x: x.startswith("A5")
         _run_flokkur(f, "barna- og unglingabækur")
 
-    if USE_LOCAL_TAGGER:
-        with Tagger.session() as tagger:
-            _run_flokkar(tagger)
-    else:
-        _run_flokkar(None)
+    with _tagging_pool() as (pool, tagger):
+        _run_flokkar(pool, tagger)
 
 
 if __name__ == "__main__":
@@ -1655,6 +1798,8 @@ if __name__ == "__main__":
         print("Vefslóð mörkunarþjóns er {}".format(POS_PATH))
     else:
         print("Staðbundið forritasafn verður notað til mörkunar")
+        if NUM_WORKERS > 1:
+            print("Mörkun fer fram í {} samhliða ferlum".format(NUM_WORKERS))
     response = input(
         "\nHvað viltu prófa? Stikkprufu (S), allan texta (A), allt nema stikkprufu (R) eða allt eftir flokkum (F)?\n"
     ).lower()
@@ -0,0 +1,236 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    Parallel, resumable export of sentence data from the article
+    database, used by the corpus generation tools in this directory.
+
+    The article id (UUID) space is partitioned into shards by the
+    leading byte of the id. The shards are exported in a pool of
+    worker processes, each shard into its own output file of JSON
+    lines. Shard files are written under a temporary name and renamed
+    when complete, and completed shards are recorded in a manifest,
+    so an interrupted export resumes where it left off.
+
+    Usage (from a tool script):
+
+        def export_article(art):
+            # Return a list of JSON-serializable records
+            ...
+
+        export = ShardedExport("silver", outdir, params=dict(...))
+        export.run(export_article, criteria, workers=8)
+        for record in export.records():
+            ...
+
+    A tool that only needs some of the records can instead iterate
+    over export.stream(export_article, criteria, workers=8), which
+    generates the records in shard order while the export is in
+    progress, and stops exporting when the iteration stops.
+
+"""
+
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+import os
+import json
+import time
+from functools import partial
+from multiprocessing import Pool
+
+from article import Article
+
+
+# Number of shards, each covering 1/256th of the article id space
+NUM_SHARDS = 256
+
+ExportFunction = Callable[[Article], List[Dict[str, Any]]]
+
+
+def id_range(shard: int) -> Tuple[str, Optional[str]]:
+    """Return the (inclusive) lower and (exclusive) upper bound of the
+    article ids in a shard; the upper bound of the last shard is None"""
+    lo = "{0:02x}000000-0000-0000-0000-000000000000".format(shard)
+    if shard + 1 >= NUM_SHARDS:
+        return lo, None
+    return lo, "{0:02x}000000-0000-0000-0000-000000000000".format(shard + 1)
+
+
+def _export_shard(
+    fn: ExportFunction, criteria: Mapping[str, Any], path_fmt: str, shard: int
+) -> Tuple[int, int, int, float]:
+    """Worker process function: export the articles in a shard to a file.
+    Returns (shard, number of articles, number of records, elapsed seconds)."""
+    t0 = time.time()
+    path = path_fmt.format(shard)
+    c = dict(criteria)
+    c["id_range"] = id_range(shard)
+    num_articles = num_records = 0
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        for art in Article.articles(c):
+            num_articles += 1
+            for record in fn(art):
+                f.write(json.dumps(record, ensure_ascii=False))
+                f.write("\n")
+                num_records += 1
+    # Only a complete shard file gets its final name
+    os.replace(tmp_path, path)
+    return shard, num_articles, num_records, time.time() - t0
+
+
+class ShardedExport:
+
+    """A sharded export, with its output files in a given directory
+    and a manifest recording the shards completed so far"""
+
+    def __init__(
+        self, name: str, outdir: str, params: Optional[Mapping[str, Any]] = None
+    ) -> None:
+        self.name = name
+        self.outdir = outdir
+        self.manifest_path = os.path.join(outdir, f"{name}.manifest.json")
+        self.path_fmt = os.path.join(outdir, name + "-{0:02x}.jsonl")
+        # Parameters that affect the exported records: a manifest
+        # with different parameters can't be resumed
+        self.params = dict(params or {})
+        self.manifest: Dict[str, Any] = {"params": self.params, "shards": {}}
+        os.makedirs(outdir, exist_ok=True)
+        if os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if manifest.get("params") != self.params:
+                raise ValueError(
+                    f"Manifest {self.manifest_path} was created with different "
+                    f"parameters: {manifest.get('params')}"
+                )
+            self.manifest = manifest
+
+    def shard_path(self, shard: int) -> str:
+        return self.path_fmt.format(shard)
+
+    def pending(self) -> List[int]:
+        """Return the shards that haven't been exported yet"""
+        done = self.manifest["shards"]
+        return [
+            shard
+            for shard in range(NUM_SHARDS)
+            if f"{shard:02x}" not in done or not os.path.exists(self.shard_path(shard))
+        ]
+
+    def _checkpoint(self) -> None:
+        """Atomically write the manifest to disk"""
+        tmp_path = self.manifest_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self.manifest, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, self.manifest_path)
+
+    def run(
+        self, fn: ExportFunction, criteria: Mapping[str, Any], workers: int
+    ) -> None:
+        """Export all pending shards, using the given function to
+        obtain the records for each article, in a pool of processes"""
+        pending = self.pending()
+        if not pending:
+            print(f"All {NUM_SHARDS} shards already exported")
+            return
+        print(
+            f"Exporting {len(pending)} of {NUM_SHARDS} shards "
+            f"using {workers} processes"
+        )
+        t0 = time.time()
+        total_records = 0
+        func = partial(_export_shard, fn, criteria, self.path_fmt)
+        with Pool(workers) as pool:
+            results = pool.imap_unordered(func, pending)
+            for n, result in enumerate(results, start=1):
+                total_records = self._completed(
+                    result, n, len(pending), t0, total_records
+                )
+        elapsed = time.time() - t0
+        print(
+            f"Exported {total_records} sentences from {len(pending)} shards "
+            f"in {elapsed:.1f}s, {total_records / max(elapsed, 0.001):.1f} "
+            "sentences/s"
+        )
+
+    def _completed(
+        self,
+        result: Tuple[int, int, int, float],
+        n: int,
+        num: int,
+        t0: float,
+        total_records: int,
+    ) -> int:
+        """Record a completed shard in the manifest and report progress,
+        given the number of records in the shards completed before it.
+        Returns the number of records including this shard."""
+        shard, arts, records, seconds = result
+        total_records += records
+        self.manifest["shards"][f"{shard:02x}"] = {
+            "articles": arts,
+            "records": records,
+            "seconds": round(seconds, 1),
+        }
+        self._checkpoint()
+        elapsed = time.time() - t0
+        print(
+            f"Shard {shard:02x} ({n}/{num}): {arts} articles, "
+            f"{records} sentences in {seconds:.1f}s "
+            f"({records / max(seconds, 0.001):.1f}/s), "
+            f"{elapsed:.1f}s elapsed "
+            f"({total_records / max(elapsed, 0.001):.1f} sentences/s overall)"
+        )
+        return total_records
+
+    def _shard_records(self, shard: int) -> Iterator[Dict[str, Any]]:
+        path = self.shard_path(shard)
+        if not os.path.exists(path):
+            return
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                yield json.loads(line)
+
+    def records(self) -> Iterator[Dict[str, Any]]:
+        """Generate the exported records, in shard order"""
+        for shard in range(NUM_SHARDS):
+            yield from self._shard_records(shard)
+
+    def stream(
+        self, fn: ExportFunction, criteria: Mapping[str, Any], workers: int
+    ) -> Iterator[Dict[str, Any]]:
+        """Generate the records of all shards, in shard order, exporting
+        the pending shards as in run() meanwhile. The records of a shard
+        are generated once it and all preceding shards are complete.
+        When the caller stops iterating, the remaining shards are not
+        exported (completed shards are kept, for resuming)."""
+        pending = self.pending()
+        t0 = time.time()
+        func = partial(_export_shard, fn, criteria, self.path_fmt)
+        total_records = 0
+        with Pool(workers) as pool:
+            # Results arrive in the order of the pending shards
+            results = pool.imap(func, pending)
+            n = 0
+            for shard in range(NUM_SHARDS):
+                if n < len(pending) and pending[n] == shard:
+                    n += 1
+                    total_records = self._completed(
+                        next(results), n, len(pending), t0, total_records
+                    )
+                yield from self._shard_records(shard)
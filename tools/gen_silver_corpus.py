@@ -29,6 +29,14 @@
 
     The output format is similar to that of the Penn Treebank.
 
+    The sentence trees are first exported from the article database in
+    parallel, in shards (see corpusshards.py), applying the criteria that
+    only depend on each sentence itself. An interrupted export can be
+    resumed by running the program again with the same --outdir.
+    The criteria that depend on previously selected sentences (uniqueness
+    and phrase/terminal frequency buckets) are then applied to the exported
+    sentences in a single pass, which is fast, as no trees need to be loaded.
+
 """
 
 import os
@@ -47,8 +55,8 @@ if basepath.endswith(_TOOLS):
     sys.path.append(basepath)
 
 from settings import Settings, ConfigError  # noqa
-from article import Article  # noqa
 from tree import Tree  # noqa
+from corpusshards import ShardedExport  # noqa
 
 from reynir import ICELANDIC_RATIO  # noqa
 from tokenizer import definitions  # noqa
@@ -217,19 +225,25 @@ def is_acceptable_article(art):
 MIN_SENT_LENGTH = 5
 
 
-def is_acceptable_sentence_tree(stree):
-    # Generate hash of normalized sentence text and add
-    # it to SENT_HASHES to ensure uniqueness
-    text = stree.text
-    norm = normalize(text)
+def sentence_hash(stree):
+    # Generate hash of normalized sentence text, used to ensure uniqueness
+    norm = normalize(stree.text)
     if not norm:
-        return False
+        return None
+    return hashlib.md5(norm.encode("utf-8")).hexdigest()
 
-    md5sum = hashlib.md5(norm.encode("utf-8")).hexdigest()
 
-    # Skip already processed identical sentence
+def is_unique(md5sum):
+    # Skip already processed identical sentence, otherwise
+    # add sentence hash to SENT_HASHES
     if md5sum in SENT_HASHES:
         return False
+    SENT_HASHES.add(md5sum)
+    return True
+
+
+def is_acceptable_sentence_tree(stree):
+    text = stree.text
 
     # Skip sentences that don't contain enough Icelandic words
     if not is_icelandic(stree):
@@ -250,9 +264,6 @@ def is_acceptable_sentence_tree(stree):
         return False
 
     # OK, it has passed our criteria
-    # Add sentence to hash set
-    SENT_HASHES.add(md5sum)
-    # print(text)
     return True
 
 
@@ -280,7 +291,7 @@ def gen_anno_tree(article, index, stree):
     return AnnoTree("", [meta_node, nltk_tree])
 
 
-def old_info(stree):
+def old_info(nonterminals, terminals):
 
     # TODO halda utan um þær fötur sem eru ekki fullar
     # Þá er hægt að safna í fötur hér
@@ -294,15 +305,13 @@ def old_info(stree):
     # Byrja svo ekki að tékka á fötunum fyrr en eftir 500þ setningar,
     # ætti ekki að vera mikið um ófullar fötur.
     p = True
-    for nonterm in stree.nonterminals:
-        phrase = nonterm._head.get("i")
+    for phrase in nonterminals:
         if NONTERMDICT[phrase] < 1000:
             # We want to add it!
             p = False
         NONTERMDICT[phrase] += 1
 
-    for leaf in stree.leaves:
-        cat = leaf._head.get("c")
+    for cat in terminals:
         if TERMDICT[cat] < 10000:
             p = False
         TERMDICT[cat] += 1
@@ -359,8 +368,47 @@ OUT_FILENAME = "silver.txt"
 SEPARATOR = "\n\n"
 
 
-def main():
+def export_article(art):
+    """Worker process function: return records for the sentences
+    of an article that meet the criteria of is_acceptable_sentence_tree()"""
+    # The first record of each article carries its statistics
+    stats = {"article": True, "skipped": 0}
+    records = [stats]
+    if not is_acceptable_article(art):
+        stats["article"] = False
+        return records
 
+    # Load article tree and simple sentence trees for all sentences in article
+    try:
+        tree = Tree(url=art.url, authority=art.authority)
+        tree.load(art.tree)
+        trees = list(tree.simple_trees())
+    except Exception:
+        stats["article"] = False
+        return records
+
+    # Iterate over each sentence tree, process
+    for ix, stree in trees:
+        if not stree:
+            stats["skipped"] += 1
+            continue
+        md5sum = sentence_hash(stree)
+        if md5sum is None or not is_acceptable_sentence_tree(stree):
+            stats["skipped"] += 1
+            continue
+        records.append(
+            {
+                "md5": md5sum,
+                "heading": is_heading_sentence_tree(stree),
+                "nt": [nt._head.get("i") for nt in stree.nonterminals],
+                "t": [leaf._head.get("c") for leaf in stree.leaves],
+                "tree": str(gen_anno_tree(art, ix, stree)),
+            }
+        )
+    return records
+
+
+def main(outdir, workers):
     try:
         # Read configuration file
         Settings.read(os.path.join(basepath, "config", "GreynirSimple.conf"))
@@ -368,6 +416,10 @@ def main():
         print("Configuration error: {0}".format(e))
         sys.exit(os.EX_CONFIG)
 
+    # Export the acceptable sentence trees of all articles, in parallel
+    export = ShardedExport("silver", outdir, params={"min_sent": MIN_SENT_LENGTH})
+    export.run(export_article, {}, workers)
+
     initialize_buckets()
 
     # Output file
@@ -381,72 +433,57 @@ def main():
 
     accumulated = []
 
-    for art in Article.articles({"random": True}):
-        # if total_sent % 1001 == 1:
-        #    print(total_sent)
-        if not is_acceptable_article(art):
-            total_arts_skipped += 1
+    for record in export.records():
+        if "article" in record:
+            # Statistics record at the start of each article
+            num_acc = len(accumulated)
+            if num_acc >= BATCH_SIZE:
+                total_sent += num_acc
+                shuffle(accumulated)
+                # Write sentence trees to file
+                for s in accumulated:
+                    file.write(s + SEPARATOR)
+                # Empty our list of acc. sentences
+                accumulated = []
+                # Trigger manual garbage collection
+                gc.collect()
+                print(f"{total_sent} sentences accumulated")
+                print(f"\t{total_sent_skipped} sentences skipped")
+
+            if last_threshold(total_sent) or total_sent + total_sent_skipped > 12000000:
+                # Stop if we've checked 12M total sentences
+                break
+            elif first_threshold(total_sent) and full_buckets():
+                break
+
+            if record["article"]:
+                total_arts += 1
+            else:
+                total_arts_skipped += 1
+            total_sent_skipped += record["skipped"]
             continue
 
-        total_arts += 1
-
-        # Load article tree
-        try:
-            tree = Tree(url=art.url, authority=art.authority)
-            tree.load(art.tree)
-        except Exception:
-            total_arts_skipped += 1
+        # Skip sentences identical to ones already selected
+        if not is_unique(record["md5"]):
+            total_sent_skipped += 1
             continue
-
-        # Load simple sentence trees for all sentences in article
-        trees = None
-        try:
-            trees = tree.simple_trees()
-        except Exception:
-            total_arts_skipped += 1
+        elif record["heading"]:
+            with open("heading.txt", "a", encoding="utf-8") as headingfile:
+                headingfile.write(record["tree"] + SEPARATOR)
             continue
+        # Both check if we find something new and add to buckets
+        if old_info(record["nt"], record["t"]) and first_threshold(total_sent):
+            total_sent_skipped += 1
+            continue
+
+        # OK, it's acceptable
+        accumulated.append(record["tree"])
 
-        # Iterate over each sentence tree, process
-        for ix, stree in trees:
-            if not stree:
-                total_sent_skipped += 1
-                continue
-            if not is_acceptable_sentence_tree(stree):
-                total_sent_skipped += 1
-                continue
-            elif is_heading_sentence_tree(stree):
-                atree = gen_anno_tree(art, ix, stree)
-                with open("heading.txt", "a", encoding="utf-8") as headingfile:
-                    headingfile.write(str(atree) + SEPARATOR)
-                continue
-            # Both check if we find something new and add to buckets
-            if old_info(stree) and first_threshold(total_sent):
-                total_sent_skipped += 1
-                continue
-
-            # OK, it's acceptable
-            annotree = gen_anno_tree(art, ix, stree)
-            accumulated.append(annotree)
-
-        num_acc = len(accumulated)
-        if num_acc >= BATCH_SIZE:
-            total_sent += num_acc
-            shuffle(accumulated)
-            # Write sentence trees to file
-            for s in accumulated:
-                file.write(str(s) + SEPARATOR)
-            # Empty our list of acc. sentences
-            accumulated = []
-            # Trigger manual garbage collection
-            gc.collect()
-            print(f"{total_sent} sentences accumulated")
-            print(f"\t{total_sent_skipped} sentences skipped")
-
-        if last_threshold(total_sent) or total_sent + total_sent_skipped > 12000000:
-            # Stop if we've checked 12M total sentences
-            break
-        elif first_threshold(total_sent) and full_buckets():
-            break
+    # Write the remaining sentence trees
+    shuffle(accumulated)
+    for s in accumulated:
+        file.write(s + SEPARATOR)
+    total_sent += len(accumulated)
 
     # All done
     file.close()
@@ -463,4 +500,24 @@ def main():
 
 
 if __name__ == "__main__":
-    main()
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Generates silver corpus files")
+    parser.add_argument(
+        "--outdir",
+        dest="OUTDIR",
+        type=str,
+        help="Directory for the exported shards (default 'silver_shards')",
+        default="silver_shards",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="WORKERS",
+        type=int,
+        help="Number of worker processes (default: number of CPUs)",
+        default=os.cpu_count() or 1,
+    )
+    args = parser.parse_args()
+
+    main(args.OUTDIR, args.WORKERS)
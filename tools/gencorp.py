@@ -29,6 +29,14 @@
 
     The output format is similar to that of the Penn Treebank.
 
+    The sentence trees are exported from the article database in
+    parallel, in shards (see corpusshards.py). An interrupted export can
+    be resumed by running the program again with the same --outdir and
+    parameters. The sentences are classified, with quotas on how many
+    of each category are accepted, in shard order as the shards are
+    completed, and the export stops once the subcorpus files have
+    enough sentences.
+
 """
 
 import os
@@ -36,6 +44,7 @@ import sys
 import gc
 from random import shuffle
 from collections import defaultdict
+from functools import partial
 
 # Hack to make this Python program executable from the tools subdirectory
 basepath, _ = os.path.split(os.path.realpath(__file__))
@@ -45,8 +54,8 @@ if basepath.endswith(_TOOLS):
     sys.path.append(basepath)
 
 from settings import Settings, ConfigError  # noqa
-from article import Article  # noqa
 from tree import Tree  # noqa
+from corpusshards import ShardedExport  # noqa
 
 # To make this work, clone Miðeind's Annotald repo, enter the Greynir
 # virtualenv and run "python setup.py develop" from the Annotald repo root
@@ -107,74 +116,80 @@ ENGLISH_WORDS = frozenset(
 BIGSET = set()
 
 
-def sieve(ix, stree):
-    """Judge which sentences make sense for each subcorpora"""
+def presieve(stree):
+    """Judge which subcorpus a sentence belongs to, by the criteria that
+    only depend on the sentence itself. Returns None if it meets all
+    of them; the bucket quotas are then checked by sieve()."""
     text = stree.text
     tokens = text.split()
-    code = "silver"  # Default value
-    # Make sure it has enough tokens
-    while True:
 
-        code = leavescheck(stree)
-        if code == "copper":
-            print("\t1 - copper")
-            break
+    # Make sure it has enough tokens
+    if not len(tokens) >= MIN_SENT_LENGTH:
+        print("\t3 - copper")
+        return "copper"
 
-        code = phrasecheck(stree)
-        if code == "copper":
-            print("\t2 - copper")
-            break
+    # Skip sentences that don't contain enough Icelandic words
+    if unicelandic(stree):
+        #    print("\t4 - copper")
+        return "copper"
 
-        if not len(tokens) >= MIN_SENT_LENGTH:
-            print("\t3 - copper")
-            code = "copper"
-            break
+    # Skip sentences containing something in our bag of English words
+    wordset = set([t.lower() for t in tokens])
+    if wordset & ENGLISH_WORDS:
+        print("\t5 - copper")
+        return "copper"
 
-        # Skip sentences that don't contain enough Icelandic words
-        if unicelandic(stree):
-            #    print("\t4 - copper")
-            code = "copper"
-            break
+    # Skip uncapitalized sentences
+    if text[0].islower():
+        print("\t6 - copper")
+        return "copper"
 
-        # Skip sentences containing something in our bag of English words
-        wordset = set([t.lower() for t in tokens])
-        if wordset & ENGLISH_WORDS:
-            print("\t5 - copper")
-            code = "copper"
-            break
+    # Skip sentences with only a single NP -- S0→NP
+    if stree.match("S0 > [NP $]"):
+        print("\t7 - copper")
+        return "copper"
 
-        # Skip uncapitalized sentences
-        if text[0].islower():
-            print("\t6 - copper")
-            code = "copper"
-            break
+    # Skip sentences not containing a VP
+    if not stree.match("S0 >> VP"):
+        print("\t8 - heading")
+        return "heading"
+
+    # Skip sentences not ending in sentence ending punctuation
+    if text[-1] not in definitions.END_OF_SENTENCE:
+        print("\t9 - heading")
+        return "heading"
+
+    # Skip sentence if we have seen an equivalent sentence before
+    # hashnorm = hash(normalize(text))
+    # if hashnorm in BIGSET:
+    #    print("\t10 - copper")
+    #    return "copper"
+    # else:
+    #    BIGSET.add(hashnorm)
+    return None
+
+
+def sieve(record):
+    """Judge which sentences make sense for each subcorpora, updating
+    the bucket counts in BUCKDICT. This is done in the main process,
+    in the order of the exported records, so that the result doesn't
+    depend on how the export was divided between worker processes."""
+    code = "silver"  # Default value
+    while True:
 
-        # Skip sentences with only a single NP -- S0→NP
-        if stree.match("S0 > [NP $]"):
-            print("\t7 - copper")
-            code = "copper"
+        code = leavescheck(record["c"], record["words"])
+        if code == "copper":
+            print("\t1 - copper")
             break
 
-        # Skip sentences not containing a VP
-        if not stree.match("S0 >> VP"):
-            print("\t8 - heading")
-            code = "heading"
+        code = phrasecheck(record["i"])
+        if code == "copper":
+            print("\t2 - copper")
             break
 
-        # Skip sentences not ending in sentence ending punctuation
-        if text[-1] not in definitions.END_OF_SENTENCE:
-            print("\t9 - heading")
-            code = "heading"
+        if record["presieve"] is not None:
+            code = record["presieve"]
             break
-
-        # Skip sentence if we have seen an equivalent sentence before
-        # hashnorm = hash(normalize(text))
-        # if hashnorm in BIGSET:
-        #    print("\t10 - copper")
-        #    code = "copper"
-        #    break
-        # else:
-        #    BIGSET.add(hashnorm)
     print(code)
     return code
 
@@ -212,38 +227,84 @@ def normalize(text):
     text = text.replace(" ", "")
 
 
-def leavescheck(stree):
-    # Check if old info
+def leavescheck(cats, cnt):
+    # Check if old info, given the categories of the leaves
     # Check if at least 3 word, entity or person tokens
     # Add to BUCKDICT
     p = True
-    cnt = 0
-    for term in stree.leaves:
-        if "c" in term:
-            print(BUCKDICT[term["c"]])
-            if BUCKDICT[term["c"]] < 1000:
-                p = False
-            BUCKDICT[term["c"]] += 1
-        if "k" in term and term["k"] in ["WORD", "PERSON", "ENTITY"]:
-            cnt += 1
+    for cat in cats:
+        print(BUCKDICT[cat])
+        if BUCKDICT[cat] < 1000:
+            p = False
+        BUCKDICT[cat] += 1
     if p or cnt < 3:
         return "copper"
     return "silver"
 
 
-def phrasecheck(stree):
+def phrasecheck(phrases):
+    # Given the phrase categories of the nonterminals
     p = True
-    for term in stree.nonterminals:
-        if "i" in term:
-            print(BUCKDICT[term["i"]])
-            if BUCKDICT["i"] < 100:
-                p = False
-            BUCKDICT["i"] += 1
+    for phrase in phrases:
+        print(BUCKDICT[phrase])
+        if BUCKDICT["i"] < 100:
+            p = False
+        BUCKDICT["i"] += 1
     return p
 
 
-def main(num_sent, parse_date_gt, outfile, count, rand):
-
+def export_article(art, outfile, rand):
+    """Worker process function: return records with the Annotald trees
+    of the sentences of an article, along with what sieve() needs
+    to classify them"""
+    # Skip articles from certain websites
+    if not art.root_domain or "lemurinn" in art.root_domain:
+        return []
+    aid = art.uuid
+    aurl = art.url
+    try:
+        tree = Tree(url=art.url, authority=art.authority)
+        tree.load(art.tree)
+        trees = list(tree.simple_trees())
+    except Exception:
+        return []
+
+    records = []
+    for ix, stree in trees:
+        if rand:
+            if aid.endswith("9"):
+                continue
+            record = {"code": "random"}
+        else:
+            record = {
+                "presieve": presieve(stree),
+                "c": [term["c"] for term in stree.leaves if "c" in term],
+                "words": sum(
+                    1
+                    for term in stree.leaves
+                    if "k" in term and term["k"] in ["WORD", "PERSON", "ENTITY"]
+                ),
+                "i": [term["i"] for term in stree.nonterminals if "i" in term],
+            }
+        # Create Annotald tree
+        id_str = str(aid) + "." + str(ix)
+        meta_node = AnnoTree(
+            "META",
+            [
+                AnnoTree("ID-CORPUS", [id_str]),
+                AnnoTree("ID-LOCAL", [outfile]),
+                AnnoTree("URL", [aurl]),
+                AnnoTree("COMMENT", [""]),
+            ],
+        )
+        nltk_tree = simpleTree2NLTK(stree)
+        meta_tree = AnnoTree("", [meta_node, nltk_tree])
+        record["tree"] = str(meta_tree)
+        records.append(record)
+    return records
+
+
+def main(num_sent, parse_date_gt, outfile, count, rand, outdir, workers):
     try:
         # Read configuration file
         Settings.read(os.path.join(basepath, "config", "GreynirSimple.conf"))
@@ -251,96 +312,58 @@ def main(num_sent, parse_date_gt, outfile, count, rand):
         print("Configuration error: {0}".format(e))
         sys.exit(os.EX_CONFIG)
 
-    # Generate parse trees from visible roots only,
-    # in descending order by time of parse
+    # Generate parse trees from visible roots only, most recently
+    # parsed first within each shard
     criteria = {"order_by_parse": True, "visible": True}
     if parse_date_gt is not None:
         criteria["parse_date_gt"] = parse_date_gt
 
-    # Generator for articles
-    def gen():
-        yield from Article.articles(criteria)
+    # Export the sentence trees of all articles, in parallel, and
+    # classify them in the order of the export, stopping when we
+    # have enough
+    export = ShardedExport(
+        "gencorp",
+        outdir,
+        params={
+            "parse_date_gt": parse_date_gt,
+            "outfile": outfile,
+            "random": rand,
+            # Records are classified in the main process
+            "format": 2,
+        },
+    )
+    records = export.stream(
+        partial(export_article, outfile=outfile, rand=rand), criteria, workers
+    )
 
-    silvertotal = 0
     total = 0
-    arts = 0
-    for art in gen():
-        # Skip articles from certain websites
-        aid = art.uuid
-        aurl = art.url
-        if arts % 100 == 0:
-            print("{} articles done".format(arts))
-        arts += 1
-        if not art.root_domain or "lemurinn" in art.root_domain:
-            # print("\t1")
-            continue
-        trees = None
-        try:
-            tree = Tree(url=art.url, authority=art.authority)
-            tree.load(art.tree)
-
-        except Exception:
-            continue
-
-        try:
-            trees = tree.simple_trees()
-        except Exception:
-            continue
-
-        for ix, stree in trees:
-            score = tree.score(ix)
-            ln = tree.length(ix)
-            if rand:
-                code = "random"
-                print(aid)
-                if aid.endswith("9"):
-                    print("Fann grein!")
-                    continue
-            else:
-                code = sieve(ix, stree)
-            # Create Annotald tree
-            id_str = str(aid) + "." + str(ix)
-            meta_node = AnnoTree(
-                "META",
-                [
-                    AnnoTree("ID-CORPUS", [id_str]),
-                    AnnoTree("ID-LOCAL", [outfile]),
-                    AnnoTree("URL", [aurl]),
-                    AnnoTree("COMMENT", [""]),
-                ],
-            )
-            nltk_tree = simpleTree2NLTK(stree)
-            meta_tree = AnnoTree("", [meta_node, nltk_tree])
-
-            # Accumulate tree strings until we have enough
-            CUMUDICT[code].append(str(meta_tree) + SEPARATOR)
-            accnum = len(CUMUDICT[code])
-            final_batch = (accnum + total) >= num_sent
-            if len(CUMUDICT["silver"]) >= num_sent:
-                final_batch = True
-
-            # We have a batch
-            if accnum == MAX_BATCH or final_batch:
-                fh = open(code + ".txt", "a", encoding="utf-8")
-                # Shuffle and write to file
-                accumulated = CUMUDICT[code]
-                shuffle(accumulated)
-                for tree_str in accumulated:
-                    fh.write(tree_str)
-
-                total += accnum
-                CUMUDICT[code] = []
-                fh.close()
-                gc.collect()  # Trigger manual garbage collection
-
-                # print("Dumping sentence trees: %d\r" % total, end="")
-
-            if final_batch:
-                break
-
-            # print("Skipped {0}".format(skipped))
-            # fsize = os.path.getsize(outfile) / pow(1024.0, 2)
-            # print("\nDumped {0} trees to file '{1}' ({2:.1f} MB)".format(total, outfile, fsize))
+    for record in records:
+        code = record["code"] if rand else sieve(record)
+        # Accumulate tree strings until we have enough
+        CUMUDICT[code].append(record["tree"] + SEPARATOR)
+        accnum = len(CUMUDICT[code])
+        final_batch = (accnum + total) >= num_sent
+        if len(CUMUDICT["silver"]) >= num_sent:
+            final_batch = True
+
+        # We have a batch
+        if accnum == MAX_BATCH or final_batch:
+            fh = open(code + ".txt", "a", encoding="utf-8")
+            # Shuffle and write to file
+            accumulated = CUMUDICT[code]
+            shuffle(accumulated)
+            for tree_str in accumulated:
+                fh.write(tree_str)
+
+            total += accnum
+            CUMUDICT[code] = []
+            fh.close()
+            gc.collect()  # Trigger manual garbage collection
+
+        if final_batch:
+            break
+    # Stop the export if it is still in progress
+    records.close()
 
 
 if __name__ == "__main__":
@@ -373,7 +396,30 @@ if __name__ == "__main__":
     parser.add_argument(
         "-r", dest="RANDOM", action="store_true", help="Only collect random"
     )
+    parser.add_argument(
+        "--outdir",
+        dest="OUTDIR",
+        type=str,
+        help="Directory for the exported shards (default 'gencorp_shards')",
+        default="gencorp_shards",
+    )
+    parser.add_argument(
+        "-w",
+        "--workers",
+        dest="WORKERS",
+        type=int,
+        help="Number of worker processes (default: number of CPUs)",
+        default=os.cpu_count() or 1,
+    )
 
     args = parser.parse_args()
 
-    main(args.NUM_SENT, args.PARSE_DATE_GT, args.OUTFILE, args.COUNT, args.RANDOM)
+    main(
+        args.NUM_SENT,
+        args.PARSE_DATE_GT,
+        args.OUTFILE,
+        args.COUNT,
+        args.RANDOM,
+        args.OUTDIR,
+        args.WORKERS,
+    )
@@ -0,0 +1,319 @@
+#!/usr/bin/env python
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    Benchmark for the Icelandic street, address and placename lookups
+    made by the locations processor (processors/locations.py), comparing
+    the in-memory street index and lookup caches of geo.py with direct
+    queries to the iceaddr and cityloc databases.
+
+    The locations are read from the locations table, grouped by article
+    so that the placenames of each article are used as hints, as in the
+    processor. Alternatively, they can be read from a file with one
+    location per line, formatted as kind<TAB>name, where an empty line
+    separates articles.
+
+    With the -k option, the benchmark instead compares nearest-location
+    searches in a LocationIndex of the given number of random locations
+    in Iceland with calculating the distance to each of them, as the
+    query modules did before.
+
+    Usage: python tools/geobench.py [-n LIMIT] [-f FILE] [-k CANDIDATES]
+
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import os
+import sys
+import random
+import argparse
+from timeit import default_timer as timer
+
+# Hack to make this Python program executable from the tools subdirectory
+basepath, _ = os.path.split(os.path.realpath(__file__))
+_TOOLS = os.sep + "tools"
+if basepath.endswith(_TOOLS):
+    basepath = basepath[0 : -len(_TOOLS)]
+    sys.path.append(basepath)
+
+from iceaddr import iceaddr_lookup, placename_lookup
+
+import geo
+from geo import (
+    ICE_PLACENAME_BLACKLIST,
+    ICE_STREETNAME_BLACKLIST,
+    LatLonTuple,
+    LocationIndex,
+    coords_from_addr_info,
+    distance,
+    lookup_city_info,
+    parse_address_string,
+)
+
+
+# A list of articles, each a list of (name, kind) tuples
+LocationMix = List[List[Tuple[str, str]]]
+
+
+def mix_from_db(limit: int) -> LocationMix:
+    """Read the locations of the most recently processed articles"""
+    from db import SessionContext
+    from db.models import Location
+
+    articles: Dict[str, List[Tuple[str, str]]] = dict()
+    with SessionContext(read_only=True) as session:
+        q = (
+            session.query(Location.article_url, Location.name, Location.kind)
+            .order_by(Location.timestamp.desc())
+            .limit(limit)
+        )
+        for url, name, kind in q:
+            articles.setdefault(url or "", []).append((name, kind))
+    return list(articles.values())
+
+
+def mix_from_file(path: str) -> LocationMix:
+    """Read locations from a file with lines formatted as kind<TAB>name"""
+    mix: LocationMix = [[]]
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line.strip():
+                if mix[-1]:
+                    mix.append([])
+                continue
+            kind, _, name = line.partition("\t")
+            mix[-1].append((name.strip(), kind.strip()))
+    return [a for a in mix if a]
+
+
+def direct_street(name: str, hints: List[str]) -> Any:
+    """Street coordinates, looked up with iceaddr queries"""
+    addresses = iceaddr_lookup(name, limit=100)
+    if not addresses:
+        return None
+    places = set(a.get("stadur_nf") for a in addresses)
+    addr = None
+    if len(places) == 1:
+        addr = addresses[0]
+    else:
+        for pn in hints:
+            addresses = iceaddr_lookup(name, placename=pn)
+            places = set(a.get("stadur_nf") for a in addresses)
+            if len(places) == 1:
+                addr = addresses[0]
+                break
+    return coords_from_addr_info(addr)
+
+
+def direct_address(name: str, hints: List[str]) -> Any:
+    """Address info, looked up with iceaddr queries"""
+    addr = parse_address_string(name)
+    for pn in [None] + hints:
+        a = iceaddr_lookup(
+            addr["street"],
+            number=addr.get("number"),
+            letter=addr.get("letter"),
+            placename=pn,
+            limit=2,
+        )
+        if len(a) == 1:
+            return coords_from_addr_info(a[0])
+    return None
+
+
+def direct_placename(name: str, hints: List[str]) -> Any:
+    """Placename and city coordinates, looked up with database queries"""
+    info_list = placename_lookup(name)
+    pn = coords_from_addr_info(info_list[0]) if info_list else None
+    cities = lookup_city_info(name)
+    city = coords_from_addr_info(cities[0]) if cities else None  # type: ignore
+    return (bool(info_list), pn, city)
+
+
+def indexed_street(name: str, hints: List[str]) -> Any:
+    return geo.coords_for_street_name(name, placename_hints=hints)
+
+
+def indexed_address(name: str, hints: List[str]) -> Any:
+    return coords_from_addr_info(geo.icelandic_addr_info(name, placename_hints=hints))
+
+
+def indexed_placename(name: str, hints: List[str]) -> Any:
+    found, pn = geo._icelandic_placename(name)
+    city = geo._foreign_city(name)
+    return (found, pn, city[1] if city else None)
+
+
+LookupFunc = Callable[[str, List[str]], Any]
+
+_LOOKUPS: Dict[str, Tuple[LookupFunc, LookupFunc]] = {
+    "street": (direct_street, indexed_street),
+    "address": (direct_address, indexed_address),
+    "placename": (direct_placename, indexed_placename),
+}
+
+
+def run(mix: LocationMix, which: int) -> Tuple[Dict[str, float], List[Any]]:
+    """Run the lookups of the mix, returning the time taken per kind
+    of location and the results"""
+    times: Dict[str, float] = {kind: 0.0 for kind in _LOOKUPS}
+    results: List[Any] = []
+    for article in mix:
+        hints = [name for name, kind in article if kind == "placename"]
+        for name, kind in article:
+            if kind not in _LOOKUPS:
+                continue
+            if kind == "street" and name in ICE_STREETNAME_BLACKLIST:
+                continue
+            if kind == "placename" and name in ICE_PLACENAME_BLACKLIST:
+                continue
+            func = _LOOKUPS[kind][which]
+            t0 = timer()
+            results.append(func(name, hints))
+            times[kind] += timer() - t0
+    return times, results
+
+
+def main(limit: int, path: Optional[str]) -> None:
+    mix = mix_from_file(path) if path else mix_from_db(limit)
+    counts: Dict[str, int] = dict()
+    for article in mix:
+        for _, kind in article:
+            counts[kind] = counts.get(kind, 0) + 1
+    print(
+        "{0} articles, {1} locations ({2})".format(
+            len(mix),
+            sum(counts.values()),
+            ", ".join(f"{k} {v}" for k, v in sorted(counts.items())),
+        )
+    )
+
+    t0 = timer()
+    geo.street_index()
+    print(f"Street index loaded in {timer() - t0:.2f} seconds")
+
+    direct, direct_results = run(mix, 0)
+    first, indexed_results = run(mix, 1)
+    # With the placename and city lookups cached
+    second, _ = run(mix, 1)
+
+    print(f"{'':12}{'direct':>10}{'indexed':>10}{'cached':>10}{'speedup':>10}")
+    for kind in _LOOKUPS:
+        speedup = direct[kind] / second[kind] if second[kind] else 0.0
+        print(
+            f"{kind:12}{direct[kind]:10.3f}{first[kind]:10.3f}"
+            f"{second[kind]:10.3f}{speedup:9.1f}x"
+        )
+    total_direct = sum(direct.values())
+    total_cached = sum(second.values())
+    n = max(1, len(mix))
+    print(
+        "Per article: {0:.2f} ms direct, {1:.2f} ms indexed and cached".format(
+            1000 * total_direct / n, 1000 * total_cached / n
+        )
+    )
+    diff = sum(1 for a, b in zip(direct_results, indexed_results) if a != b)
+    print(f"{diff} of {len(direct_results)} results differ")
+
+
+def _random_location(rnd: random.Random) -> LatLonTuple:
+    """Return a random location within a box around Iceland"""
+    return (rnd.uniform(63.3, 66.6), rnd.uniform(-24.5, -13.5))
+
+
+def nearest(candidates: int, queries: int = 1000) -> None:
+    """Compare nearest-location searches with and without an index"""
+    rnd = random.Random(4711)
+    points = [_random_location(rnd) for _ in range(candidates)]
+    locs = [_random_location(rnd) for _ in range(queries)]
+
+    t0 = timer()
+    index = LocationIndex((p, ix) for ix, p in enumerate(points))
+    print(f"Index of {candidates} locations built in {timer() - t0:.3f} seconds")
+
+    def scan_nearest(loc: LatLonTuple, n: int) -> List[int]:
+        dist = sorted((distance(loc, p), ix) for ix, p in enumerate(points))
+        return [ix for _, ix in dist[0:n]]
+
+    def scan_within(loc: LatLonTuple, km: float) -> List[int]:
+        dist = [(distance(loc, p), ix) for ix, p in enumerate(points)]
+        return [ix for d, ix in sorted(dist) if d <= km]
+
+    searches: List[Tuple[str, Callable[[LatLonTuple], List[int]], LookupFunc]] = [
+        (
+            "nearest 1",
+            lambda loc: scan_nearest(loc, 1),
+            lambda loc, _: [ix for _, ix in index.nearest(loc)],
+        ),
+        (
+            "nearest 10",
+            lambda loc: scan_nearest(loc, 10),
+            lambda loc, _: [ix for _, ix in index.nearest(loc, 10)],
+        ),
+        (
+            "within 5 km",
+            lambda loc: scan_within(loc, 5.0),
+            lambda loc, _: [ix for _, ix in index.within(loc, 5.0)],
+        ),
+    ]
+    print(f"{'':12}{'scan ms':>10}{'index ms':>10}{'speedup':>10}")
+    for name, scan, indexed in searches:
+        t0 = timer()
+        expected = [scan(loc) for loc in locs]
+        t_scan = timer() - t0
+        t0 = timer()
+        found = [indexed(loc, []) for loc in locs]
+        t_index = timer() - t0
+        diff = sum(1 for a, b in zip(expected, found) if a != b)
+        print(
+            f"{name:12}{1000 * t_scan / queries:10.3f}"
+            f"{1000 * t_index / queries:10.3f}{t_scan / t_index:9.1f}x"
+            + (f"  ({diff} results differ)" if diff else "")
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Benchmark geo lookups over the locations processor's mix"
+    )
+    parser.add_argument(
+        "-n",
+        "--limit",
+        type=int,
+        default=20000,
+        help="number of locations to read from the database",
+    )
+    parser.add_argument(
+        "-f", "--file", default=None, help="read locations from a file instead"
+    )
+    parser.add_argument(
+        "-k",
+        "--nearest",
+        type=int,
+        default=0,
+        metavar="CANDIDATES",
+        help="benchmark nearest-location searches among random candidates",
+    )
+    args = parser.parse_args()
+    if args.nearest:
+        nearest(args.nearest)
+    else:
+        main(args.limit, args.file)
@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    Benchmark for the dispatch of parsed queries to tree processors,
+    using the queries found in tests/test_queries.py.
+
+    The queries are parsed first. Then the time spent selecting the
+    tree processors for each query tree and entering the BÍN context is
+    measured, both for a linear scan of all tree processors (entering
+    the context once per interested processor) and for the nonterminal
+    index built by Query.init_class(). The processors themselves are
+    not invoked, since many of them call external services.
+
+    Usage: python tools/querybench.py [-n ROUNDS]
+
+"""
+
+from typing import List, Set
+
+import os
+import sys
+import ast
+from timeit import default_timer as timer
+
+# Hack to make this Python program executable from the tools subdirectory
+basepath, _ = os.path.split(os.path.realpath(__file__))
+_TOOLS = os.sep + "tools"
+if basepath.endswith(_TOOLS):
+    basepath = basepath[0 : -len(_TOOLS)]
+    sys.path.append(basepath)
+
+# Importing the main module reads the configuration
+# and sets up the Flask application context
+from main import app  # noqa
+
+from reynir.bindb import GreynirBin  # noqa
+
+from db import SessionContext  # noqa
+from queries import Query, QueryTree  # noqa
+
+
+def test_queries() -> List[str]:
+    """Collect the query strings ("q" fields) in tests/test_queries.py"""
+    path = os.path.join(basepath, "tests", "test_queries.py")
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    queries: List[str] = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Dict):
+            continue
+        for k, v in zip(node.keys, node.values):
+            if (
+                isinstance(k, ast.Constant)
+                and k.value == "q"
+                and isinstance(v, ast.Constant)
+                and isinstance(v.value, str)
+            ):
+                queries.append(v.value)
+    return queries
+
+
+def dispatch_linear(tree: QueryTree) -> int:
+    """Select the processors for a tree by scanning all of them,
+    as in the previous implementation of Query.execute_from_tree()"""
+    n = 0
+    for processor in Query._tree_processors:
+        # The set of query nonterminals was computed once per processor
+        nonterminals = set(node.string_self() for node in tree.query_trees)
+        if nonterminals.isdisjoint(processor.get("QUERY_NONTERMINALS", set())):
+            continue
+        with GreynirBin.get_db():
+            n += 1
+    return n
+
+
+def dispatch_indexed(tree: QueryTree) -> int:
+    """Select the processors for a tree using the nonterminal index"""
+    processors = Query.tree_processors_for(tree.query_nonterminals)
+    if processors:
+        with GreynirBin.get_db():
+            pass
+    return len(processors)
+
+
+def main(rounds: int) -> None:
+    queries = test_queries()
+    print(f"{len(queries)} queries from tests/test_queries.py")
+
+    Query.init_class()
+    print(
+        f"{len(Query._tree_processors)} tree processors, "
+        f"{len(Query._tree_processor_index)} query nonterminals"
+    )
+
+    trees: List[QueryTree] = []
+    t0 = timer()
+    with SessionContext(commit=False, read_only=True) as session:
+        for qs in queries:
+            q = Query(
+                session,
+                qs,
+                voice=False,
+                auto_uppercase=True,
+                location=None,
+                client_id=None,
+                client_type=None,
+                client_version=None,
+            )
+            if q.parse(dict()):
+                tree = q._tree
+                assert tree is not None
+                trees.append(tree)
+    print(f"{len(trees)} queries parsed in {timer() - t0:.2f}s")
+
+    candidates: Set[int] = set()
+    for label, dispatch in (("Linear", dispatch_linear), ("Indexed", dispatch_indexed)):
+        best = float("inf")
+        for _ in range(rounds):
+            t0 = timer()
+            total = sum(dispatch(tree) for tree in trees)
+            best = min(best, timer() - t0)
+        candidates.add(total)
+        print(
+            f"{label:<8} dispatch: {best * 1000.0:8.3f} ms in total, "
+            f"{best / max(1, len(trees)) * 1e6:8.2f} µs per query"
+        )
+    # Both methods must select the same processors
+    assert len(candidates) == 1
+    print(f"{candidates.pop() / max(1, len(trees)):.2f} candidate processors per query")
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark the dispatch of parsed queries to tree processors"
+    )
+    parser.add_argument(
+        "-n", "--rounds", type=int, default=10, help="number of timing rounds"
+    )
+    args = parser.parse_args()
+    main(args.rounds)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    Benchmark for generic speech transcription (DefaultTranscriber.generic),
+    using the input texts found in tests/test_speech.py.
+
+    Usage: python tools/speechbench.py [-n ROUNDS]
+
+"""
+
+from typing import List
+
+import os
+import sys
+import ast
+from timeit import default_timer as timer
+
+# Hack to make this Python program executable from the tools subdirectory
+basepath, _ = os.path.split(os.path.realpath(__file__))
+_TOOLS = os.sep + "tools"
+if basepath.endswith(_TOOLS):
+    basepath = basepath[0 : -len(_TOOLS)]
+    sys.path.append(basepath)
+
+from speech.trans import DefaultTranscriber as DT, _SENTENCE_CACHE
+
+
+def test_inputs() -> List[str]:
+    """Collect the texts passed to DT.generic() in tests/test_speech.py"""
+    path = os.path.join(basepath, "tests", "test_speech.py")
+    with open(path, "r", encoding="utf-8") as f:
+        tree = ast.parse(f.read())
+    texts: List[str] = []
+    for node in ast.walk(tree):
+        if not isinstance(node, ast.Call) or not node.args:
+            continue
+        func = node.func
+        name = func.attr if isinstance(func, ast.Attribute) else getattr(func, "id", "")
+        arg = node.args[0]
+        if name in ("generic", "ws_to_space") and isinstance(arg, ast.Constant):
+            if isinstance(arg.value, str) and arg.value.strip():
+                texts.append(" ".join(arg.value.split()))
+    return texts
+
+
+def run(texts: List[str], clear: bool) -> float:
+    """Transcribe all texts, optionally clearing the sentence cache
+    before each call (to emulate transcription without caching)"""
+    t0 = timer()
+    for t in texts:
+        if clear:
+            _SENTENCE_CACHE.clear()
+        DT.generic(t, full_text=True)
+    return timer() - t0
+
+
+def main(rounds: int) -> None:
+    texts = test_inputs()
+    # The same sentences, in longer texts (as in news readouts)
+    long_texts = [" ".join(texts[i:] + texts[:i]) for i in range(0, len(texts), 5)]
+    print(f"{len(texts)} inputs from tests/test_speech.py")
+
+    # Warm up the parser and BÍN before measuring
+    DT.generic(texts[0])
+
+    for label, tt in (("Short texts", texts), ("Long texts", long_texts)):
+        uncached = min(run(tt, clear=True) for _ in range(rounds))
+        _SENTENCE_CACHE.clear()
+        cold = run(tt, clear=False)
+        warm = min(run(tt, clear=False) for _ in range(rounds))
+        print(
+            f"{label:<12} no cache: {uncached:7.3f}s   "
+            f"cold cache: {cold:7.3f}s   "
+            f"warm cache: {warm:7.3f}s"
+        )
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark generic speech transcription"
+    )
+    parser.add_argument(
+        "-n", "--rounds", type=int, default=3, help="number of timing rounds"
+    )
+    args = parser.parse_args()
+    main(args.rounds)
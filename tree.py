@@ -55,7 +55,7 @@ import json
 import re
 
 import abc
-from contextlib import contextmanager
+from contextlib import contextmanager, nullcontext
 from islenska.basics import BinMeaning, make_bin_entry
 
 from sqlalchemy.orm import Session
@@ -84,6 +84,7 @@ class TreeStateDict(TypedDict, total=False):
     authority: float
     index: int
     locations: Set[Loc]  # A bit of a kludge; only used by the locations module
+    tree: "TreeBase"  # The tree being processed
     _sentence: Optional["SentenceFunction"]
     _visit: Optional["VisitFunction"]
     _default: Optional["NonterminalFunction"]
@@ -1404,12 +1405,18 @@ class TreeBase:
         nt_map: Optional[NonterminalMap] = None,
         id_map: Optional[IdMap] = None,
         terminal_map: Optional[Mapping[str, str]] = None,
+        indices: Optional[Iterable[int]] = None,
     ) -> Iterator[Tuple[int, SimpleTree]]:
-        """Generate simple trees out of the sentences in this tree"""
+        """Generate simple trees out of the sentences in this tree,
+        optionally only those with the given indices"""
         # Hack to allow nodes to access the BIN database
         with GreynirBin.get_db() as bin_db:
             state = dict(bin_db=bin_db)
-            for ix, sent in self.s.items():
+            if indices is None:
+                sents = self.s.items()
+            else:
+                sents = ((ix, self.s.get(ix)) for ix in sorted(indices))
+            for ix, sent in sents:
                 if sent is not None:
                     builder = SimpleTreeBuilder(nt_map, id_map, terminal_map)
                     builder.state = state
@@ -1611,10 +1618,17 @@ class Tree(TreeBase):
 
     @contextmanager
     def context(
-        self, session: Session, processor: Union[ProcEnv, ModuleType], **kwargs: Any
+        self,
+        session: Session,
+        processor: Union[ProcEnv, ModuleType],
+        *,
+        bin_db: Optional[GreynirBin] = None,
+        **kwargs: Any,
     ) -> Iterator[TreeStateDict]:
         """Context manager for tree processing, setting up the environment
-        and encapsulating the sentence tree processing"""
+        and encapsulating the sentence tree processing. An already open
+        BÍN instance can be passed in bin_db, for processing a tree with
+        several processors in turn."""
 
         if isinstance(processor, ModuleType):
             processor = cast(ProcEnv, vars(processor))
@@ -1628,7 +1642,9 @@ class Tree(TreeBase):
         # If no handler exists for a nonterminal, call default() instead
         default = cast(Optional[NonterminalFunction], processor.get("default", None))
 
-        with GreynirBin.get_db() as bin_db:
+        # Enter the BÍN context, unless the caller has already done so
+        bin_ctx = GreynirBin.get_db() if bin_db is None else nullcontext(bin_db)
+        with bin_ctx as bin_db:
 
             state: TreeStateDict = {
                 "session": session,
@@ -1637,6 +1653,7 @@ class Tree(TreeBase):
                 "url": self.url,
                 "authority": self.authority,
                 "index": 0,
+                "tree": self,
                 "_sentence": sentence,
                 "_visit": visit,
                 "_default": default,
@@ -0,0 +1,172 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Tree label index
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module maps sentence trees and tree matching patterns
+    (see reynir/matcher.py) to sets of node labels. The labels of each
+    sentence are stored in the treelabels table by the treelabels
+    processor, as an inverted index from label to (article, sentence).
+
+    A sentence can only match a pattern if it has all the labels
+    required by the pattern, so intersecting the index postings of
+    those labels yields a (usually small) set of candidate sentences
+    which need to be loaded and matched.
+
+    Labels have the following forms:
+
+    `n:NP`, `n:NP-POSS`: nonterminal, including each tag prefix
+    `t:no`: terminal category ('p' for punctuation)
+    `l:maður`: terminal lemma
+
+    The label ANY_SENTENCE is stored for every indexed article,
+    with all of its parsed sentences. Articles that lack it have
+    not been indexed (or have been reparsed since they were indexed).
+
+"""
+
+from typing import Dict, Iterable, List, Optional, Set, Tuple, Union, cast
+
+import re
+from itertools import chain
+
+from sqlalchemy.orm import Session
+
+from reynir.simpletree import SimpleTree
+
+# Note: _CompiledPattern is internal to reynir, but it allows us to
+# reuse (and cache) the pattern parse done by the matcher itself
+from reynir.matcher import _CompiledPattern, _NestedList  # type: ignore
+
+from db.models import TreeLabel
+
+
+# Label stored for every indexed article, listing all its parsed sentences
+ANY_SENTENCE = "*"
+
+# Labels longer than this are neither indexed nor required
+MAX_LABEL_LEN = TreeLabel.MAX_LABEL_LEN
+
+_TAG_SPLIT_RE = re.compile(r"[_\-]")
+
+# Pattern items that don't correspond to node labels
+_OPERATORS = frozenset((">", "*", "+", "?", "$", "|"))
+_OPTIONAL = frozenset(("*", "?"))
+
+PatternItem = Union[str, _NestedList]
+
+
+def _label(prefix: str, s: str) -> Optional[str]:
+    """Return a label, or None if it is too long to be indexed"""
+    label = prefix + s
+    return label if len(label) <= MAX_LABEL_LEN else None
+
+
+def tree_labels(tree: SimpleTree) -> Set[str]:
+    """Return the set of labels of all nodes in a sentence tree"""
+    labels: Set[str] = set()
+    add = labels.add
+    for node in chain([tree], tree.descendants):
+        if node.is_terminal:
+            tcat = "p" if node.kind == "PUNCTUATION" else node.tcat
+            add("t:" + tcat)
+            lemma = node.lemma
+            if lemma and len(lemma) + 2 <= MAX_LABEL_LEN:
+                add("l:" + lemma)
+        else:
+            tag = node.tag
+            if not tag:
+                continue
+            parts = tag.split("-")
+            for i in range(1, len(parts) + 1):
+                add("n:" + "-".join(parts[0:i]))
+    return {label for label in labels if len(label) <= MAX_LABEL_LEN}
+
+
+def _item_labels(item: PatternItem) -> Set[str]:
+    """Return the labels required by a single pattern item"""
+    if isinstance(item, _NestedList):
+        if item.kind == "(":
+            # Alternatives: only labels required by all of them are required
+            alternatives = [
+                _sequence_labels(cast(List[PatternItem], alt))
+                if isinstance(alt, _NestedList) and alt.kind == "|"
+                else _item_labels(alt)
+                for alt in item
+            ]
+            return set.intersection(*alternatives) if alternatives else set()
+        # Set or list argument of a containment operator
+        return _sequence_labels(cast(List[PatternItem], item))
+    if not item or item in _OPERATORS or item == "." or item[0] in '%"@':
+        # Operators, wildcards, macros, literal text and items that
+        # match terminals only (@"literal" and @'lemma') don't require
+        # any particular label
+        return set()
+    if item.startswith("'"):
+        lemma = item[1:-1]
+        if " " in lemma:
+            # May span several terminals, or be a single multi-word token
+            return set()
+        label = _label("l:", lemma)
+    elif item[0].isupper():
+        label = _label("n:", "-".join(_TAG_SPLIT_RE.split(item)))
+    else:
+        label = _label("t:", item.split("_")[0])
+    return {label} if label else set()
+
+
+def _sequence_labels(items: List[PatternItem]) -> Set[str]:
+    """Return the labels required by a sequence or set of pattern items.
+    Items followed by the * or ? repeat operators are optional."""
+    labels: Set[str] = set()
+    for i, item in enumerate(items):
+        nxt = items[i + 1] if i + 1 < len(items) else None
+        if isinstance(nxt, str) and nxt in _OPTIONAL:
+            continue
+        labels |= _item_labels(item)
+    return labels
+
+
+def pattern_labels(pattern: str) -> Set[str]:
+    """Return the set of labels that any tree matching the
+    given pattern must contain. The set may be empty, in which
+    case the index can't be used to find candidate sentences."""
+    items = _CompiledPattern.compile(pattern).items
+    return _sequence_labels(items)
+
+
+def store_labels(
+    session: Session, article_id: str, trees: Iterable[Tuple[int, SimpleTree]]
+) -> None:
+    """Store the label index for the sentence trees of an article,
+    replacing any previously stored index for the article"""
+    delete_labels(session, article_id)
+    postings: Dict[str, List[int]] = {ANY_SENTENCE: []}
+    for ix, tree in trees:
+        postings[ANY_SENTENCE].append(ix)
+        for label in tree_labels(tree):
+            postings.setdefault(label, []).append(ix)
+    for label, sentences in postings.items():
+        session.add(TreeLabel(article_id=article_id, label=label, sentences=sentences))
+
+
+def delete_labels(session: Session, article_id: str) -> None:
+    """Delete the label index of an article"""
+    tl = TreeLabel.table()
+    session.execute(tl.delete().where(TreeLabel.article_id == article_id))
@@ -0,0 +1,187 @@
+"""
+
+    Greynir: Natural language processing for Icelandic
+
+    Copyright (C) 2023 Miðeind ehf.
+
+       This program is free software: you can redistribute it and/or modify
+       it under the terms of the GNU General Public License as published by
+       the Free Software Foundation, either version 3 of the License, or
+       (at your option) any later version.
+       This program is distributed in the hope that it will be useful,
+       but WITHOUT ANY WARRANTY; without even the implied warranty of
+       MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+       GNU General Public License for more details.
+
+    You should have received a copy of the GNU General Public License
+    along with this program.  If not, see http://www.gnu.org/licenses/.
+
+
+    This module warms up the web application by loading the data that
+    would otherwise be loaded lazily on the first request: the main
+    grammar and article parser, BÍN, the tokenizer's phrase and name
+    data, the TnT tagger model, the query processor modules along
+    with the query grammar and parser, and the street address index
+    used for geographic lookups.
+
+    When Greynir runs under Gunicorn with preload_app enabled (see
+    config/gunicorn_config.py), the warm-up happens once in the master
+    process before the workers are forked. The workers then share the
+    loaded data copy-on-write. After warming up, gc.freeze() moves all
+    existing objects into the garbage collector's permanent generation,
+    so that collections in the workers don't write to (and thereby
+    copy) the shared pages.
+
+"""
+
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import gc
+import os
+import time
+import logging
+
+from reynir.bindb import GreynirBin
+from reynir.bintokenizer import tokenize
+
+from article import Article
+from tnttagger import ifd_tag
+from geo import street_index
+from queries import Query
+
+
+# Sample text that touches the tokenizer's phrase and name data
+_SAMPLE_TEXT = "Jón Jónsson fór til Reykjavíkur 1. janúar 2020 ásamt Guðrúnu."
+
+# Has the warm-up completed?
+_READY = False
+# Report of the last warm-up, served by the readiness endpoint
+_REPORT: Dict[str, Any] = {}
+
+
+def memory_usage(pid: Optional[int] = None) -> Dict[str, int]:
+    """Return the memory usage of a process (by default the current one),
+    in kilobytes. On Linux, 'rss' is the resident set size, 'shared' the
+    part of it that is shared with other processes (such as the
+    Gunicorn master and the other workers) and 'pss' the proportional
+    set size, i.e. the process' fair share of the resident memory."""
+    path = "/proc/{0}/smaps_rollup".format(pid or "self")
+    fields = {"Rss": "rss", "Pss": "pss"}
+    result: Dict[str, int] = dict()
+    try:
+        with open(path, "r") as f:
+            for line in f:
+                name, _, value = line.partition(":")
+                if name in ("Shared_Clean", "Shared_Dirty"):
+                    result["shared"] = result.get("shared", 0) + int(value.split()[0])
+                elif name in fields:
+                    result[fields[name]] = int(value.split()[0])
+    except (OSError, ValueError):
+        # Not on Linux: fall back to the peak resident set size
+        # of the current process
+        if pid is None:
+            import resource
+
+            result["rss"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return result
+
+
+def _warm_parser() -> None:
+    Article.get_parser()
+
+
+def _warm_bin() -> None:
+    GreynirBin.get_db().lookup("hestur")
+
+
+def _warm_tokenizer() -> None:
+    for _ in tokenize(_SAMPLE_TEXT):
+        pass
+
+
+def _warm_tagger() -> None:
+    ifd_tag(_SAMPLE_TEXT)
+
+
+def _warm_queries() -> None:
+    if Query._parser is None:
+        Query.init_class()
+
+
+def _warm_geo() -> None:
+    street_index()
+
+
+_STEPS: List[Tuple[str, Callable[[], None]]] = [
+    ("parser", _warm_parser),
+    ("bin", _warm_bin),
+    ("tokenizer", _warm_tokenizer),
+    ("tagger", _warm_tagger),
+    ("queries", _warm_queries),
+    ("geo", _warm_geo),
+]
+
+
+def warm_up() -> Dict[str, Any]:
+    """Load everything that is otherwise loaded on the first request,
+    then freeze the garbage collector. Returns a report of the time
+    taken by each step and the memory usage before and after."""
+    global _READY, _REPORT
+    t0 = time.time()
+    before = memory_usage()
+    timings: Dict[str, float] = dict()
+    errors: Dict[str, str] = dict()
+    for name, step in _STEPS:
+        ts = time.time()
+        try:
+            step()
+        except Exception as e:
+            # A failed step is retried lazily when first needed
+            logging.error(f"Warm-up step '{name}' failed: {e}")
+            errors[name] = str(e)
+        timings[name] = round(time.time() - ts, 3)
+    # Collect garbage once, then exempt all surviving objects
+    # from future collections
+    gc.collect()
+    gc.freeze()
+    after = memory_usage()
+    _REPORT = dict(
+        pid=os.getpid(),
+        seconds=round(time.time() - t0, 3),
+        steps=timings,
+        errors=errors,
+        frozen=gc.get_freeze_count(),
+        memory_before=before,
+        memory_after=after,
+    )
+    _READY = True
+    logging.info(
+        "Warm-up completed in {0:.2f} sec ({1}); RSS {2} -> {3} kB".format(
+            _REPORT["seconds"],
+            ", ".join(f"{k} {v:.2f}s" for k, v in timings.items()),
+            before.get("rss", 0),
+            after.get("rss", 0),
+        )
+    )
+    return _REPORT
+
+
+def skip_warm_up() -> None:
+    """Mark the warm-up as not applicable, as when running the Flask
+    development server, where data is loaded lazily on the first
+    request. The process is then reported as ready."""
+    global _READY, _REPORT
+    _REPORT = dict(pid=os.getpid(), skipped=True)
+    _READY = True
+
+
+def is_ready() -> bool:
+    """Return True if the warm-up has completed in this process
+    or, under Gunicorn with preload_app, in the master process"""
+    return _READY
+
+
+def report() -> Dict[str, Any]:
+    """Return the warm-up report, along with the
+    current memory usage of this process"""
+    return dict(_REPORT, ready=_READY, pid=os.getpid(), memory=memory_usage())